@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the graph algorithms (TPGraphlib) and of the ontology queries (GeneOntology)
+
+Synthetic graphs are generated from a seed, so that every run measures the same graphs: random DAGs (edges from lower to
+higher numbered nodes) and random weighted directed graphs, at the sizes given on the command line. The real ontology and
+annotation files are benchmarked as well when they are present (go.obo and the GOA file given with --goa).
+
+Each case is run --repeat times (min and median times are recorded), then once more under tracemalloc for its peak memory.
+The results are written as JSON together with the commit, the library versions and the parameters, and --compare reports
+the cases that got slower (or use more memory) than in a previous results file, with a non-zero exit status.
+
+	python3 GOBenchmark.py --sizes 1000 10000 --goa 17.D_melanogaster.goa -o bench.json
+	python3 GOBenchmark.py --sizes 1000 10000 --goa 17.D_melanogaster.goa --compare bench.json
+"""
+
+import GeneOntology as GO
+import TPGraphlib as gr
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+
+FORMAT = 1 # version of the results file
+FW_MAX = 1000 # largest synthetic graph given to floyd_warshall (n x n matrices)
+
+
+def random_dag(n, degree=3, seed=0, weighted=False):
+	"""
+	random DAG over the nodes n0 .. n<n-1> with about n * degree edges, each going from a lower to a higher numbered node
+	weighted: edges get an integer weight between 1 and 9
+	"""
+	rng = np.random.default_rng(seed)
+	u = rng.integers(0, n, n * degree)
+	v = rng.integers(0, n, n * degree)
+	keep = u != v
+	return _graph(n, np.minimum(u, v)[keep], np.maximum(u, v)[keep], rng.integers(1, 10, keep.sum()) if weighted else None)
+
+def random_graph(n, degree=3, seed=0, weighted=True):
+	"""
+	random directed graph (with cycles) over the nodes n0 .. n<n-1> with about n * degree edges, weighted between 1 and 9
+	"""
+	rng = np.random.default_rng(seed)
+	u = rng.integers(0, n, n * degree)
+	v = rng.integers(0, n, n * degree)
+	return _graph(n, u, v, rng.integers(1, 10, n * degree) if weighted else None)
+
+def _graph(n, u, v, weights):
+	"""
+	graph over the nodes n0 .. n<n-1> (all of them, with or without edges) with the edges u[k] -> v[k]
+	"""
+	g = gr.create_graph(directed=True, weighted=weights is not None)
+	names = [ 'n%d' % i for i in range(n) ]
+	for name in names: gr.add_node(g, name)
+	if weights is None:
+		attributes = [ {} for k in range(len(u)) ]
+	else:
+		attributes = [ { 'weight': w } for w in weights.tolist() ]
+		g['weight_attribute'] = 'weight'
+	gr._add_edges(g, [ names[i] for i in u.tolist() ], [ names[i] for i in v.tolist() ], attributes)
+	return g
+
+def write_TAB(g, filename):
+	"""
+	writes g in the format read by TPGraphlib.load_TAB
+	"""
+	with open(filename, 'w') as f:
+		f.write('source\ttarget\tweight\n')
+		for u, edges in g['edges'].items():
+			for v, attributes in edges.items():
+				f.write('%s\t%s\t%s\n' % (u, v, gr.edge_weight(g, attributes)))
+
+
+def graph_cases(sizes, degree=3, seed=0, fw_max=FW_MAX):
+	"""
+	generates the synthetic cases (name, parameters, function to time); graphs are built before their cases are timed
+	adjacency_csr is timed with a cold cache (see _cold), BFS and DFS with both a cold and a warm one (parameter 'cache')
+	"""
+	for n in sizes:
+		dag = random_dag(n, degree, seed)
+		wg = random_graph(n, degree, seed, weighted=True)
+		s = gr.node_names(dag)[0]
+		for name, g in (('dag', dag), ('weighted', wg)):
+			params = { 'graph': name, 'nodes': g['nb_nodes'], 'edges': g['nb_edges'], 'degree': degree, 'seed': seed }
+			cold, warm = dict(params, cache='cold'), dict(params, cache='warm')
+			yield 'adjacency_csr', cold, lambda g=g: gr.adjacency_csr(_cold(g))
+			yield 'BFS', cold, lambda g=g: gr.BFS(_cold(g), s)
+			yield 'DFS', cold, lambda g=g: gr.DFS(_cold(g))
+			csr = gr.adjacency_csr(g) # cached in g for the warm cases
+			yield 'BFS', warm, lambda g=g: gr.BFS(g, s)
+			yield 'DFS', warm, lambda g=g: gr.DFS(g)
+			yield 'bfs', params, lambda g=g, csr=csr: gr.bfs(g, s, csr)
+			yield 'dfs', params, lambda g=g, csr=csr: gr.dfs(g, csr)
+			yield 'strongly_connected_components', params, lambda g=g, csr=csr: gr.strongly_connected_components(g, csr)
+		params = { 'graph': 'weighted', 'nodes': wg['nb_nodes'], 'edges': wg['nb_edges'], 'degree': degree, 'seed': seed }
+		csr = gr.adjacency_csr(wg)
+		yield 'bellman_ford', params, lambda: gr.bellman_ford(wg, s)
+		yield 'bellman_ford_spfa', params, lambda: gr.bellman_ford_csr(wg, s, spfa=True, csr=csr)
+		yield 'dijkstra', params, lambda: gr.dijkstra(wg, s, csr)
+		if n <= fw_max:
+			yield 'floyd_warshall', params, lambda: gr.floyd_warshall(wg)
+		with tempfile.TemporaryDirectory() as tmp:
+			filename = os.path.join(tmp, 'graph.tab')
+			write_TAB(wg, filename)
+			yield 'load_TAB', params, lambda: gr.load_TAB(filename)
+			yield 'load_TAB_compact', params, lambda: gr.load_TAB(filename, compact=True)
+
+def ontology_cases(obo, goa=None, sample=100, seed=0):
+	"""
+	generates the cases over the real ontology obo and annotation file goa (name, parameters, function to time)
+	GOTerms, GeneProducts and recherche_max are timed over sample gene products, terms and roots drawn with seed
+	"""
+	params = { 'obo': os.path.basename(obo) }
+	yield 'load_ontology', params, lambda: GO.load_ontology(obo)
+	onto = GO.freeze_ontology(GO.load_ontology(obo))
+	params = dict(params, terms=onto['nb_terms'], edges=onto['nb_edges'])
+	yield 'topological_order', params, lambda: GO.topological_order(_without(onto, 'topo'))
+	yield 'ancestor_closure', params, lambda: GO.ancestor_closure(_without(onto, 'ancestors', 'ancestors_ptr'))
+	yield 'load_OBO', params, lambda: GO.load_OBO(obo, onto)
+	goinv = GO.load_OBOMD(obo, onto)
+	roots = [ onto['ids'][i] for i in np.flatnonzero(np.diff(onto['parents_ptr']) == 0).tolist() ]
+	yield 'recherche_max', dict(params, sample=len(roots)), lambda: [ GO.recherche_max(goinv, r) for r in roots ]
+	if goa is None: return
+	params = dict(params, goa=os.path.basename(goa))
+	yield 'load_annotations', params, lambda: GO.load_annotations(onto, goa)
+	annot = GO.load_annotations(onto, goa)
+	yield 'ordered_implicit_gene_products', params, lambda: GO.ordered_implicit_gene_products(onto, annot)
+	go = GO.load_OBO(obo, onto)
+	GO.load_GOA(go, goa)
+	rng = np.random.default_rng(seed)
+	gps = [ annot['gp_ids'][k] for k in rng.choice(annot['nb_gp'], min(sample, annot['nb_gp']), replace=False).tolist() ]
+	terms = [ onto['ids'][i] for i in rng.choice(onto['nb_terms'], min(sample, onto['nb_terms']), replace=False).tolist() ]
+	params = dict(params, gene_products=annot['nb_gp'], sample=len(gps))
+	yield 'GOTerms', params, lambda: [ GO.GOTerms(go, gp, {}, all=True) for gp in gps ]
+	yield 'GOTerms_direct', params, lambda: [ GO.GOTerms(go, gp, {}, all=False) for gp in gps ]
+	yield 'GeneProducts', params, lambda: [ GO.GeneProducts(go, t, {}, all=True) for t in terms ]
+	yield 'GeneProducts_direct', params, lambda: [ GO.GeneProducts(go, t, {}, all=False) for t in terms ]
+
+
+def _cold(g):
+	"""
+	g without its cached node order and adjacency (see TPGraphlib.adjacency_csr), so that they are computed again
+	"""
+	g['_node_order'] = g['_csr'] = None
+	return g
+
+def _without(onto, *keys):
+	"""
+	copy of the dictionary onto without the cached indexes keys, so that they are computed again
+	"""
+	return { k: v for k, v in onto.items() if k not in keys }
+
+def measure(run, repeat=3):
+	"""
+	times run() repeat times, then runs it once more under tracemalloc for its peak memory (bytes allocated by Python and numpy)
+	"""
+	times = []
+	for k in range(repeat):
+		start = time.perf_counter()
+		run()
+		times.append(time.perf_counter() - start)
+	tracemalloc.start()
+	try:
+		run()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return { 'repeat': repeat, 'min': min(times), 'median': statistics.median(times), 'peak_bytes': peak }
+
+def _commit():
+	"""
+	current git commit of the repository holding this file, None outside a git checkout
+	"""
+	try:
+		return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+			capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run_benchmarks(sizes=(1000, 10000), degree=3, seed=0, repeat=3, obo=None, goa=None, sample=100, cases=None, fw_max=FW_MAX, log=None):
+	"""
+	runs the synthetic cases, and the ontology ones when obo is given, and returns the results (see write_results)
+	cases: names of the cases to run (all of them if None)
+	log: file where each result is reported as it is measured (e.g. sys.stderr)
+	"""
+	res = { 'format': FORMAT, 'commit': _commit(), 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+		'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+		'parameters': { 'sizes': list(sizes), 'degree': degree, 'seed': seed, 'repeat': repeat, 'obo': obo, 'goa': goa, 'sample': sample },
+		'results': [] }
+	generators = [ graph_cases(sizes, degree, seed, fw_max) ]
+	if obo is not None: generators.append(ontology_cases(obo, goa, sample, seed))
+	for generator in generators:
+		for name, params, run in generator:
+			if cases is not None and name not in cases: continue
+			r = dict({ 'case': name, 'parameters': params }, **measure(run, repeat))
+			res['results'].append(r)
+			if log is not None:
+				print('%-30s %-45s %10.4f s %10.1f MB' % (name, _describe(params), r['min'], r['peak_bytes'] / 2**20), file=log)
+	return res
+
+def _describe(params):
+	return ' '.join('%s=%s' % (k, v) for k, v in sorted(params.items()))
+
+def write_results(res, filename):
+	"""
+	writes the results of run_benchmarks as JSON
+	"""
+	with open(filename, 'w') as f:
+		json.dump(res, f, indent=1)
+
+def load_results(filename):
+	with open(filename) as f:
+		res = json.load(f)
+	if res.get('format') != FORMAT:
+		raise ValueError('%s is not a benchmark results file (format %d)' % (filename, FORMAT))
+	return res
+
+def compare(base, current, tolerance=0.25, memory_tolerance=0.25, min_time=0.001):
+	"""
+	cases of current slower (min time) or using more memory (peak) than in base by more than the given relative tolerances,
+	times shorter than min_time seconds on both sides being too noisy to be compared
+	returns a list of (case, parameters, metric, base value, current value); cases missing from either side are ignored
+	"""
+	before = { (r['case'], _describe(r['parameters'])): r for r in base['results'] }
+	regressions = []
+	for r in current['results']:
+		b = before.get((r['case'], _describe(r['parameters'])))
+		if b is None: continue
+		if r['min'] > b['min'] * (1 + tolerance) and r['min'] >= min_time:
+			regressions.append( (r['case'], r['parameters'], 'min', b['min'], r['min']) )
+		if r['peak_bytes'] > b['peak_bytes'] * (1 + memory_tolerance):
+			regressions.append( (r['case'], r['parameters'], 'peak_bytes', b['peak_bytes'], r['peak_bytes']) )
+	return regressions
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmark the graph algorithms and ontology queries on synthetic and real GO graphs')
+	parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[ 1000, 10000 ], help='Numbers of nodes of the synthetic graphs.')
+	parser.add_argument('-d', '--degree', type=int, default=3, help='Average out-degree of the synthetic graphs.')
+	parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic graphs and of the samples.')
+	parser.add_argument('-r', '--repeat', type=int, default=3, help='Timed runs per case.')
+	parser.add_argument('--obo', default='go.obo', help='Ontology file, its cases are skipped when it does not exist.')
+	parser.add_argument('--goa', default=None, help='GOA file for the annotation cases.')
+	parser.add_argument('--sample', type=int, default=100, help='Gene products and terms queried by GOTerms and GeneProducts.')
+	parser.add_argument('--fw-max', type=int, default=FW_MAX, help='Largest synthetic graph given to floyd_warshall.')
+	parser.add_argument('-c', '--cases', nargs='+', default=None, help='Cases to run (all by default).')
+	parser.add_argument('-o', '--output', default=None, help='JSON results file (standard output by default).')
+	parser.add_argument('--compare', default=None, help='Previous results file: report the regressions, exit status 1 if any.')
+	parser.add_argument('--tolerance', type=float, default=0.25, help='Relative slowdown (and memory increase) tolerated by --compare.')
+	parser.add_argument('--min-time', type=float, default=0.001, help='Times (in seconds) below which --compare ignores slowdowns.')
+	args = parser.parse_args(argv)
+
+	obo = args.obo if os.path.isfile(args.obo) else None
+	goa = args.goa if obo is not None and args.goa is not None and os.path.isfile(args.goa) else None
+	if obo is None: print('%s not found, ontology cases skipped' % args.obo, file=sys.stderr)
+	elif args.goa is not None and goa is None: print('%s not found, annotation cases skipped' % args.goa, file=sys.stderr)
+	with contextlib.redirect_stdout(sys.stderr): # messages printed by the loaders, stdout may hold the results
+		res = run_benchmarks(args.sizes, args.degree, args.seed, args.repeat, obo, goa, args.sample, args.cases, args.fw_max, log=sys.stderr)
+	if args.output is None:
+		json.dump(res, sys.stdout, indent=1)
+		print()
+	else:
+		write_results(res, args.output)
+	if args.compare is not None:
+		regressions = compare(load_results(args.compare), res, args.tolerance, args.tolerance, args.min_time)
+		for case, params, metric, old, new in regressions:
+			print('regression %s %s %s: %.4g -> %.4g (x%.2f)' % (case, _describe(params), metric, old, new, new / old if old else float('inf')), file=sys.stderr)
+		return 1 if regressions else 0
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Reading and writing of .sets files (one set per line: id, name, then its elements, separated by tabs, after '# key: value'
+header lines), as written by annotation.py and read by blastsetmodifie.py
+
+SetsWriter buffers the lines and writes them in large blocks, plain or compressed with gzip or lzma (from the file name
+extension: .gz, .xz or .lzma), under a temporary name renamed when the file is complete. On request (sidecar=True) it
+also writes a binary sidecar, <file>.snap, holding the sets as integer element ids (CSR arrays, GOSnapshot layout), which
+read_sets memory-maps instead of parsing the text as long as the .sets file did not change. read_sets only writes a sidecar
+when asked to (save=True) as well, so that no .snap file is left next to the .sets files unless it was requested.
+
+	with SetsWriter('fly_implicit.sets', [ ('strain', 'fly'), ('comment', 'Gene Ontology terms') ], elements=gp_ids, sidecar=True) as w:
+		w.write('GO:0000001', 'mitochondrion inheritance', [ 12, 40 ]) # indices in elements, or element names
+	sets = read_sets('fly_implicit.sets')
+	sets['elements'][sets['members'][sets['ptr'][k]:sets['ptr'][k+1]]] # elements of the k-th set (see members)
+"""
+
+import GOSnapshot as snap
+import gzip
+import lzma
+import os
+import numpy as np
+
+
+FORMAT = 'sets'
+VERSION = '1.0' # version written in the header of the .sets files
+BUFFER = 1 << 20 # characters buffered before each write
+SIDECAR = '.snap' # extension of the binary sidecar
+
+
+def open_sets(filename, mode='rt', compression=None):
+	"""
+	open a .sets file, gzip or lzma compressed according to compression ('gzip', 'lzma', None for plain text)
+	when reading, the compression is detected from the first bytes of the file
+	"""
+	if 'r' in mode:
+		with open(filename, 'rb') as f:
+			magic = f.read(6)
+		compression = 'gzip' if magic[:2] == b'\x1f\x8b' else 'lzma' if magic == b'\xfd7zXZ\x00' else None
+	if compression == 'gzip': return gzip.open(filename, mode)
+	if compression == 'lzma': return lzma.open(filename, mode)
+	return open(filename, mode)
+
+def compression_of(filename):
+	"""
+	compression of a .sets file written under filename, from its extension
+	"""
+	if filename.endswith('.gz'): return 'gzip'
+	if filename.endswith('.xz') or filename.endswith('.lzma'): return 'lzma'
+	return None
+
+def sidecar_name(filename):
+	return filename + SIDECAR
+
+
+class SetsWriter(object):
+	"""
+	streaming writer of a .sets file and of its binary sidecar, to be used as a context manager
+	header: (key, value) pairs written after format and version, e.g. strain, date, comment
+	elements: element names, the members given to write() are then indices in this list (or numpy array of indices)
+	overwrite: an existing file is replaced, otherwise FileExistsError is raised (the file is never partially written)
+	sidecar: write <filename>.snap as well (not by default)
+	compression: 'gzip', 'lzma' or None, from the extension of filename by default
+	"""
+
+	def __init__(self, filename, header=(), elements=None, overwrite=False, sidecar=False, compression='auto', buffer=BUFFER):
+		if not overwrite and os.path.exists(filename):
+			raise FileExistsError('%s already exists' % filename)
+		self.filename = filename
+		self.overwrite = overwrite
+		self.elements = elements
+		self.numbers = None if elements is not None else {} # element -> id, when members are given as names
+		self.sidecar = sidecar
+		self.buffer = buffer
+		self.tmp = '%s.%d.tmp' % (filename, os.getpid())
+		self.f = open_sets(self.tmp, 'wt', compression_of(filename) if compression == 'auto' else compression)
+		self.header = [ ('format', FORMAT), ('version', VERSION) ] + list(header)
+		self.pending = [ '\n'.join('# %s: %s' % kv for kv in self.header) ]
+		self.size = 0
+		self.ids = []
+		self.names = []
+		self.counts = []
+		self.members = []
+
+	def write(self, id, name, members):
+		"""
+		add the set id, named name, whose elements are members (names, or indices in elements)
+		sets without element are skipped, as they would not be read back
+		"""
+		if not len(members): return
+		if self.numbers is None:
+			members = np.asarray(members, dtype=np.int32)
+			line = '\n%s\t%s\t%s' % (id, name, '\t'.join([ self.elements[k] for k in members.tolist() ]))
+		else:
+			line = '\n%s\t%s\t%s' % (id, name, '\t'.join(members))
+			numbers = self.numbers
+			members = np.fromiter(( numbers.setdefault(m, len(numbers)) for m in members ), dtype=np.int32, count=len(members))
+		self.pending.append(line)
+		self.size += len(line)
+		if self.size >= self.buffer: self.flush()
+		if self.sidecar:
+			self.ids.append(id)
+			self.names.append(name)
+			self.counts.append(len(members))
+			self.members.append(members)
+
+	def flush(self):
+		self.f.write(''.join(self.pending))
+		self.pending = []
+		self.size = 0
+
+	def close(self):
+		"""
+		complete the file, move it to its name, then write the sidecar
+		"""
+		self.flush()
+		self.f.close()
+		if self.overwrite:
+			os.replace(self.tmp, self.filename)
+		else:
+			try:
+				_move_new(self.tmp, self.filename)
+			finally:
+				if os.path.exists(self.tmp): os.remove(self.tmp)
+		if self.sidecar:
+			elements = self.elements if self.numbers is None else list(self.numbers)
+			ptr = np.zeros(len(self.counts) + 1, dtype=np.int64)
+			np.cumsum(self.counts, out=ptr[1:])
+			members = np.concatenate(self.members) if self.members else np.zeros(0, dtype=np.int32)
+			save_sidecar(self.filename, _sets(dict(self.header), self.ids, self.names, elements, ptr, members))
+
+	def abort(self):
+		self.f.close()
+		if os.path.exists(self.tmp): os.remove(self.tmp)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, type, value, traceback):
+		if type is None: self.close()
+		else: self.abort()
+		return False
+
+
+def _move_new(tmp, filename):
+	"""
+	give the complete file tmp the name filename, FileExistsError if filename appeared meanwhile
+	a hard link when the filesystem has them (tmp is then left to the caller), otherwise filename is created exclusively
+	then replaced by tmp
+	"""
+	try:
+		os.link(tmp, filename)
+	except FileExistsError:
+		raise
+	except OSError: # no hard links (e.g. FAT, some network filesystems)
+		os.close(os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+		os.replace(tmp, filename)
+
+
+def _sets(header, ids, names, elements, ptr, members):
+	"""
+	the sets as a dictionary of CSR arrays: the k-th set, ids[k] named names[k], has the elements
+	elements[members[ptr[k]:ptr[k+1]]] (in file order, duplicates kept)
+	"""
+	return { 'header': header, 'nb_sets': len(ids), 'ids': ids, 'names': names, 'elements': elements, 'ptr': ptr, 'members': members }
+
+def save_sidecar(filename, sets):
+	"""
+	write the sets (see _sets) read from or written to the .sets file filename to its sidecar
+	"""
+	header = { 'version': snap.VERSION, 'sources': [ snap.fingerprint(filename) ], 'ontology': False, 'annotated': False,
+		'fields': {}, 'values': {}, 'arrays': {} }
+	blocks = []
+	snap._encode('sets.', sets, header, blocks)
+	snap.write_file(sidecar_name(filename), header, blocks)
+
+def load_sidecar(filename):
+	"""
+	the sets of the .sets file filename memory-mapped from its sidecar, None if the sidecar is missing or out of date
+	"""
+	if not snap.is_fresh(sidecar_name(filename), [ filename ]): return None
+	header, arrays = snap.map_file(sidecar_name(filename))
+	if 'sets.' not in header['fields']: return None
+	return snap._decode('sets.', header, arrays)
+
+
+def iter_sets(filename, buffer=BUFFER):
+	"""
+	generates the sets of a .sets file (plain or compressed) as (id, name, list of elements), reading it by blocks
+	lines starting with '#' and lines without element are skipped
+	"""
+	with open_sets(filename) as f:
+		rest = ''
+		for block in iter(lambda: f.read(buffer), ''):
+			lines = (rest + block).split('\n')
+			rest = lines.pop()
+			for l in lines:
+				words = l.split('\t')
+				if len(words) > 2 and not words[0].startswith('#'):
+					yield words[0], words[1], words[2:]
+		words = rest.split('\t')
+		if len(words) > 2 and not words[0].startswith('#'):
+			yield words[0], words[1], words[2:]
+
+def read_header(filename):
+	"""
+	the '# key: value' lines at the beginning of a .sets file, as a dictionary
+	"""
+	header = {}
+	with open_sets(filename) as f:
+		for l in f:
+			if not l.startswith('#'): break
+			key, sep, value = l[1:].strip().partition(':')
+			if sep: header[key.strip()] = value.strip()
+	return header
+
+def read_sets(filename, sidecar=True, save=False):
+	"""
+	the sets of a .sets file as CSR arrays (see _sets), memory-mapped from its sidecar when it is up to date (and sidecar is
+	True), otherwise parsed from the text and, when save is True, saved to the sidecar for the next reads
+	element ids are arbitrary (the order of first appearance, or of the elements given to SetsWriter)
+	"""
+	if sidecar:
+		sets = load_sidecar(filename)
+		if sets is not None: return sets
+	numbers = {}
+	ids, names, counts, members = [], [], [], []
+	for id, name, words in iter_sets(filename):
+		ids.append(id)
+		names.append(name)
+		counts.append(len(words))
+		members.extend( numbers.setdefault(w, len(numbers)) for w in words )
+	ptr = np.zeros(len(ids) + 1, dtype=np.int64)
+	np.cumsum(counts, out=ptr[1:])
+	sets = _sets(read_header(filename), ids, names, list(numbers), ptr, np.array(members, dtype=np.int32))
+	if save:
+		try:
+			save_sidecar(filename, sets)
+		except OSError: # e.g. read-only directory, the text is parsed again next time
+			pass
+	return sets
@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Semantic similarity of GO terms and of gene products, based on the information content (IC) of the terms computed from
+the annotation frequencies of an annotation table (GeneOntology.load_annotations)
+
+term measures (MEASURES):
+	resnik: IC of the most informative common ancestor (MICA)
+	lin:    2 IC(MICA) / (IC(a) + IC(b))
+	jc:     Jiang-Conrath, 1 / (1 + IC(a) + IC(b) - 2 IC(MICA))
+gene products are compared with the best-match average (BMA) of the similarities of their terms.
+
+The all-pairs matrices compare packed bitsets of the ancestors of the terms, whose columns are ordered by decreasing IC:
+the MICA of two terms is the first bit set in both. They are computed by blocks of rows, and written to a .npy file
+(memory-mapped) when an output file is given, so that they do not need to fit in memory.
+"""
+
+import GeneOntology as GO
+import os
+import tempfile
+import numpy as np
+from scipy import sparse
+
+
+MEASURES = ('resnik', 'lin', 'jc')
+BLOCK_BYTES = 64 << 20 # memory used by a block of rows of the bitset comparisons
+
+
+def information_content(onto, annot, include=None, exclude=None):
+	"""
+	returns the IC of every term: -log p(t), p(t) being the fraction of the gene products directly annotated in the namespace
+	of t that are annotated by t or one of its descendants in this namespace (GeneOntology.namespace_ancestors: a gene product
+	annotated in another namespace does not count, even through a part_of edge); terms that annotate no gene product get an
+	infinite IC
+	include, exclude: evidence filter (see GeneOntology.evidence_mask)
+	"""
+	n = onto['nb_terms']
+	ns = onto['namespace']
+	ptr, terms = GO.gene_product_terms(onto, annot, False, include, exclude)
+	gp = np.repeat(np.arange(annot['nb_gp'], dtype=np.int64), np.diff(ptr))
+	anc_ptr, anc = GO.namespace_ancestors(onto)
+	counts, up = GO._gather(anc_ptr, anc, terms)
+	pairs = GO._unique(np.concatenate([ gp * n + terms, np.repeat(gp, counts) * n + up ]))
+	counts = np.bincount(pairs % n, minlength=n).astype(np.float64)
+	nb_ns = len(onto['namespace_names'])
+	total = np.bincount(GO._unique(gp * nb_ns + ns[terms]) % nb_ns, minlength=nb_ns).astype(np.float64)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		ic = -np.log(counts / total[ns])
+	ic[counts == 0] = np.inf
+	return ic
+
+def _with_ancestors(onto, term):
+	"""
+	sorted indices of term and of its ancestors in its own namespace (see GeneOntology.namespace_ancestors)
+	"""
+	i = GO._term_index(onto, term)
+	ptr, anc = GO.namespace_ancestors(onto)
+	return np.union1d(anc[ptr[i]:ptr[i+1]], [ i ])
+
+def mica(onto, ic, a, b):
+	"""
+	returns the index of the most informative common ancestor of the terms a and b (GO ids or indices, a term is its own
+	ancestor here, only the ancestors in its namespace are considered), None if they have no common ancestor (different
+	namespaces)
+	"""
+	common = np.intersect1d(_with_ancestors(onto, a), _with_ancestors(onto, b), assume_unique=True)
+	if not len(common): return None
+	return int(common[np.argmax(ic[common])])
+
+def _measure(ic_c, ic_a, ic_b, measure):
+	"""
+	similarity from the IC of the MICA and of the two terms (arrays or numbers), nan IC of the MICA meaning no common ancestor
+	"""
+	with np.errstate(divide='ignore', invalid='ignore'):
+		if measure == 'resnik':
+			sim = ic_c
+		elif measure == 'lin':
+			den = ic_a + ic_b
+			sim = np.where(den > 0, 2 * ic_c / den, 1.0)
+		elif measure == 'jc':
+			sim = 1.0 / (1.0 + ic_a + ic_b - 2 * ic_c)
+		else:
+			raise ValueError('unknown similarity measure %s, use one of %s' % (measure, ', '.join(MEASURES)))
+		sim = np.where(np.isnan(ic_c), 0.0, sim)
+	return np.nan_to_num(sim, nan=0.0, posinf=0.0)
+
+def term_similarity(onto, ic, a, b, measure='resnik'):
+	"""
+	similarity of the terms a and b (GO ids or indices), 0 without common ancestor
+	"""
+	c = mica(onto, ic, a, b)
+	if c is None: return 0.0
+	return float(_measure(ic[c], ic[GO._term_index(onto, a)], ic[GO._term_index(onto, b)], measure))
+
+def gene_similarity(onto, annot, ic, gp1, gp2, measure='lin', namespace='biological_process'):
+	"""
+	best-match average similarity of two gene products (ids or indices in annot) over their direct terms of namespace
+	"""
+	ptr, terms = _gene_terms(onto, annot, [ gp1, gp2 ], namespace)
+	t1, t2 = terms[ptr[0]:ptr[1]], terms[ptr[1]:ptr[2]]
+	if not len(t1) or not len(t2): return 0.0
+	bits, columns = ancestor_bitsets(onto, ic, np.concatenate([ t1, t2 ]))
+	c = _mica_block(bits[:len(t1)], bits[len(t1):], ic[columns])
+	sim = _measure(c, ic[t1][:, None], ic[t2][None, :], measure)
+	return float((sim.max(axis=1).mean() + sim.max(axis=0).mean()) / 2)
+
+
+def _direct_terms(onto, annot):
+	"""
+	direct terms of every gene product of annot (GeneOntology.gene_product_terms), built once and kept in annot['_filters']
+	"""
+	cache = annot.setdefault('_filters', {}).setdefault(GO.evidence_mask(annot), {}) # runtime cache, not saved in snapshots
+	if 'gp_terms' not in cache: cache['gp_terms'] = GO.gene_product_terms(onto, annot, all=False)
+	return cache['gp_terms']
+
+def _gene_terms(onto, annot, gps, namespace):
+	"""
+	direct terms of namespace annotating each gene product of gps (ids or indices): CSR arrays (ptr, terms)
+	"""
+	ptr, terms = _direct_terms(onto, annot)
+	rows = [ annot['gp_index'][g] if isinstance(g, str) else g for g in gps ]
+	counts, terms = GO._gather(ptr, terms, rows)
+	if namespace is not None:
+		code = onto['namespace_names'].index(namespace) if namespace in onto['namespace_names'] else -1
+		keep = onto['namespace'][terms] == code
+		counts = np.bincount(np.repeat(np.arange(len(rows)), counts)[keep], minlength=len(rows))
+		terms = terms[keep]
+	ptr = np.zeros(len(rows) + 1, dtype=np.int64)
+	np.cumsum(counts, out=ptr[1:])
+	return ptr, terms
+
+def ancestor_bitsets(onto, ic, terms):
+	"""
+	packed bitsets (one row of uint64 words per term) of the ancestors of terms in their own namespace, the terms themselves
+	included; bit k stands for the ancestor columns[k], the columns being sorted by decreasing IC; returns (bits, columns)
+	"""
+	terms = np.asarray(terms, dtype=np.int32)
+	counts, anc = GO._gather(*GO.namespace_ancestors(onto), terms)
+	rows = np.concatenate([ np.arange(len(terms)), np.repeat(np.arange(len(terms)), counts) ])
+	anc = np.concatenate([ terms, anc ])
+	columns = np.unique(anc)
+	columns = columns[np.argsort(-ic[columns], kind='stable')]
+	col = np.empty(onto['nb_terms'], dtype=np.int64)
+	col[columns] = np.arange(len(columns))
+	col = col[anc]
+	bits = np.zeros((len(terms), -(-len(columns) // 64)), dtype=np.uint64)
+	np.bitwise_or.at(bits, (rows, col // 64), np.left_shift(np.uint64(1), (col % 64).astype(np.uint64)))
+	return bits, columns
+
+def _mica_block(bits_a, bits_b, column_ic):
+	"""
+	IC of the MICA of every pair (row of bits_a, row of bits_b), nan for the pairs without common ancestor
+	"""
+	x = bits_a[:, None, :] & bits_b[None, :, :]
+	nz = x != 0
+	word = nz.argmax(axis=2) # first word with a common ancestor
+	low = np.take_along_axis(x, word[..., None], axis=2)[..., 0]
+	low &= ~low + np.uint64(1) # lowest bit set
+	found = nz.any(axis=2)
+	low[~found] = 1
+	col = word * 64 + np.log2(low.astype(np.float64)).astype(np.int64)
+	return np.where(found, column_ic[np.minimum(col, len(column_ic) - 1)], np.nan)
+
+def _block_rows(n, width):
+	return max(1, int(BLOCK_BYTES // max(1, n * width * 8)))
+
+def _output(out, n, m):
+	if out is None: return np.empty((n, m), dtype=np.float32)
+	return np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=(n, m))
+
+def term_similarity_matrix(onto, ic, terms, measure='resnik', out=None, block=None):
+	"""
+	all-pairs similarity of terms (list of GO ids or indices), as a float32 matrix
+	out: .npy file name, the matrix is then written to it by blocks of rows and returned memory-mapped
+	block: number of rows computed at once (default: from BLOCK_BYTES)
+	"""
+	terms = np.array([ GO._term_index(onto, t) for t in terms ], dtype=np.int32)
+	bits, columns = ancestor_bitsets(onto, ic, terms)
+	column_ic = ic[columns]
+	n = len(terms)
+	res = _output(out, n, n)
+	if block is None: block = _block_rows(n, bits.shape[1])
+	for start in range(0, n, block):
+		stop = min(n, start + block)
+		c = _mica_block(bits[start:stop], bits, column_ic)
+		res[start:stop] = _measure(c, ic[terms[start:stop]][:, None], ic[terms][None, :], measure)
+	if out is not None: res.flush()
+	return res
+
+def gene_similarity_matrix(onto, annot, ic, gps=None, measure='lin', namespace='biological_process', out=None, block=None):
+	"""
+	all-pairs best-match average similarity of gene products (ids or indices in annot, default: all of them) over their
+	direct terms of namespace, as a float32 matrix; gene products without such term get 0
+	out: .npy file name, the matrix is then written to it by blocks and returned memory-mapped (the term matrix is kept in
+	<out>.terms.npy)
+	"""
+	if gps is None: gps = range(annot['nb_gp'])
+	gptr, gterms = _gene_terms(onto, annot, list(gps), namespace)
+	terms, col = np.unique(gterms, return_inverse=True)
+	term_sim = term_similarity_matrix(onto, ic, terms, measure, None if out is None else out + '.terms.npy')
+	g = len(gptr) - 1
+	size = np.diff(gptr)
+	# incidence of the terms of each gene product, each column divided by its number of terms: R @ mean gives means over columns
+	owner = np.repeat(np.arange(g), size)
+	mean = sparse.csr_matrix((1.0 / size[owner], (col, owner)), shape=(len(terms), g))
+	res = _output(out, g, g)
+	if block is None: block = max(1, int(BLOCK_BYTES // max(1, 4 * len(terms))))
+	# pass 1: res[a, b] = mean over the terms t of b of the best match of t among the terms of a
+	for start in range(0, g, block):
+		stop = min(g, start + block)
+		best = np.zeros((stop - start, len(terms)), dtype=np.float32)
+		for k in range(start, stop):
+			if size[k]: best[k - start] = term_sim[col[gptr[k]:gptr[k+1]]].max(axis=0)
+		res[start:stop] = np.asarray((mean.T @ best.T).T)
+	# pass 2: best-match average, symmetrized block by block in place
+	for i in range(0, g, block):
+		for j in range(i, g, block):
+			a = np.array(res[i:i+block, j:j+block])
+			b = np.array(res[j:j+block, i:i+block]).T
+			m = (a + b) / 2
+			res[i:i+block, j:j+block] = m
+			res[j:j+block, i:i+block] = m.T
+	if out is not None: res.flush()
+	return res
+
+
+def check_namespaces():
+	"""
+	the MICA of two terms is in their namespace: on TEST_OBO plus GO:0000010, two biological_process terms that are also part of
+	the cellular_component term GO:0000007 have the biological_process root as MICA, and a biological_process term shares no
+	ancestor with the cellular_component GO:0000008; the matrices give the same similarities as term_similarity
+	"""
+	text = GO.TEST_OBO.replace('[Typedef]', '[Term]\nid: GO:0000010\nname: other bp part of a cc\nnamespace: biological_process\n'
+		'is_a: GO:0000001 ! root bp\nrelationship: part_of GO:0000007 ! grandchild cc\n\n[Typedef]')
+	with tempfile.TemporaryDirectory() as d:
+		obo = os.path.join(d, 'test.obo')
+		with open(obo, 'w') as f: f.write(text)
+		onto = GO.load_ontology(obo)
+	ic = np.arange(onto['nb_terms'], dtype=np.float64) # the cellular_component terms are the most informative
+	index = onto['index']
+	assert mica(onto, ic, 'GO:0000009', 'GO:0000010') == index['GO:0000001']
+	assert mica(onto, ic, 'GO:0000009', 'GO:0000008') is None
+	assert term_similarity(onto, ic, 'GO:0000009', 'GO:0000008') == 0.0
+	terms = list(onto['ids'])
+	for measure in MEASURES:
+		m = term_similarity_matrix(onto, ic, terms, measure)
+		for i, a in enumerate(terms):
+			for j, b in enumerate(terms):
+				assert abs(m[i, j] - term_similarity(onto, ic, a, b, measure)) < 1e-5, (a, b, measure)
+	return True
+
+
+def check_information_content():
+	"""
+	on TEST_OBO and TEST_GOA plus P4 annotated by GO:0000009 (biological_process, part of the cellular_component GO:0000007),
+	the IC counts the gene products within each namespace only, and gene_similarity gives the best-match average of
+	term_similarity, as gene_similarity_matrix does
+	"""
+	with tempfile.TemporaryDirectory() as d:
+		obo, goa = GO._test_files(d)
+		with open(goa, 'a') as f: f.write('DB\tP4\tgene4\t\tGO:0000009\tPMID:1\tIDA\t\tP\tprotein 4\tg4\tprotein\ttaxon:1\t20200101\tDB\n')
+		onto = GO.load_ontology(obo)
+		annot = GO.load_annotations(onto, goa)
+	ic = information_content(onto, annot)
+	index = onto['index']
+	assert ic[index['GO:0000001']] == ic[index['GO:0000005']] == 0.0
+	assert np.isinf(ic[index['GO:0000007']]) # P4 is annotated in biological_process only
+	assert np.isclose(ic[index['GO:0000009']], np.log(3)) and np.isclose(ic[index['GO:0000006']], np.log(2))
+	gps = annot['gp_ids']
+	for measure in MEASURES:
+		m = gene_similarity_matrix(onto, annot, ic, measure=measure)
+		for i, a in enumerate(gps):
+			for j, b in enumerate(gps):
+				t1, t2 = [ _gene_terms(onto, annot, [ g ], 'biological_process')[1].tolist() for g in (a, b) ]
+				sim = np.array([ [ term_similarity(onto, ic, x, y, measure) for y in t2 ] for x in t1 ]) if t1 and t2 else None
+				bma = 0.0 if sim is None else (sim.max(axis=1).mean() + sim.max(axis=0).mean()) / 2
+				assert np.isclose(gene_similarity(onto, annot, ic, a, b, measure), bma), (a, b, measure)
+				assert np.isclose(m[i, j], bma, atol=1e-5), (a, b, measure)
+	return True
+
+
+if __name__ == "__main__":
+
+	print('GOSimilarity lib tests')
+	print('MICA dans le namespace des termes :', check_namespaces())
+	print('IC et similarité des produits de gènes dans chaque namespace :', check_information_content())
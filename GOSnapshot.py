@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Binary snapshots of a parsed ontology (GeneOntology.load_ontology) and of its annotation table (GeneOntology.load_annotations)
+
+A snapshot is loaded by memory-mapping the file: arrays are used in place, lists of strings and dictionaries are read
+through the StringTable and SortedMap views below, so that nothing is rebuilt at startup.
+
+File layout:
+	MAGIC | version (uint32) | header length (uint32) | JSON header | arrays, each aligned on 64 bytes
+The header records the size, mtime and sha1 of the source files, load_cached() re-parses them whenever they changed.
+"""
+
+import GeneOntology as GO
+import hashlib
+import json
+import os
+import numpy as np
+from collections.abc import Mapping, Sequence
+
+
+MAGIC = b'GOSNAP\0\0'
+VERSION = 5
+ALIGN = 64
+
+
+class StringTable(Sequence):
+	"""
+	read-only list of strings stored as a single utf-8 buffer and the offsets of the strings in it
+	"""
+
+	def __init__(self, offsets, blob):
+		self.offsets = offsets
+		self.blob = blob
+		self.text = None # bytes and offsets as Python objects, for fast random access once the table is used
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		if self.text is None:
+			self.text = self.blob.tobytes()
+			self.pos = self.offsets.tolist()
+		if isinstance(i, slice):
+			return [ self[j] for j in range(*i.indices(len(self.pos) - 1)) ]
+		if i < 0: i += len(self.pos) - 1
+		if not 0 <= i < len(self.pos) - 1: raise IndexError(i)
+		return self.text[self.pos[i]:self.pos[i+1]].decode('utf-8')
+
+	def __iter__(self):
+		text = self.blob.tobytes() if self.text is None else self.text
+		offsets = self.offsets.tolist()
+		for i in range(len(offsets) - 1):
+			yield text[offsets[i]:offsets[i+1]].decode('utf-8')
+
+
+class SortedMap(Mapping):
+	"""
+	read-only dictionary stored as its sorted keys (StringTable) and their values
+	the hash table is only built at the first lookup, so that loading a snapshot stays immediate
+	"""
+
+	def __init__(self, keys, values):
+		self.keys_table = keys
+		self.values = values
+		self.table = None
+
+	def lookup(self):
+		if self.table is None:
+			values = self.values.tolist() if isinstance(self.values, np.ndarray) else self.values
+			self.table = dict(zip(self.keys_table, values))
+		return self.table
+
+	def __getitem__(self, key):
+		return self.lookup()[key]
+
+	def __contains__(self, key):
+		return key in self.lookup()
+
+	def get(self, key, default=None):
+		return self.lookup().get(key, default)
+
+	def __iter__(self):
+		return iter(self.keys_table)
+
+	def __len__(self):
+		return len(self.keys_table)
+
+
+def fingerprint(filename, sha1=True):
+	"""
+	size, modification time and (optionally) sha1 of a source file
+	"""
+	st = os.stat(filename)
+	fp = { 'path': os.path.abspath(filename), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns }
+	if sha1:
+		h = hashlib.sha1()
+		with open(filename, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b''):
+				h.update(block)
+		fp['sha1'] = h.hexdigest()
+	return fp
+
+def _unchanged(fp, filename):
+	"""
+	fingerprint of filename if it still matches the fingerprint fp, None otherwise
+	the file is only hashed when its mtime changed: the new fingerprint then has the new mtime, with the same sha1
+	"""
+	if not os.path.isfile(filename): return None
+	current = fingerprint(filename, sha1=False)
+	if current['size'] != fp['size']: return None
+	if current['mtime_ns'] == fp['mtime_ns']: return fp
+	current = fingerprint(filename)
+	return current if current['sha1'] == fp['sha1'] else None
+
+
+def _encode(prefix, d, header, blocks):
+	"""
+	record the content of the dictionary d (ontology or annotation table) in header and the list of arrays to write
+	"""
+	def add_array(name, a):
+		a = np.ascontiguousarray(a)
+		header['arrays'][name] = { 'dtype': a.dtype.str, 'shape': list(a.shape) }
+		blocks.append( (name, a) )
+
+	def add_strings(name, strings):
+		data = [ s.encode('utf-8') for s in strings ]
+		offsets = np.zeros(len(data) + 1, dtype=np.int64)
+		np.cumsum([ len(b) for b in data ], out=offsets[1:])
+		add_array(name + '.offsets', offsets)
+		add_array(name + '.blob', np.frombuffer(b''.join(data), dtype=np.uint8))
+
+	fields = {}
+	for key, value in d.items():
+		if key.startswith('_'): continue # runtime caches
+		if prefix == 'ontology.' and key in GO.TERM_VIEWS: continue # rebuilt from the arrays
+		name = prefix + key
+		if isinstance(value, np.ndarray):
+			add_array(name, value)
+			fields[key] = 'array'
+		elif isinstance(value, Mapping):
+			keys = sorted(value)
+			add_strings(name + '.keys', keys)
+			values = [ value[k] for k in keys ]
+			if all(isinstance(v, str) for v in values):
+				add_strings(name + '.values', values)
+				fields[key] = 'map:str'
+			else:
+				add_array(name + '.values', np.array(values, dtype=np.int64))
+				fields[key] = 'map:int'
+		elif isinstance(value, Sequence) and not isinstance(value, str) and len(value) and all(isinstance(v, str) for v in value):
+			add_strings(name, value)
+			fields[key] = 'strings'
+		else: # small values (counts, file names, evidence codes, unresolved rows)
+			header['values'][name] = value if not isinstance(value, tuple) else list(value)
+			fields[key] = 'value'
+	header['fields'][prefix] = fields
+
+def _decode(prefix, header, arrays):
+	"""
+	rebuild the views over the memory-mapped arrays for the dictionary saved by _encode under prefix
+	"""
+	d = {}
+	for key, kind in header['fields'][prefix].items():
+		name = prefix + key
+		if kind == 'array':
+			d[key] = arrays[name]
+		elif kind == 'strings':
+			d[key] = StringTable(arrays[name + '.offsets'], arrays[name + '.blob'])
+		elif kind.startswith('map:'):
+			keys = StringTable(arrays[name + '.keys.offsets'], arrays[name + '.keys.blob'])
+			if kind == 'map:str': values = StringTable(arrays[name + '.values.offsets'], arrays[name + '.values.blob'])
+			else: values = arrays[name + '.values']
+			d[key] = SortedMap(keys, values)
+		else:
+			d[key] = header['values'][name]
+	if prefix == 'ontology.':
+		GO.term_views(d)
+	if prefix == 'annotations.': # list of (gene product, GO id) pairs
+		d['unresolved'] = [ tuple(u) for u in d['unresolved'] ]
+	return d
+
+
+def save_snapshot(filename, onto, annot=None, sources=None):
+	"""
+	write the ontology onto and/or the annotation table annot (onto may be None) to the binary snapshot filename
+	sources: files the snapshot depends on (default: the files onto and annot were parsed from)
+	the file is written under a temporary name then renamed, so that concurrent jobs never read a partial snapshot
+	"""
+	if sources is None:
+		sources = ([ onto['source'] ] if onto is not None else []) + ([ annot['source'] ] if annot is not None else [])
+	header = { 'version': VERSION, 'sources': [ fingerprint(s) for s in sources ], 'ontology': onto is not None, 'annotated': annot is not None,
+		'fields': {}, 'values': {}, 'arrays': {} }
+	blocks = []
+	if onto is not None:
+		_encode('ontology.', onto, header, blocks)
+	if annot is not None:
+		_encode('annotations.', annot, header, blocks)
+	write_file(filename, header, blocks)
+
+def write_file(filename, header, blocks):
+	"""
+	write the header and the arrays recorded by _encode (blocks) to filename in the snapshot layout
+	"""
+	# offsets are relative to the end of the header, so they can be computed before its length is known
+	offset = 0
+	for name, a in blocks:
+		offset = -(-offset // ALIGN) * ALIGN
+		header['arrays'][name]['offset'] = offset
+		offset += a.nbytes
+	head = json.dumps(header).encode('utf-8')
+	start = -(-(len(MAGIC) + 8 + len(head)) // ALIGN) * ALIGN
+	tmp = '%s.%d.tmp' % (filename, os.getpid())
+	with open(tmp, 'wb') as f:
+		f.write(MAGIC)
+		f.write(np.array([VERSION, len(head)], dtype='<u4').tobytes())
+		f.write(head)
+		for name, a in blocks:
+			f.seek(start + header['arrays'][name]['offset'])
+			f.write(a.tobytes())
+		f.truncate(start + offset) # empty arrays at the end of the file still need their offset to exist
+	os.replace(tmp, filename)
+
+def read_header(filename):
+	"""
+	returns the JSON header of a snapshot and the position of its first array, None if filename is not a snapshot of this version
+	"""
+	with open(filename, 'rb') as f:
+		if f.read(len(MAGIC)) != MAGIC: return None
+		version, length = np.frombuffer(f.read(8), dtype='<u4').tolist()
+		if version != VERSION: return None
+		header = json.loads(f.read(length).decode('utf-8'))
+	return header, -(-(len(MAGIC) + 8 + length) // ALIGN) * ALIGN
+
+def map_file(filename):
+	"""
+	memory-map a file written by write_file, returns its header and its arrays by name
+	"""
+	res = read_header(filename)
+	if res is None:
+		raise ValueError('%s is not a GO snapshot (version %d)' % (filename, VERSION))
+	header, start = res
+	mm = np.memmap(filename, dtype=np.uint8, mode='r')
+	arrays = {}
+	for name, a in header['arrays'].items():
+		arrays[name] = np.ndarray(tuple(a['shape']), dtype=np.dtype(a['dtype']), buffer=mm, offset=start + a['offset'])
+	return header, arrays
+
+def load_snapshot(filename):
+	"""
+	memory-map the snapshot filename and returns (onto, annot), None for the parts that were not saved
+	"""
+	header, arrays = map_file(filename)
+	onto = _decode('ontology.', header, arrays) if header.get('ontology', True) else None
+	annot = _decode('annotations.', header, arrays) if header['annotated'] else None
+	return onto, annot
+
+def is_fresh(filename, sources):
+	"""
+	True if the snapshot filename exists, has the current version and was built from the current content of the sources files
+	"""
+	if not os.path.isfile(filename): return False
+	res = read_header(filename)
+	if res is None: return False
+	header = res[0]
+	if [ fp['path'] for fp in header['sources'] ] != [ os.path.abspath(s) for s in sources ]: return False
+	current = []
+	for fp, s in zip(header['sources'], sources):
+		now = _unchanged(fp, s)
+		if now is None: return False
+		current.append(now)
+	if current != header['sources']: # only the mtime changed (touch, checkout): record it, not to hash the sources again
+		try:
+			refresh_sources(filename, current)
+		except OSError: # e.g. read-only directory, the sources are hashed again next time
+			pass
+	return True
+
+def refresh_sources(filename, sources):
+	"""
+	rewrite the snapshot filename with the fingerprints sources, its arrays are copied unchanged
+	"""
+	header, arrays = map_file(filename)
+	header['sources'] = sources
+	names = sorted(header['arrays'], key=lambda name: header['arrays'][name]['offset'])
+	write_file(filename, header, [ (name, arrays[name]) for name in names ])
+
+
+def load_cached(obo, goa=None, snapshot=None):
+	"""
+	returns (onto, annot) for the OBO file obo and the GOA file goa (annot is None without goa)
+	from the snapshot when it is up to date, otherwise the files are parsed and the snapshot (re)written
+	snapshot: snapshot file name, by default <goa>.snap (or <obo>.snap) next to the source file
+	"""
+	sources = [ obo ] + ([ goa ] if goa is not None else [])
+	if snapshot is None:
+		snapshot = sources[-1] + '.snap'
+	if is_fresh(snapshot, sources):
+		return load_snapshot(snapshot)
+	onto = GO.freeze_ontology(GO.load_ontology(obo)) # derived indexes are saved too
+	annot = GO.load_annotations(onto, goa) if goa is not None else None
+	save_snapshot(snapshot, onto, annot, sources)
+	return load_snapshot(snapshot)
+
+def load_cached_annotations(onto, goa, snapshot=None):
+	"""
+	returns the annotation table of the GOA file goa over the ontology onto (e.g. for GeneOntology.add_annotations),
+	from a snapshot holding only this table, so that the tables of several species can share one loaded ontology
+	snapshot: snapshot file name, by default <goa>.annot.snap; it is rebuilt when goa or the OBO file of onto changed
+	"""
+	sources = [ onto['source'], goa ]
+	if snapshot is None:
+		snapshot = goa + '.annot.snap'
+	if is_fresh(snapshot, sources):
+		return load_snapshot(snapshot)[1]
+	annot = GO.load_annotations(onto, goa)
+	save_snapshot(snapshot, None, annot, sources)
+	return load_snapshot(snapshot)[1]
@@ -0,0 +1,355 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental update of a parsed ontology (GeneOntology.load_ontology) and of its annotation tables from one GO release to the next
+
+diff_ontologies() compares two parsed releases: added, obsoleted and re-parented terms, changed alternate ids.
+update_ontology() fills the derived indexes (ancestors, depths) of the new release from those of the old one, only the
+terms whose ancestors changed (added and re-parented terms and their descendants) are recomputed.
+update_annotations() moves an annotation table to the new release, its inverted index being recomputed only for the
+terms whose gene products may have changed, and reports the gene product sets that moved.
+
+	old = GO.freeze_ontology(GO.load_ontology('go.obo'))
+	annot = GO.load_annotations(old, '17.D_melanogaster.goa')
+	new, annot, diff, report = update_release(old, annot, 'go-next.obo')
+"""
+
+import GeneOntology as GO
+import tempfile
+import numpy as np
+
+
+def _remap(old, new):
+	"""
+	index in new of every term of old, -1 for the terms that are no longer in new
+	"""
+	index = new['index']
+	return np.array([ index.get(id, -1) for id in old['ids'] ], dtype=np.int32)
+
+def _edge_keys(child, parent, types, n):
+	return (child.astype(np.int64) * (n + 1) + parent + 1) * len(GO.EDGE_TYPES) + types
+
+def _parent_list(onto, i):
+	ptr = onto['parents_ptr']
+	ids = onto['ids']
+	return sorted( (ids[p], GO.EDGE_TYPES[t]) for p, t in zip(onto['parents'][ptr[i]:ptr[i+1]].tolist(), onto['parents_type'][ptr[i]:ptr[i+1]].tolist()) )
+
+def _descendants(onto, terms):
+	"""
+	sorted indices of terms and of all their descendants
+	"""
+	ptr = onto['children_ptr'].tolist()
+	children = onto['children'].tolist()
+	seen = set(terms)
+	queue = list(seen)
+	for i in queue: # the queue grows while it is read
+		for j in children[ptr[i]:ptr[i+1]]:
+			if j not in seen:
+				seen.add(j)
+				queue.append(j)
+	return np.array(sorted(seen), dtype=np.int32)
+
+def _with_ancestors(onto, terms):
+	"""
+	sorted indices of terms and of all their ancestors (the closure of onto must be computed)
+	"""
+	terms = np.asarray(terms, dtype=np.int32)
+	return GO._unique(np.concatenate([ terms, GO._gather(onto['ancestors_ptr'], onto['ancestors'], terms)[1] ]))
+
+
+def diff_ontologies(old, new):
+	"""
+	compares two releases of the ontology and returns
+	{ 'added': [ GO ids ], 'obsoleted': [ GO ids ],
+	  're-parented': { GO id: (old parents, new parents) }, parents being sorted lists of (GO id, relationship),
+	  'alt_id': { alternate id: (old term, new term) } for the alternate ids added, removed or moved (None when absent),
+	  'affected': [ GO ids ] terms of new whose ancestors may have changed (added, re-parented and their descendants) }
+	"""
+	n = new['nb_terms']
+	remap = _remap(old, new)
+	added = [ id for id in new['ids'] if id not in old['index'] ]
+	obsoleted = [ old['ids'][i] for i in np.flatnonzero(remap < 0).tolist() ]
+	# edges of the terms present in both releases, with the parents numbered in new (-1 for an obsoleted parent)
+	in_old = np.zeros(n, dtype=bool)
+	in_old[remap[remap >= 0]] = True
+	child = np.repeat(np.arange(old['nb_terms'], dtype=np.int32), np.diff(old['parents_ptr']))
+	keep = remap[child] >= 0
+	old_keys = _edge_keys(remap[child][keep], remap[old['parents']][keep], old['parents_type'][keep], n)
+	child = np.repeat(np.arange(n, dtype=np.int32), np.diff(new['parents_ptr']))
+	keep = in_old[child]
+	new_keys = _edge_keys(child[keep], new['parents'][keep], new['parents_type'][keep], n)
+	moved = GO._unique(np.setxor1d(old_keys, new_keys) // ((n + 1) * len(GO.EDGE_TYPES))).tolist()
+	reparented = {}
+	for i in moved:
+		id = new['ids'][i]
+		reparented[id] = (_parent_list(old, old['index'][id]), _parent_list(new, i))
+	alt_id = {}
+	for alt in set(old['alt_id']) | set(new['alt_id']):
+		a, b = old['alt_id'].get(alt), new['alt_id'].get(alt)
+		if a != b: alt_id[alt] = (a, b)
+	seeds = [ new['index'][id] for id in added ] + moved
+	affected = [ new['ids'][i] for i in _descendants(new, seeds).tolist() ]
+	return { 'old': old['source'], 'new': new['source'], 'added': added, 'obsoleted': obsoleted, 're-parented': reparented,
+		'alt_id': alt_id, 'affected': affected }
+
+def update_ontology(old, new, diff=None):
+	"""
+	computes the ancestors and depths of the terms of new (see GeneOntology.ancestor_closure and term_depths) from those
+	of old, only the terms listed in diff['affected'] are recomputed; returns new
+	"""
+	if diff is None: diff = diff_ontologies(old, new)
+	GO.ancestor_closure(old)
+	GO.term_depths(old)
+	n = new['nb_terms']
+	remap = _remap(old, new)
+	back = np.full(n, -1, dtype=np.int32) # index in old of the terms of new
+	back[remap[remap >= 0]] = np.flatnonzero(remap >= 0)
+	affected = np.array([ new['index'][id] for id in diff['affected'] ], dtype=np.int32)
+	is_affected = np.zeros(n, dtype=bool)
+	is_affected[affected] = True
+	# depths only follow the parents of the same namespace: a term moved to another namespace changes those of its descendants
+	kept = np.flatnonzero(back >= 0)
+	moved = kept[ np.array(new['namespace_names'])[new['namespace'][kept]] != np.array(old['namespace_names'])[old['namespace'][back[kept]]] ]
+	if len(moved):
+		is_affected[_descendants(new, moved.tolist())] = True
+		affected = np.flatnonzero(is_affected).astype(np.int32)
+	# the other terms keep their ancestors, renumbered
+	same = np.flatnonzero(~is_affected)
+	counts, anc = GO._gather(old['ancestors_ptr'], old['ancestors'], back[same])
+	keys = [ np.repeat(same.astype(np.int64), counts) * n + remap[anc] ]
+	same_ptr = np.zeros(n + 1, dtype=np.int64)
+	same_ptr[1:][same] = counts
+	np.cumsum(same_ptr, out=same_ptr)
+	same_anc = np.sort(keys[0]) % n # sorted by term, then by ancestor
+	mind = np.zeros(n, dtype=np.int32)
+	maxd = np.zeros(n, dtype=np.int32)
+	mind[same] = old['min_depth'][back[same]]
+	maxd[same] = old['max_depth'][back[same]]
+	# affected terms in topological order of the subgraph they induce (their other parents are done)
+	ptr = new['parents_ptr'].tolist()
+	parents = new['parents'].tolist()
+	cptr = new['children_ptr'].tolist()
+	nptr, nparents = GO.namespace_parents(new)
+	nptr = nptr.tolist()
+	nparents = nparents.tolist()
+	children = new['children'].tolist()
+	indeg = { i: sum(1 for p in parents[ptr[i]:ptr[i+1]] if is_affected[p]) for i in affected.tolist() }
+	queue = [ i for i, d in indeg.items() if d == 0 ]
+	sets = {}
+	for i in queue: # the queue grows while it is read
+		p = parents[ptr[i]:ptr[i+1]]
+		s = set(p)
+		for j in p:
+			s |= sets[j] if is_affected[j] else set(same_anc[same_ptr[j]:same_ptr[j+1]].tolist())
+		sets[i] = s
+		p = nparents[nptr[i]:nptr[i+1]]
+		if p:
+			mind[i] = 1 + min(mind[p].tolist())
+			maxd[i] = 1 + max(maxd[p].tolist())
+		for j in children[cptr[i]:cptr[i+1]]:
+			indeg[j] -= 1
+			if indeg[j] == 0: queue.append(j)
+	if len(queue) < len(indeg):
+		raise ValueError('%s: %d terms are part of a cycle' % (new['source'], len(indeg) - len(queue)))
+	keys.append(np.fromiter(( i * n + a for i, s in sets.items() for a in s ), dtype=np.int64))
+	keys = np.sort(np.concatenate(keys))
+	new['ancestors_ptr'] = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(keys // n, minlength=n), out=new['ancestors_ptr'][1:])
+	new['ancestors'] = (keys % n).astype(np.int32)
+	new['min_depth'] = mind
+	new['max_depth'] = maxd
+	return new
+
+def update_annotations(old, annot, new, diff=None):
+	"""
+	moves the annotation table annot of the ontology old to the ontology new and returns (table, report)
+	rows annotating an obsoleted term go to the term that took over its id (alternate id in new), if any, otherwise they are
+	added to the unresolved rows; the unresolved rows of annot whose GO id is known in new (directly or through alt_id) are
+	attached, after the other rows. Gene products keep their numbers, those of the attached rows that were not in annot
+	are numbered after them.
+	The implicit index of the new table is copied from annot except for the terms whose gene products may have changed.
+	report: { 'direct': { GO id: (added gene products, removed gene products) }, 'implicit': { ... } } for the sets that moved,
+	and 'resolved': the (gene product, GO id) of the attached unresolved rows
+	"""
+	if diff is None: diff = diff_ontologies(old, new)
+	if 'ancestors' not in new: update_ontology(old, new, diff)
+	before = GO.gene_product_index(old, annot)
+	n = new['nb_terms']
+	remap = _remap(old, new)
+	back = np.full(n, -1, dtype=np.int32) # index in old of the terms of new
+	back[remap[remap >= 0]] = np.flatnonzero(remap >= 0)
+	gone = np.flatnonzero(remap < 0)
+	for i in gone.tolist(): # merged terms
+		target = new['alt_id'].get(old['ids'][i])
+		if target is not None: remap[i] = new['index'][target]
+	term = remap[annot['term']]
+	keep = term >= 0
+	res = { key: value for key, value in annot.items() if not key.startswith('_') } # the indexes are rebuilt below
+	resolved, unresolved = _resolve(new, annot['unresolved'], res)
+	codes, names, desc, aliases = annot['evidence_codes'], annot['gp_names'], annot['gp_desc'], annot['gp_aliases']
+	unresolved += [ (annot['gp_ids'][g], old['ids'][t], codes[e], names[g], desc[g], aliases[g])
+		for g, t, e in zip(annot['gp'][~keep].tolist(), annot['term'][~keep].tolist(), annot['evidence'][~keep].tolist()) ]
+	res.update({ 'nb_terms': n, 'unresolved': unresolved, 'gp': np.concatenate([ annot['gp'][keep], resolved[0] ]),
+		'term': np.concatenate([ term[keep], resolved[1] ]), 'evidence': np.concatenate([ annot['evidence'][keep], resolved[2] ]) })
+	GO._index_rows(res)
+	nb_gp = res['nb_gp']
+	# terms whose gene products may have changed: the ancestors (in both releases) of the terms whose ancestors or
+	# direct annotations changed
+	merged = remap[gone][remap[gone] >= 0]
+	changed_old = np.array(sorted(set(gone.tolist()) | { old['index'][id] for id in diff['re-parented'] }), dtype=np.int32)
+	changed = GO._unique(np.concatenate([ _with_ancestors(new, np.concatenate([ [ new['index'][id] for id in diff['affected'] ], merged, resolved[1] ]).astype(np.int32)),
+		remap[_with_ancestors(old, changed_old)] ]))
+	changed = changed[changed >= 0]
+	is_changed = np.zeros(n, dtype=bool)
+	is_changed[changed] = True
+	# direct index, recomputed
+	order = np.lexsort((res['pair_gp'], res['pair_term']))
+	res['direct_ptr'] = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(res['pair_term'], minlength=n), out=res['direct_ptr'][1:])
+	res['direct_gp'] = res['pair_gp'][order]
+	# implicit index: copied for the unchanged terms, the changed ones get the gene products of their descendants
+	same = np.flatnonzero(~is_changed)
+	counts, gps = GO._gather(before['implicit_ptr'], before['implicit_gp'], back[same])
+	kept = np.repeat(same.astype(np.int64), counts) * nb_gp + gps
+	counts, anc = GO._gather(new['ancestors_ptr'], new['ancestors'], res['pair_term'])
+	targets = np.concatenate([ res['pair_term'], anc ]).astype(np.int64)
+	pair_gp = np.concatenate([ res['pair_gp'], np.repeat(res['pair_gp'], counts) ])
+	sel = is_changed[targets]
+	keys = np.concatenate([ kept, GO._unique(targets[sel] * nb_gp + pair_gp[sel]) ])
+	keys.sort()
+	res['implicit_ptr'] = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(keys // nb_gp, minlength=n), out=res['implicit_ptr'][1:])
+	res['implicit_gp'] = (keys % nb_gp).astype(np.int32)
+	# report
+	report = { key: _moved(old, before, key, new, res, changed, back, gone) for key in ('direct', 'implicit') }
+	report['resolved'] = resolved[3]
+	return res, report
+
+def _resolve(new, rows, res):
+	"""
+	attaches the unresolved rows (see GeneOntology._unresolved_row) whose GO id is known in the ontology new, directly or
+	through alt_id: their gene products and evidence codes are numbered in res after those already there (res gets copies of
+	the lists it shares with the old table)
+	returns ((gp, term, evidence) arrays of the attached rows, their (gene product, GO id)), and the rows still unresolved
+	"""
+	index, alt_id = new['index'], new['alt_id']
+	gp, term, evidence, attached, unresolved = [], [], [], [], []
+	for row in rows:
+		t = index.get(row[1], index.get(alt_id.get(row[1]), -1))
+		if t < 0:
+			unresolved.append(tuple(row))
+			continue
+		if not attached: # first attached row
+			for key in ('gp_ids', 'gp_names', 'gp_desc', 'gp_aliases', 'evidence_codes'): res[key] = list(res[key])
+			for key in ('gp_index', 'names'): res[key] = dict(res[key])
+		id, go_id, code, name, desc, aliases = row
+		g = res['gp_index'].get(id)
+		if g is None: # gene product annotated by unresolved rows only
+			g = res['gp_index'][id] = len(res['gp_ids'])
+			res['gp_ids'].append(id)
+			res['gp_names'].append(name)
+			res['gp_desc'].append(desc)
+			res['gp_aliases'].append(aliases)
+			res['names'][name] = id
+		if code not in res['evidence_codes']: res['evidence_codes'].append(code)
+		gp.append(g)
+		term.append(t)
+		evidence.append(res['evidence_codes'].index(code))
+		attached.append((id, go_id))
+	res['nb_gp'] = len(res['gp_ids'])
+	arrays = (np.array(gp, dtype=np.int32), np.array(term, dtype=np.int32), np.array(evidence, dtype=np.int8))
+	return arrays + (attached,), unresolved
+
+def _moved(old, before, key, new, after, terms, back, gone):
+	"""
+	{ GO id: (added gene products, removed gene products) } for the terms (of new) and the obsoleted terms (of old) whose
+	key ('direct' or 'implicit') set of gene products changed
+	"""
+	ptr, gp = key + '_ptr', key + '_gp'
+	ids = after['gp_ids'] # the gene products keep their numbers in the new table
+	moved = {}
+	for t in terms.tolist():
+		a = after[gp][after[ptr][t]:after[ptr][t+1]]
+		b = before[gp][before[ptr][back[t]]:before[ptr][back[t]+1]] if back[t] >= 0 else a[:0]
+		if len(a) == len(b) and (a == b).all(): continue
+		moved[new['ids'][t]] = ([ ids[g] for g in np.setdiff1d(a, b).tolist() ], [ ids[g] for g in np.setdiff1d(b, a).tolist() ])
+	for t in gone.tolist():
+		b = before[gp][before[ptr][t]:before[ptr][t+1]]
+		if len(b): moved[old['ids'][t]] = ([], [ ids[g] for g in b.tolist() ])
+	return moved
+
+def update_release(onto, annot, obo):
+	"""
+	parses the new release obo and moves onto and its annotation table annot (None if there is none) to it
+	returns (new ontology, new table, diff, report), the new ontology being frozen
+	"""
+	new = GO.load_ontology(obo)
+	diff = diff_ontologies(onto, new)
+	update_ontology(onto, new, diff)
+	report = None
+	if annot is not None:
+		annot, report = update_annotations(onto, annot, new, diff)
+	return GO.freeze_ontology(new), annot, diff, report
+
+def write_report(filename, diff, report=None):
+	"""
+	writes the diff between two releases and the gene product sets that moved as a tab separated text file
+	"""
+	with open(filename, 'w') as f:
+		f.write('# %s -> %s\n' % (diff['old'], diff['new']))
+		for id in diff['added']:
+			f.write('added\t%s\n' % id)
+		for id in diff['obsoleted']:
+			f.write('obsoleted\t%s\n' % id)
+		for id, (a, b) in sorted(diff['re-parented'].items()):
+			f.write('re-parented\t%s\t%s\t%s\n' % (id, ' '.join('%s:%s' % p for p in a), ' '.join('%s:%s' % p for p in b)))
+		for alt, (a, b) in sorted(diff['alt_id'].items()):
+			f.write('alt_id\t%s\t%s\t%s\n' % (alt, a or '-', b or '-'))
+		if report is None: return
+		for key in ('direct', 'implicit'):
+			for id, (added, removed) in sorted(report[key].items()):
+				f.write('%s\t%s\t+%d\t-%d\t%s\t%s\n' % (key, id, len(added), len(removed), ' '.join(added), ' '.join(removed)))
+		for gp, go_id in report['resolved']:
+			f.write('resolved\t%s\t%s\n' % (gp, go_id))
+
+
+def check_resolved():
+	"""
+	update_annotations gives the same annotations as a fresh parse of the new release when it adds a term that annotated rows
+	referred to: TEST_OBO without GO:0000009, then TEST_OBO, with TEST_GOA plus rows of GO:0000009 (one of a new gene product)
+	"""
+	stanza = GO.TEST_OBO[GO.TEST_OBO.index('[Term]\nid: GO:0000009'):GO.TEST_OBO.index('[Typedef]')]
+	goa = GO.TEST_GOA + 'DB\tP1\tgene1\t\tGO:0000009\tPMID:1\tIMP\t\tP\tprotein 1\tg1\tprotein\ttaxon:1\t20200101\tDB\n' \
+		'DB\tP4\tgene4\t\tGO:0000009\tPMID:1\tIDA\t\tP\tprotein 4\tg4\tprotein\ttaxon:1\t20200101\tDB\n'
+	with tempfile.TemporaryDirectory() as d:
+		obo, filename = GO._test_files(d)
+		with open(filename, 'w') as f: f.write(goa)
+		with open(obo, 'w') as f: f.write(GO.TEST_OBO.replace(stanza, ''))
+		old = GO.freeze_ontology(GO.load_ontology(obo))
+		annot = GO.load_annotations(old, filename)
+		assert len(annot['unresolved']) == 2
+		with open(obo, 'w') as f: f.write(GO.TEST_OBO)
+		new, res, diff, report = update_release(old, annot, obo)
+		fresh = GO.load_annotations(new, filename)
+	def rows(a):
+		return sorted(zip([ a['gp_ids'][g] for g in a['gp'].tolist() ], [ new['ids'][t] for t in a['term'].tolist() ],
+			[ a['evidence_codes'][e] for e in a['evidence'].tolist() ]))
+	def sets(a, key):
+		ptr = a[key + '_ptr']
+		return { new['ids'][t]: sorted(a['gp_ids'][g] for g in a[key + '_gp'][ptr[t]:ptr[t+1]].tolist()) for t in range(new['nb_terms']) }
+	assert rows(res) == rows(fresh) and res['unresolved'] == fresh['unresolved'] == []
+	for key in ('direct', 'implicit'):
+		assert sets(res, key) == sets(fresh, key), key
+	for key in ('gp_names', 'gp_desc', 'gp_aliases'):
+		assert dict(zip(res['gp_ids'], res[key])) == dict(zip(fresh['gp_ids'], fresh[key])), key
+	assert dict(res['names']) == dict(fresh['names'])
+	assert sorted(report['resolved']) == [ ('P1', 'GO:0000009'), ('P4', 'GO:0000009') ]
+	assert report['direct']['GO:0000009'] == ([ 'P1', 'P4' ], [])
+	return True
+
+
+if __name__ == "__main__":
+
+	print('GOUpdate lib tests')
+	print('Lignes non résolues rattachées à la nouvelle version :', check_resolved())
@@ -2,87 +2,781 @@
 # -*- coding: utf-8 -*-
 
 import TPGraphlib as gr # Graph library from part 1 of the project
+import gzip
+import itertools
 import math
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+from collections.abc import MutableMapping, Sequence
 from pprint import pprint
 
 
-def load_OBO(filename):
+EDGE_TYPES = ('is_a', 'part_of') # relationships loaded from the OBO file, edges store their index in this tuple
+
+# evidence codes by category, the names can be used in place of the codes in the evidence filters
+EVIDENCE_GROUPS = {
+	'experimental': ('EXP', 'IDA', 'IPI', 'IMP', 'IGI', 'IEP', 'HTP', 'HDA', 'HMP', 'HGI', 'HEP'),
+	'phylogenetic': ('IBA', 'IBD', 'IKR', 'IRD'),
+	'computational': ('ISS', 'ISO', 'ISA', 'ISM', 'IGC', 'RCA'),
+	'author': ('TAS', 'NAS'),
+	'curator': ('IC', 'ND'),
+	'electronic': ('IEA',),
+}
+
+
+def load_ontology(filename):
 	"""
-	parse the OBO file and returns the graph
+	parse the OBO file in a single pass and returns a compact ontology
 	obsolete terms are discarded
 	only is_a and part_of relationships are loaded
 
-	Extract of a file to be parsed:
-	[Term]
-	id: GO:0000028
-	name: ribosomal small subunit assembly
-	namespace: biological_process
-	def: "The aggregation, arrangement and bonding together of constituent RNAs and proteins to form the small ribosomal subunit." [GOC:jl]
-	subset: gosubset_prok
-	synonym: "30S ribosomal subunit assembly" NARROW [GOC:mah]
-	synonym: "40S ribosomal subunit assembly" NARROW [GOC:mah]
-	is_a: GO:0022618 ! ribonucleoprotein complex assembly
-	relationship: part_of GO:0042255 ! ribosome assembly
-	relationship: part_of GO:0042274 ! ribosomal small subunit biogenesis
+	Terms are numbered 0..n-1 in file order and both edge directions are kept as integer arrays (CSR):
+	parents of term i:  parents[parents_ptr[i]:parents_ptr[i+1]]   (child -> parent, as in load_OBO)
+	children of term i: children[children_ptr[i]:children_ptr[i+1]] (parent -> child, as in load_OBOMD)
+	parents_type / children_type hold the index in EDGE_TYPES of each edge.
+	namespace holds the index of the namespace of each term in namespace_names; definitions are not kept in memory, only
+	their position in the OBO file (def_offset, def_length), onto['namespaces'] and onto['defs'] read them as lists of strings.
+	onto['source'] is the absolute name of the OBO file, source_size and source_mtime_ns tell whether it changed since (the
+	positions of the definitions are then read again).
+	nb_stanzas counts the [Term] stanzas, obsolete terms included (nb_terms does not).
+	Use ontology_graph() to get the usual g['nodes']/g['edges'] graph from it.
 	"""
 
-	def parseTerm(lines):
+	def addRelationship(i, parent, t):
+		# a second relationship towards the same parent only updates the type of the first one (as with gr.add_edge)
+		if parent in seen:
+			etype[seen[parent]] = t
+		else:
+			seen[parent] = len(dst)
+			src.append(i)
+			dst.append(parent)
+			etype.append(t)
+
+	def parseTerm(lines, definition):
 		# search for obsolete
 		for l in lines:
 			if l.startswith('is_obsolete: true'): return
-		# otherwise create node
-		id = lines.pop(0)[4:].rstrip()
-		term = gr.add_node(g,id)
-		term['id'] = id
-		term['type'] = 'GOTerm'
+		# otherwise create term
+		id = lines[0][4:].rstrip()
+		i = len(ids)
+		ids.append(id)
+		name = namespace = ''
+		seen.clear()
 		for line in lines:
-			# attributes (name, namespace, def)
-			if line.startswith('name: '): term['name'] = line[6:]
-			elif line.startswith('namespace: '): term['namespace'] = line[11:]
-			elif line.startswith('def: '): term['def'] = line[5:]
-			elif line.startswith('alt_id: '): g['alt_id'][ line[8:] ] = id # alternate ids
+			# attributes (name, namespace), the definition is only located (see below)
+			if line.startswith('name: '): name = line[6:]
+			elif line.startswith('namespace: '): namespace = line[11:]
+			elif line.startswith('alt_id: '): alt_id[ line[8:] ] = id # alternate ids
 			# relationships
 			elif line.startswith('is_a:'): # is_a
-				parent = line[6:line.index('!')].rstrip()
-				e = gr.add_edge(g,id, parent)
-				e['type'] = 'is_a'
+				addRelationship(i, line[6:line.index('!')].rstrip(), 0)
 			elif line.startswith('relationship: part_of '): # part_of
 				line = line[line.index('GO:'):]
-				dest = line[:line.index(' ')]
-				e = gr.add_edge(g,id, dest)
-				e['type'] = 'part_of'
+				addRelationship(i, line[:line.index(' ')], 1)
+		names.append(name)
+		namespaces.append(codes.setdefault(namespace, len(codes)))
+		def_offset.append(definition[0])
+		def_length.append(definition[1])
 	#
-	g=gr.create_graph(directed=True, weighted=False)
-	g['alt_id'] = {} # alternate GO ids
-	with open(filename) as f:
-		line = f.readline().rstrip()
+	ids = []
+	names = []
+	namespaces = [] # code of the namespace of each term
+	codes = {} # namespace -> code
+	def_offset = [] # position of the definition of each term in the file
+	def_length = []
+	alt_id = {} # alternate GO ids
+	src = [] # child of each edge
+	dst = [] # parent of each edge, as an id until every term is known
+	etype = []
+	seen = {} # parents of the current term: position of the edge in dst
+	filename = os.path.abspath(filename) # the definitions are read from it later, whatever the working directory
+	with open(filename, 'rb') as f: # binary, to know the byte offsets of the definitions
+		st = os.fstat(f.fileno())
 		# skip header to reach 1st Term
-		while not line.startswith('[Term]'):
-			line = f.readline().rstrip()
+		pos = 0
+		stanzas = 0 # [Term] stanzas, obsolete terms included
+		for raw in f:
+			pos += len(raw)
+			if raw.startswith(b'[Term]'):
+				stanzas = 1
+				break
 		buff = []
-		line = f.readline()
-		stop = False
-		while line and not stop:
+		definition = (0, 0)
+		for raw in f:
 			# buffer lines until the next Term is found
-			line = line.rstrip()
-			# new Term
+			line = raw.decode('utf-8').rstrip()
 			if line.startswith('[Term]'):
-				# next Term found: create corresponding node and edges in parseTerm and empty buffer
-				parseTerm(buff)
-				buff=[]
-			# last Term
-			elif line.startswith('[Typedef]'):
-				parseTerm(buff)
-				stop=True
-			# or append to buffer
+				stanzas += 1
+				parseTerm(buff, definition)
+				buff = []
+				definition = (0, 0)
+			elif line.startswith('[Typedef]'): # last Term
+				break
+			elif line.startswith('def: '):
+				definition = (pos + 5, len(raw.rstrip()) - 5)
 			else:
 				buff.append(line)
-			line = f.readline()
+			pos += len(raw)
+		if buff:
+			parseTerm(buff, definition)
+	n = len(ids)
+	index = { id: i for i, id in enumerate(ids) }
+	# resolve parents, relationships towards unknown (e.g. obsolete) terms are dropped
+	keep = [ k for k in range(len(dst)) if dst[k] in index ]
+	child = np.array([ src[k] for k in keep ], dtype=np.int32)
+	parent = np.array([ index[dst[k]] for k in keep ], dtype=np.int32)
+	types = np.array([ etype[k] for k in keep ], dtype=np.int8)
+	onto = { 'type': 'ontology', 'source': filename, 'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns, 'nb_terms': n, 'nb_stanzas': stanzas, 'nb_edges': len(keep),
+		'ids': ids, 'index': index, 'names': names, 'alt_id': alt_id, 'namespace_names': list(codes),
+		'namespace': np.array(namespaces, dtype=np.int8), 'def_offset': np.array(def_offset, dtype=np.int64), 'def_length': np.array(def_length, dtype=np.int32) }
+	term_views(onto)
+	onto['parents_ptr'], onto['parents'], onto['parents_type'] = _csr(child, parent, n, types)
+	onto['children_ptr'], onto['children'], onto['children_type'] = _csr(parent, child, n, types)
+	onto['order'] = _node_order(onto)
+	return onto
+
+class _Interned(Sequence):
+	"""
+	read-only list of the values of codes in values (e.g. namespace of each term)
+	"""
+
+	def __init__(self, codes, values):
+		self.codes = codes
+		self.values = values
+
+	def __len__(self):
+		return len(self.codes)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice): return [ self.values[c] for c in self.codes[i].tolist() ]
+		return self.values[self.codes[i]]
+
+	def __iter__(self):
+		values = self.values
+		return ( values[c] for c in self.codes.tolist() )
+
+class _FileText(Sequence):
+	"""
+	read-only list of the definitions of the terms ids left in the OBO file filename, given their byte offsets and lengths,
+	each definition is read from the file when it is accessed, through a file kept open
+	size, mtime_ns: those of the file when the offsets were read, if the file changed since, the offsets of the definitions
+	of the same ids are read again from the file (see _definitions); this is checked once per access, so that a slice, an
+	iteration or take() over many definitions costs a single check
+	"""
+
+	def __init__(self, filename, offsets, lengths, ids, size, mtime_ns):
+		self.filename = filename
+		self.offsets = offsets
+		self.lengths = lengths
+		self.ids = ids
+		self.size = size
+		self.mtime_ns = mtime_ns
+		self.f = None # open file, see file()
+		self.pid = None # process that opened it (a forked process opens its own, not to share the file position)
+
+	def check(self):
+		st = os.stat(self.filename)
+		if (st.st_size, st.st_mtime_ns) != (self.size, self.mtime_ns):
+			self.offsets, self.lengths = _definitions(self.filename, self.ids)
+			self.size, self.mtime_ns = st.st_size, st.st_mtime_ns
+			self.close() # the file may have been replaced
+
+	def file(self):
+		if self.f is None or self.pid != os.getpid():
+			self.f = open(self.filename, 'rb')
+			self.pid = os.getpid()
+		return self.f
+
+	def close(self):
+		if self.f is not None and self.pid == os.getpid(): self.f.close()
+		self.f = None
+
+	def __del__(self):
+		self.close()
+
+	def __getstate__(self): # the open file is not copied
+		state = dict(self.__dict__)
+		state['f'] = state['pid'] = None
+		return state
+
+	def take(self, indices):
+		"""
+		definitions of the terms of indices, the file being checked once
+		"""
+		self.check()
+		return list(self.read(self.offsets[indices].tolist(), self.lengths[indices].tolist()))
+
+	def read(self, offsets, lengths):
+		f = self.file()
+		for offset, length in zip(offsets, lengths):
+			if not length:
+				yield ''
+			else:
+				f.seek(offset)
+				yield f.read(length).decode('utf-8')
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice): return self.take(np.arange(len(self))[i])
+		return self.take([ i ])[0]
+
+	def __iter__(self):
+		self.check()
+		return self.read(self.offsets.tolist(), self.lengths.tolist())
+
+TERM_VIEWS = ('namespaces', 'defs') # entries of the ontology that are views over its arrays, rebuilt by term_views
+
+def term_views(onto):
+	"""
+	(re)creates the list views onto['namespaces'] (namespace of each term) and onto['defs'] (definition of each term, read from
+	the OBO file on access) over the arrays of the ontology
+	"""
+	onto['namespaces'] = _Interned(onto['namespace'], onto['namespace_names'])
+	onto['defs'] = _FileText(onto['source'], onto['def_offset'], onto['def_length'], onto['ids'], onto['source_size'], onto['source_mtime_ns'])
+	return onto
+
+def _definitions(filename, ids):
+	"""
+	byte offsets and lengths of the definitions of the terms ids in the OBO file filename (0 for the terms it does not define)
+	"""
+	found = {}
+	id = None
+	pos = 0
+	with open(filename, 'rb') as f:
+		for raw in f:
+			if raw.startswith(b'[Typedef]'): break
+			if raw.startswith(b'[Term]'): id = None
+			elif raw.startswith(b'id: ') and id is None: id = raw[4:].decode('utf-8').rstrip()
+			elif raw.startswith(b'def: ') and id is not None: found[id] = (pos + 5, len(raw.rstrip()) - 5)
+			pos += len(raw)
+	offsets = np.array([ found.get(id, (0, 0))[0] for id in ids ], dtype=np.int64)
+	lengths = np.array([ found.get(id, (0, 0))[1] for id in ids ], dtype=np.int32)
+	return offsets, lengths
+
+def _csr(rows, cols, n, types=None):
+	"""
+	group the (rows[k], cols[k]) edges by row, keeping their relative order, and returns (ptr, cols) or (ptr, cols, types)
+	"""
+	order = np.argsort(rows, kind='stable')
+	ptr = np.zeros(n + 1, dtype=np.int32)
+	np.cumsum(np.bincount(rows, minlength=n), out=ptr[1:])
+	if types is None: return ptr, cols[order]
+	return ptr, cols[order], types[order]
+
+def _node_order(onto):
+	"""
+	order in which gr.add_node/gr.add_edge would have created the nodes: each term followed by its not yet seen parents
+	(the node order of the graphs formerly built by load_OBO and load_OBOMD, kept for the output of annotation.py)
+	"""
+	n = onto['nb_terms']
+	ptr = onto['parents_ptr']
+	seq = np.empty(n + len(onto['parents']), dtype=np.int32)
+	start = np.arange(n) + ptr[:-1] # position of each term in seq, its parents follow
+	seq[start] = np.arange(n)
+	mask = np.ones(len(seq), dtype=bool)
+	mask[start] = False
+	seq[mask] = onto['parents']
+	terms, first = np.unique(seq, return_index=True)
+	return terms[np.argsort(first)].astype(np.int32)
+
+
+class _TermView(MutableMapping):
+	"""
+	dict-like view over the terms of a compact ontology, and the gene products of an attached annotation table,
+	as expected by TPGraphlib in g['nodes'] or g['edges']
+	an entry is built on first access and kept, so that it can be updated in place;
+	other keys (e.g. nodes added with gr.add_node) are stored aside
+	subclasses define build(i), the entry of the i-th term, and build_gp(k), the entry of the k-th gene product
+	"""
+
+	def __init__(self, onto):
+		self.onto = onto
+		self.annot = None # annotation table, see attach_annotations
+		self.built = {} # entries already built
+		self.extra = {} # other nodes
+
+	def __getitem__(self, n):
+		if n in self.built: return self.built[n]
+		if n in self.extra: return self.extra[n]
+		if n in self.onto['index']:
+			entry = self.build(self.onto['index'][n])
+		elif self.annot is not None and n in self.annot['gp_index']:
+			entry = self.build_gp(self.annot['gp_index'][n])
+		else:
+			raise KeyError(n)
+		self.built[n] = entry
+		return entry
+
+	def __setitem__(self, n, value):
+		if n in self.onto['index'] or (self.annot is not None and n in self.annot['gp_index']): self.built[n] = value
+		else: self.extra[n] = value
+
+	def __delitem__(self, n):
+		if n not in self.extra: raise TypeError('ontology terms and annotated gene products cannot be removed (%s)' % n)
+		del self.extra[n]
+
+	def __contains__(self, n):
+		return n in self.onto['index'] or n in self.extra or (self.annot is not None and n in self.annot['gp_index'])
+
+	def __iter__(self):
+		ids = self.onto['ids']
+		for i in self.onto['order']:
+			yield ids[i]
+		if self.annot is not None:
+			yield from self.annot['gp_ids']
+		yield from list(self.extra)
+
+	def __len__(self):
+		return self.onto['nb_terms'] + (self.annot['nb_gp'] if self.annot is not None else 0) + len(self.extra)
+
+class _TermAttributes(MutableMapping):
+	"""
+	dict-like attributes of a term (id, type, name, namespace, def) read from the ontology arrays when accessed,
+	attributes that are set or removed are recorded aside
+	"""
+	__slots__ = ('onto', 'i', 'changes')
+	removed = object()
+
+	def __init__(self, onto, i):
+		self.onto = onto
+		self.i = i
+		self.changes = None
+
+	def stored(self, key):
+		onto, i = self.onto, self.i
+		if key == 'id': return onto['ids'][i]
+		if key == 'type': return 'GOTerm'
+		if key == 'name': return onto['names'][i]
+		if key == 'namespace': return onto['namespace_names'][onto['namespace'][i]]
+		if key == 'def': return onto['defs'][i] # '' when the term has no definition
+		return ''
+
+	def __getitem__(self, key):
+		if self.changes is not None and key in self.changes:
+			value = self.changes[key]
+		else:
+			value = self.stored(key)
+			if value == '': raise KeyError(key) # attribute absent from the OBO file
+		if value is self.removed: raise KeyError(key)
+		return value
+
+	def __setitem__(self, key, value):
+		if self.changes is None: self.changes = {}
+		self.changes[key] = value
+
+	def __delitem__(self, key):
+		self[key] # KeyError if absent
+		self[key] = self.removed
+
+	def __iter__(self):
+		for key in ('id', 'type', 'name', 'namespace', 'def'):
+			if key in self: yield key
+		if self.changes is not None:
+			for key, value in self.changes.items():
+				if value is not self.removed and key not in ('id', 'type', 'name', 'namespace', 'def'): yield key
+
+	def __contains__(self, key):
+		try:
+			self[key]
+		except KeyError:
+			return False
+		return True
+
+	def __len__(self):
+		return sum(1 for _ in self)
+
+	def __repr__(self):
+		return repr(dict(self))
+
+class _TermNodes(_TermView):
+	def build(self, i):
+		return _TermAttributes(self.onto, i)
+
+	def build_gp(self, k):
+		annot = self.annot
+		return { 'id': annot['gp_ids'][k], 'type': 'GeneProduct', 'name': annot['gp_names'][k], 'desc': annot['gp_desc'][k], 'aliases': annot['gp_aliases'][k] }
+
+class _TermEdges(_TermView):
+	def __init__(self, onto, reverse=False):
+		_TermView.__init__(self, onto)
+		self.key = 'children' if reverse else 'parents'
+
+	def build(self, i):
+		onto = self.onto
+		ptr = onto[self.key + '_ptr']
+		ids = onto['ids']
+		edges = { ids[j]: { 'type': EDGE_TYPES[t] } for j, t in zip(onto[self.key][ptr[i]:ptr[i+1]].tolist(), onto[self.key + '_type'][ptr[i]:ptr[i+1]].tolist()) }
+		if self.key == 'children' and self.annot is not None: # GOTerm -> gene product
+			annot = self.annot
+			ptr = annot['term_rows_ptr']
+			self.add_annotations(edges, annot['term_rows'][ptr[i]:ptr[i+1]], annot['gp'], annot['gp_ids'])
+		return edges
+
+	def build_gp(self, k):
+		edges = {}
+		if self.key == 'parents': # gene product -> GOTerm
+			annot = self.annot
+			ptr = annot['gp_rows_ptr']
+			self.add_annotations(edges, annot['gp_rows'][ptr[k]:ptr[k+1]], annot['term'], self.onto['ids'])
+		return edges
+
+	def add_annotations(self, edges, rows, targets, ids):
+		codes = self.annot['evidence_codes']
+		for r in rows.tolist():
+			n = ids[int(targets[r])]
+			if n not in edges: edges[n] = { 'type': 'annotation', 'evidence-codes': [] }
+			edges[n]['evidence-codes'].append( codes[self.annot['evidence'][r]] )
+
+
+def ontology_graph(onto, reverse=False):
+	"""
+	returns a TPGraphlib graph over the compact ontology onto (no copy of the terms or edges)
+	edges go from child to parent, or from parent to child when reverse is True
+	nodes and edges added afterwards (e.g. by load_GOA) only belong to the returned graph
+	"""
+	g = gr.create_graph(directed=True, weighted=False)
+	g['nodes'] = _TermNodes(onto)
+	g['edges'] = _TermEdges(onto, reverse)
+	g['nb_nodes'] = onto['nb_terms']
+	g['nb_edges'] = onto['nb_edges']
+	g['alt_id'] = onto['alt_id'] # alternate GO ids
+	g['ontology'] = onto
+	g['reverse'] = reverse
 	return g
 
-def load_GOA(go, filename):
+def compact_ontology_graph(onto, annot=None, reverse=False):
+	"""
+	returns the compact form (gr.compact_graph) of the graph ontology_graph(onto, reverse) annotated by annot, built
+	directly from the arrays of onto and annot: terms are numbered as in onto, gene products follow them
+	edge types index EDGE_TYPES + ('annotation',), node types ('GOTerm', 'GeneProduct')
+	"""
+	n = onto['nb_terms']
+	nb_gp = annot['nb_gp'] if annot is not None else 0
+	key = 'children' if reverse else 'parents'
+	rows = [ np.repeat(np.arange(n, dtype=np.int32), np.diff(onto[key + '_ptr'])) ]
+	cols = [ onto[key] ]
+	types = [ onto[key + '_type'] ]
+	if annot is not None: # gene product -> term, or term -> gene product
+		gps = annot['pair_gp'] + n
+		src, dst = (annot['pair_term'], gps) if reverse else (gps, annot['pair_term'])
+		order = np.argsort(src, kind='stable')
+		rows.append(src[order])
+		cols.append(dst[order])
+		types.append(np.full(len(src), len(EDGE_TYPES), dtype=np.int8))
+	ptr, targets, edge_types = _csr(np.concatenate(rows), np.concatenate(cols).astype(np.int32), n + nb_gp, np.concatenate(types).astype(np.int16))
+	names = list(onto['ids'])
+	index = dict(onto['index'])
+	if annot is not None:
+		names.extend(annot['gp_ids'])
+		index.update( (id, k + n) for k, id in enumerate(annot['gp_ids']) )
+	g = { 'compact': True, 'directed': True, 'weighted': False, 'weight_attribute': None,
+		'nb_nodes': n + nb_gp, 'nb_edges': len(targets), 'names': names, 'index': index,
+		'ptr': ptr.astype(np.int64), 'targets': targets, 'weights': None,
+		'edge_attribute': 'type', 'edge_types': edge_types, 'edge_type_names': list(EDGE_TYPES) + [ 'annotation' ],
+		'node_attribute': 'type', 'node_types': np.repeat(np.array([0, 1], dtype=np.int16), [ n, nb_gp ]), 'node_type_names': [ 'GOTerm', 'GeneProduct' ],
+		'ontology': onto, 'annotations': annot, 'reverse': reverse }
+	for v in g.values():
+		if isinstance(v, np.ndarray): v.flags.writeable = False
+	return g
+
+def node_attributes(go, u):
+	"""
+	attributes of the node u of go, graph built by ontology_graph or its compact form (compact_ontology_graph)
+	on other compact graphs (gr.compact_graph), only the id and the type of u are known
+	"""
+	if not gr.is_compact(go): return go['nodes'][u]
+	if 'ontology' not in go:
+		attributes = { 'id': u }
+		code = int(go['node_types'][go['index'][u]]) if go['node_types'] is not None else -1
+		if code >= 0: attributes[go['node_attribute']] = go['node_type_names'][code]
+		return attributes
+	onto = go['ontology']
+	if u in onto['index']: return _TermAttributes(onto, onto['index'][u])
+	annot = go['annotations']
+	k = annot['gp_index'][u]
+	return { 'id': annot['gp_ids'][k], 'type': 'GeneProduct', 'name': annot['gp_names'][k], 'desc': annot['gp_desc'][k], 'aliases': annot['gp_aliases'][k] }
+
+def _has_node(go, u):
+	return u in go['index'] if gr.is_compact(go) else u in go['nodes']
+
+def load_OBO(filename, onto=None):
+	"""
+	parse the OBO file and returns the graph
+	obsolete terms are discarded
+	only is_a and part_of relationships are loaded
+
+	Extract of a file to be parsed:
+	[Term]
+	id: GO:0000028
+	name: ribosomal small subunit assembly
+	namespace: biological_process
+	def: "The aggregation, arrangement and bonding together of constituent RNAs and proteins to form the small ribosomal subunit." [GOC:jl]
+	subset: gosubset_prok
+	synonym: "30S ribosomal subunit assembly" NARROW [GOC:mah]
+	synonym: "40S ribosomal subunit assembly" NARROW [GOC:mah]
+	is_a: GO:0022618 ! ribonucleoprotein complex assembly
+	relationship: part_of GO:0042255 ! ribosome assembly
+	relationship: part_of GO:0042274 ! ribosomal small subunit biogenesis
+
+	onto: ontology already parsed by load_ontology, so that load_OBO and load_OBOMD can share a single parse of the file
+	"""
+	if onto is None: onto = load_ontology(filename)
+	return ontology_graph(onto)
+
+_GAF_TERMS = None # (index, alt_id) of the ontology, in the worker processes of load_annotations
+
+def _gaf_worker(index, alt_id):
+	global _GAF_TERMS
+	_GAF_TERMS = (index, alt_id)
+
+def _gaf_table(lines, index, alt_id):
+	"""
+	rows of the GAF lines, numbered within these lines: GO ids resolved to term indices (directly or through alt_id), gene
+	products and evidence codes numbered in order of first appearance; rows whose GO id is unknown are only listed in 'unresolved'
+	returns { 'gp', 'term', 'evidence' (arrays, one value per row), 'gp_ids', 'codes' (distinct values), 'first_names' (column 3
+	of the first row of each gene product), 'names', 'desc', 'aliases' (columns 3, 10 and 11 of its last row), 'unresolved' }
+	"""
+	rows = [ line.rstrip('\r\n').split('\t') for line in lines if line and not line.startswith('!') and line.strip() ]
+	distinct, go_inv, _ = _first_occurrences([ r[4] for r in rows ])
+	resolved = np.array([ index.get(g, index.get(alt_id.get(g), -1)) for g in distinct ], dtype=np.int32)
+	term = resolved[go_inv]
+	unresolved = [ _unresolved_row(rows[r]) for r in np.flatnonzero(term < 0).tolist() ]
+	if unresolved:
+		keep = np.flatnonzero(term >= 0)
+		term = term[keep]
+		rows = [ rows[r] for r in keep.tolist() ]
+	gp_ids, gp, first = _first_occurrences([ r[1] for r in rows ])
+	last = np.full(len(gp_ids), -1, dtype=np.int64) # gene product attributes come from its last row
+	np.maximum.at(last, gp, np.arange(len(gp)))
+	last = [ rows[r] for r in last.tolist() ]
+	codes, evidence, _ = _first_occurrences([ r[6] for r in rows ])
+	return { 'gp': gp, 'term': term, 'evidence': evidence.astype(np.int8), 'gp_ids': gp_ids, 'codes': codes,
+		'first_names': [ rows[r][2] for r in first.tolist() ], 'names': [ r[2] for r in last ], 'desc': [ r[9] for r in last ],
+		'aliases': [ r[10] for r in last ], 'unresolved': unresolved }
+
+def _unresolved_row(cols):
+	"""
+	(gene product, GO id, evidence code, name, desc, aliases) of a GAF row that could not be attached, enough to attach it
+	later to a release that knows its GO id (see GOUpdate.update_annotations)
+	"""
+	return (cols[1], cols[4], cols[6], cols[2], cols[9], cols[10])
+
+def _parse_gaf_chunk(chunk):
+	"""
+	process pool worker: table (see _gaf_table) of the bytes [start, end) of a file, or of the data of a decompressed chunk
+	"""
+	if isinstance(chunk, bytes):
+		data = chunk
+	else:
+		filename, start, end = chunk
+		with open(filename, 'rb') as f:
+			f.seek(start)
+			data = f.read(end - start)
+	return _gaf_table(data.decode('utf-8').split('\n'), *_GAF_TERMS)
+
+def _gaf_chunks(filename, chunk_size):
+	"""
+	split the GAF file into chunks of about chunk_size bytes ending on line boundaries:
+	(filename, start, end) byte ranges for a plain file, decompressed data for a gzip file
+	"""
+	with open(filename, 'rb') as f:
+		gz = f.read(2) == b'\x1f\x8b'
+	if gz:
+		with gzip.open(filename, 'rb') as f:
+			rest = b''
+			for block in iter(lambda: f.read(chunk_size), b''):
+				block = rest + block
+				cut = block.rfind(b'\n') + 1
+				rest = block[cut:]
+				yield block[:cut]
+			if rest: yield rest
+		return
+	size = os.path.getsize(filename)
+	start = 0
+	with open(filename, 'rb') as f:
+		while start < size:
+			f.seek(min(size, start + chunk_size))
+			f.readline() # a chunk ends after a full line
+			end = min(size, f.tell())
+			yield (filename, start, end)
+			start = end
+
+def load_annotations(onto, filename, processes=1, chunk_size=4 << 20):
+	"""
+	parse GOA file into a compact annotation table over the terms of the ontology onto (see load_GOA for the file format)
+
+	Gene products are numbered in order of appearance and each resolved row of the file is kept in the gp, term and evidence
+	arrays (gene product index, term index, index in evidence_codes). gp_rows/term_rows group the rows by gene product and by
+	term (CSR, file order kept). Rows whose GO term is unknown, even through alt_id, are listed in 'unresolved' (see
+	_unresolved_row and unresolved_report).
+	processes: when greater than 1 (None: one per CPU), the file is split into chunks of chunk_size bytes parsed by a pool of
+	processes (forked when possible, they share the ontology index), each one returns the integer arrays of its rows and the
+	table of its distinct gene products, merged in file order
+	the file may be gzip compressed
+	"""
+	if processes is None or processes > 1:
+		ctx = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing
+		with ctx.Pool(processes, _gaf_worker, (onto['index'], onto['alt_id'])) as pool:
+			parts = list(pool.imap(_parse_gaf_chunk, _gaf_chunks(filename, chunk_size)))
+	else:
+		with gr.open_text(filename) as f:
+			parts = [ _gaf_table(f, onto['index'], onto['alt_id']) ]
+	return _annotation_table(onto, filename, parts)
+
+def _first_occurrences(values):
+	"""
+	numbers the distinct values in order of first appearance, returns (distinct values, number of each value, first position of each distinct value)
+	"""
+	numbers = {}
+	inverse = np.fromiter((numbers.setdefault(v, len(numbers)) for v in values), dtype=np.int32, count=len(values))
+	first = np.full(len(numbers), len(values), dtype=np.int64)
+	np.minimum.at(first, inverse, np.arange(len(values)))
+	return list(numbers), inverse, first
+
+def _annotation_table(onto, filename, parts):
+	"""
+	builds the annotation table from the tables of consecutive parts of the file (see _gaf_table): gene products and evidence
+	codes are numbered again in order of first appearance in the whole file
+	"""
+	numbers = {} # gene product -> index
+	first_names = []
+	last_names, desc, aliases = [], [], []
+	codes = {}
+	gp, term, evidence, unresolved = [], [], [], []
+	for p in parts:
+		m = np.fromiter(( numbers.setdefault(id, len(numbers)) for id in p['gp_ids'] ), dtype=np.int32, count=len(p['gp_ids']))
+		seen = len(first_names)
+		added = len(numbers) - seen
+		first_names.extend( p['first_names'][k] for k in np.flatnonzero(m >= seen).tolist() )
+		for l in (last_names, desc, aliases): l.extend([ None ] * added)
+		for k, g in enumerate(m.tolist()): # the last part where a gene product appears gives its attributes
+			last_names[g] = p['names'][k]
+			desc[g] = p['desc'][k]
+			aliases[g] = p['aliases'][k]
+		e = np.array([ codes.setdefault(c, len(codes)) for c in p['codes'] ], dtype=np.int8)
+		gp.append(m[p['gp']])
+		term.append(p['term'])
+		evidence.append(e[p['evidence']])
+		unresolved.extend(p['unresolved'])
+	gp_ids = list(numbers)
+	names = {} # gene names or gene product names (column 3)
+	for k, name in enumerate(first_names):
+		names[name] = gp_ids[k]
+	annot = { 'type': 'annotations', 'source': filename, 'nb_gp': len(gp_ids), 'nb_terms': onto['nb_terms'],
+		'gp_ids': gp_ids, 'gp_index': { id: k for k, id in enumerate(gp_ids) },
+		'gp_names': last_names, 'gp_desc': desc, 'gp_aliases': aliases,
+		'names': names, 'evidence_codes': list(codes), 'unresolved': unresolved,
+		'gp': np.concatenate(gp).astype(np.int32), 'term': np.concatenate(term).astype(np.int32), 'evidence': np.concatenate(evidence).astype(np.int8) }
+	_index_rows(annot)
+	gene_product_index(onto, annot)
+	return annot
+
+def unresolved_report(annot):
+	"""
+	aggregated report of the rows that could not be attached: { GO id: (number of rows, number of gene products) }
+	"""
+	rows = {}
+	gps = {}
+	for id, go_id, *row in annot['unresolved']:
+		rows[go_id] = rows.get(go_id, 0) + 1
+		gps.setdefault(go_id, set()).add(id)
+	return { go_id: (rows[go_id], len(gps[go_id])) for go_id in rows }
+
+def _index_rows(annot):
+	"""
+	CSR indexes of the annotation rows by gene product and by term, and distinct (gene product, term) pairs
+	each pair carries the evidence codes of its rows as a bitmask (bit b set for annot['evidence_codes'][b])
+	"""
+	if len(annot['evidence_codes']) > 64:
+		raise ValueError('%s: more than 64 evidence codes' % annot['source'])
+	rows = np.arange(len(annot['gp']), dtype=np.int32)
+	annot['gp_rows_ptr'], annot['gp_rows'] = _csr(annot['gp'], rows, annot['nb_gp'])
+	annot['term_rows_ptr'], annot['term_rows'] = _csr(annot['term'], rows, annot['nb_terms'])
+	key = annot['gp'].astype(np.int64) * annot['nb_terms'] + annot['term']
+	order = np.argsort(key, kind='stable')
+	key = key[order]
+	start = np.flatnonzero(np.concatenate([ [True], key[1:] != key[:-1] ])) if len(key) else np.zeros(0, dtype=np.int64)
+	bits = np.left_shift(np.uint64(1), annot['evidence'][order].astype(np.uint64))
+	annot['pair_gp'] = (key[start] // annot['nb_terms']).astype(np.int32)
+	annot['pair_term'] = (key[start] % annot['nb_terms']).astype(np.int32)
+	annot['pair_evidence'] = np.bitwise_or.reduceat(bits, start) if len(start) else np.zeros(0, dtype=np.uint64)
+	annot['nb_pairs'] = len(start)
+	return annot
+
+def attach_annotations(go, annot):
+	"""
+	add the gene products of the annotation table annot to the graph go built by ontology_graph
+	gene products and their edges are read from the table when first accessed
+	"""
+	if go['edges'].annot is not None:
+		raise ValueError('graph already annotated by %s, build another graph with ontology_graph()' % go['annotations']['source'])
+	go['nodes'].annot = annot
+	go['edges'].annot = annot
+	go['annotations'] = annot
+	go['names'] = annot['names'] # gene names or gene product names (column 3)
+	go['nb_nodes'] += annot['nb_gp']
+	go['nb_edges'] += annot['nb_pairs']
+	return go
+
+def freeze_ontology(onto):
+	"""
+	computes the indexes derived from the ontology alone (topological order, ancestors, depths) and makes its arrays read-only
+	a frozen ontology is never modified afterwards, so that it can be shared by several annotation tables, threads or forked
+	workers (its pages then stay shared copy-on-write)
+	"""
+	topological_order(onto)
+	ancestor_closure(onto)
+	term_depths(onto)
+	for v in onto.values():
+		if isinstance(v, np.ndarray): v.flags.writeable = False
+	onto['frozen'] = True
+	return onto
+
+def annotation_store(onto):
+	"""
+	returns a store of annotation tables (e.g. one per species) attached to the single ontology onto, which gets frozen
+
+	store = annotation_store(load_ontology('go.obo'))
+	add_annotations(store, 'fly', '17.D_melanogaster.goa')
+	go = species_graph(store, 'fly')
+	Each table keeps its own gene products and propagation caches, and can be released independently.
+	"""
+	return { 'ontology': freeze_ontology(onto), 'tables': {} }
+
+def add_annotations(store, name, annot):
+	"""
+	adds to the store, under name, the annotation table annot (load_annotations, GOSnapshot.load_cached_annotations)
+	or the table parsed from annot when it is a GOA file name; returns the table
+	"""
+	onto = store['ontology']
+	if isinstance(annot, str): annot = load_annotations(onto, annot)
+	if annot['nb_terms'] != onto['nb_terms']:
+		raise ValueError('annotations %s were not built on the ontology %s' % (annot['source'], onto['source']))
+	store['tables'][name] = annot
+	return annot
+
+def release_annotations(store, name):
+	"""
+	removes the table name from the store and returns it, its memory is freed once the graphs built on it are dropped
+	"""
+	return store['tables'].pop(name)
+
+def species_graph(store, name, reverse=False):
+	"""
+	returns the graph (see ontology_graph) of the ontology annotated by the table name of the store
+	the ontology is shared with the graphs of the other tables and is not modified
+	"""
+	go = ontology_graph(store['ontology'], reverse)
+	return attach_annotations(go, store['tables'][name])
+
+def load_GOA(go, filename, processes=1):
 	"""
 	parse GOA file and add annotated gene products to previsouly loaded graph go
+	processes: number of processes parsing the file (see load_annotations), None for one per CPU
 
 	Extract of a file to be parsed:
 	!gaf-version: 2.1
@@ -95,41 +789,10 @@ def load_GOA(go, filename):
 	             id    name        go_id               evidence-codes                     desc                           aliases
 	"""
 
-	names = {}
-	go['names'] = names # gene names or gene product names (column 3)
-	with open(filename) as f:
-		line = f.readline()
-		while line:
-			if not line.startswith('!'):
-				cols = line.rstrip().split('\t')
-				id = cols[1]
-				go_id = cols[4]
-				if go_id not in go['nodes']: # GOTerm not found search alternate ids
-					if go_id in go['alt_id']: # success
-						go_id = go['alt_id'][go_id] # replace term
-					else: # warn user
-						print('Warning: could not attach a gene product (%s) to a non existing GO Term (%s)' % (id, go_id))
-				if go_id in go['nodes']:
-					# create node for gene product if not already present
-					if id not in go['nodes']:
-						g = gr.add_node(go,id)
-						g['id'] = id
-						g['type'] = 'GeneProduct'
-						names[cols[2]] = id
-					# create or update gene product attributes
-					gp = go['nodes'][id]
-					gp['name'] = cols[2]
-					gp['desc'] = cols[9]
-					gp['aliases'] = cols[10]
-					# attach gene product to GOTerm
-					go_term = go['nodes'][go_id]
-					e = gr.add_edge(go, id, go_id)
-					e['type'] = 'annotation'
-					if 'evidence-codes' not in e: e['evidence-codes'] = []
-					e['evidence-codes'].append( cols[6] )
-				else: # go_id or alt_id not found in GOTerms
-					print('Error: could not attach a gene product (%s) to non existing GO Term (%s)' % (id, go_id))
-			line = f.readline()
+	annot = load_annotations(go['ontology'], filename, processes)
+	for go_id, (rows, gps) in sorted(unresolved_report(annot).items()):
+		print('Warning: could not attach %d gene products (%d annotations) to a non existing GO Term (%s)' % (gps, rows, go_id))
+	attach_annotations(go, annot)
 
 def load_GOAMD(go, filename):
 	"""
@@ -145,51 +808,11 @@ def load_GOAMD(go, filename):
 	    0        1       2   3       4             5          6        7      8             9                              10
 	             id    name        go_id               evidence-codes                     desc                           aliases
 	"""
-	nbgp = 0
-	erreurgp = 0
-	names = {}
-	go['names'] = names # gene names or gene product names (column 3)
-	with open(filename) as f:
-		line = f.readline()
-		while line:
-			if not line.startswith('!'):
-				cols = line.rstrip().split('\t')
-				id = cols[1]
-				go_id = cols[4]
-				if go_id not in go['nodes']: # GOTerm not found search alternate ids
-					if go_id in go['alt_id']: # success
-						go_id = go['alt_id'][go_id] # replace term
-					else: # warn user
-						print('Warning: could not attach a gene product (%s) to a non existing GO Term (%s)' % (id, go_id))
-						erreurgp = erreurgp + 1
-				if go_id in go['nodes']:
-					# create node for gene product if not already present
-					if id not in go['nodes']:
-						nbgp = nbgp + 1
-						g = gr.add_node(go,id)
-						g['id'] = id
-						g['type'] = 'GeneProduct'
-						names[cols[2]] = id
-					# create or update gene product attributes
-					gp = go['nodes'][id]
-					gp['name'] = cols[2]
-					gp['desc'] = cols[9]
-					gp['aliases'] = cols[10]
-					# attach gene product to GOTerm
-					go_term = go['nodes'][go_id]
-					e = gr.add_edge(go, go_id, id)
-
-
-					e['type'] = 'annotation'
-					if 'evidence-codes' not in e: e['evidence-codes'] = []
-					e['evidence-codes'].append( cols[6] )
-				else: # go_id or alt_id not found in GOTerms
-					print('Error: could not attach a gene product (%s) to non existing GO Term (%s)' % (id, go_id))
-					erreurgp = erreurgp + 1
-			line = f.readline()
-	print(nbgp, erreurgp)
-
-def load_OBOMD(filename):#Charge la GeneOntology avec les arc inversés (utile pour la fonction Max_Depth)
+
+	load_GOA(go, filename) # the edges go from GOTerm to gene product when go was built by load_OBOMD
+	print(go['annotations']['nb_gp'], len(go['annotations']['unresolved'])) # gene products, rows that could not be attached
+
+def load_OBOMD(filename, onto=None):#Charge la GeneOntology avec les arc inversés (utile pour la fonction Max_Depth)
 	"""
 	parse the OBO file and returns the graph
 	obsolete terms are discarded
@@ -207,67 +830,269 @@ def load_OBOMD(filename):#Charge la GeneOntology avec les arc inversés (utile p
 	is_a: GO:0022618 ! ribonucleoprotein complex assembly
 	relationship: part_of GO:0042255 ! ribosome assembly
 	relationship: part_of GO:0042274 ! ribosomal small subunit biogenesis
+
+	onto: ontology already parsed by load_ontology, so that load_OBO and load_OBOMD can share a single parse of the file
 	"""
+	if onto is None: onto = load_ontology(filename)
+	print(onto['nb_stanzas'] - 1) # as the former parser: [Term] stanzas after the first one, obsolete terms included
+	return ontology_graph(onto, reverse=True)
 
-	def parseTerm(lines):
-		# search for obsolete
-		for l in lines:
-			if l.startswith('is_obsolete: true'): return
-		# otherwise create node
-		id = lines.pop(0)[4:].rstrip()
-		term = gr.add_node(g,id)
-		term['id'] = id
-		term['type'] = 'GOTerm'
-		for line in lines:
-			# attributes (name, namespace, def)
-			if line.startswith('name: '): term['name'] = line[6:]
-			elif line.startswith('namespace: '): term['namespace'] = line[11:]
-			elif line.startswith('def: '): term['def'] = line[5:]
-			elif line.startswith('alt_id: '): g['alt_id'][ line[8:] ] = id # alternate ids
-			# relationships
-			elif line.startswith('is_a:'): # is_a
-				parent = line[6:line.index('!')].rstrip()
-				e = gr.add_edge(g,parent, id)#ordre inversé
-				e['type'] = 'is_a'
-			elif line.startswith('relationship: part_of '): # part_of
-				line = line[line.index('GO:'):]
-				dest = line[:line.index(' ')]
-				e = gr.add_edge(g,dest ,id)#ordre inversé
-				e['type'] = 'part_of'
-	#
-	nbgo = 0
-	g=gr.create_graph(directed=True, weighted=False)
-	g['alt_id'] = {} # alternate GO ids
-	with open(filename) as f:
-		line = f.readline().rstrip()
-		# skip header to reach 1st Term
-		while not line.startswith('[Term]'):
-			line = f.readline().rstrip()
-		buff = []
-		line = f.readline()
-		stop = False
-		while line and not stop:
-			# buffer lines until the next Term is found
-			line = line.rstrip()
-			# new Term
-			if line.startswith('[Term]'):
-				nbgo = nbgo + 1
-				# next Term found: create corresponding node and edges in parseTerm and empty buffer
-				parseTerm(buff)
-				buff=[]
-			# last Term
-			elif line.startswith('[Typedef]'):
-				parseTerm(buff)
-				stop=True
-			# or append to buffer
-			else:
-				buff.append(line)
-			line = f.readline()
-	print(nbgo)
-	return g
+def topological_order(onto):
+	"""
+	returns the terms ordered so that each term comes after all its parents (reverse postorder of an iterative depth-first
+	search from the roots, gr.dfs_csr, over the parent -> child edges)
+	computed once and kept in onto['topo'], raise ValueError if the relationships contain a cycle
+	"""
+	if 'topo' in onto: return onto['topo']
+	roots = np.flatnonzero(np.diff(onto['parents_ptr']) == 0)
+	res = gr.dfs_csr(onto['children_ptr'], onto['children'], roots.tolist())
+	if not res['acyclic']:
+		sizes = np.bincount(res['scc'])
+		raise ValueError('%s: %d terms are part of a cycle' % (onto['source'], int(sizes[sizes > 1].sum())))
+	onto['topo'] = res['topo']
+	return onto['topo']
+
+def ancestor_closure(onto):
+	"""
+	computes once the ancestors (is_a and part_of, transitively, the term itself excluded) of every term
+	terms are processed in topological order so that the ancestors of a term are the union of its parents and their ancestors
+	ancestors of term i: onto['ancestors'][onto['ancestors_ptr'][i]:onto['ancestors_ptr'][i+1]], sorted
+	"""
+	if 'ancestors' in onto: return onto
+	onto['ancestors_ptr'], onto['ancestors'] = _closure(onto, onto['parents_ptr'], onto['parents'])
+	return onto
+
+def _closure(onto, ptr, parents):
+	"""
+	(ptr, ancestors) CSR of the transitive closure of the (ptr, parents) CSR of the parents of each term, sorted ancestors
+	"""
+	n = onto['nb_terms']
+	ptr = ptr.tolist()
+	parents = parents.tolist()
+	anc = [ None ] * n
+	for i in topological_order(onto).tolist():
+		s = set(parents[ptr[i]:ptr[i+1]])
+		for j in parents[ptr[i]:ptr[i+1]]:
+			s |= anc[j]
+		anc[i] = s
+	counts = np.array([ len(s) for s in anc ], dtype=np.int64)
+	anc_ptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(counts, out=anc_ptr[1:])
+	return anc_ptr, np.fromiter(itertools.chain.from_iterable(map(sorted, anc)), dtype=np.int32, count=int(anc_ptr[-1]))
+
+def _gather(ptr, values, rows):
+	"""
+	concatenation of the CSR rows values[ptr[r]:ptr[r+1]] for r in rows, returns (number of values per row, values)
+	"""
+	rows = np.asarray(rows, dtype=np.int64)
+	starts = ptr[rows].astype(np.int64)
+	counts = ptr[rows + 1] - starts
+	ends = np.cumsum(counts)
+	idx = np.arange(ends[-1] if len(ends) else 0, dtype=np.int64) + np.repeat(starts - ends + counts, counts)
+	return counts, values[idx]
+
+def _unique(a):
+	"""
+	sorted unique values of the integer array a (sort based, faster than np.unique on large arrays of keys)
+	"""
+	a = np.sort(a)
+	if len(a):
+		keep = np.empty(len(a), dtype=bool)
+		keep[0] = True
+		np.not_equal(a[1:], a[:-1], out=keep[1:])
+		a = a[keep]
+	return a
+
+def _term_index(onto, term):
+	return term if isinstance(term, (int, np.integer)) else onto['index'][term]
+
+def ancestors(onto, term):
+	"""
+	returns the sorted indices of the ancestors of term (GO id or index), see ancestor_closure
+	"""
+	ancestor_closure(onto)
+	i = _term_index(onto, term)
+	return onto['ancestors'][onto['ancestors_ptr'][i]:onto['ancestors_ptr'][i+1]]
+
+def is_ancestor(onto, a, b):
+	"""
+	True if the term a is an ancestor of the term b (GO ids or indices)
+	"""
+	row = ancestors(onto, b)
+	i = _term_index(onto, a)
+	k = np.searchsorted(row, i)
+	return k < len(row) and row[k] == i
+
+def _evidence_codes(codes):
+	"""
+	set of evidence codes from a code, a group name of EVIDENCE_GROUPS or a list of them (None stays None)
+	"""
+	if codes is None: return None
+	if isinstance(codes, str): codes = [ codes ]
+	s = set()
+	for c in codes:
+		s.update(EVIDENCE_GROUPS.get(c, (c,)))
+	return s
+
+def evidence_mask(annot, include=None, exclude=None):
+	"""
+	returns the bitmask (over annot['evidence_codes']) of the evidence codes kept by the filter
+	include: codes or groups to keep (default: all), exclude: codes or groups to discard, e.g. exclude='IEA' or include='experimental'
+	"""
+	include = _evidence_codes(include)
+	exclude = _evidence_codes(exclude) or set()
+	mask = 0
+	for b, c in enumerate(annot['evidence_codes']):
+		if (include is None or c in include) and c not in exclude:
+			mask |= 1 << b
+	return mask
+
+def _selected(codes, include, exclude):
+	"""
+	True if one of the evidence codes of an annotation edge passes the filter (include and exclude as in evidence_mask)
+	"""
+	include = _evidence_codes(include)
+	exclude = _evidence_codes(exclude) or set()
+	return any( (include is None or c in include) and c not in exclude for c in codes )
+
+def gene_product_terms(onto, annot, all=True, include=None, exclude=None):
+	"""
+	returns the terms annotating every gene product of annot as CSR arrays (ptr, terms), terms of each gene product are sorted
+	all: if True, the ancestors of these terms are included (implicit annotation)
+	include, exclude: evidence filter, only the annotations with a code kept by evidence_mask are used
+	"""
+	n = onto['nb_terms']
+	gp = annot['pair_gp']
+	terms = annot['pair_term']
+	mask = evidence_mask(annot, include, exclude)
+	if mask != evidence_mask(annot):
+		keep = (annot['pair_evidence'] & np.uint64(mask)) != 0
+		gp = gp[keep]
+		terms = terms[keep]
+	if all: # add the ancestors of each term, then remove duplicates
+		ancestor_closure(onto)
+		counts, anc = _gather(onto['ancestors_ptr'], onto['ancestors'], terms)
+		pairs = _unique(np.concatenate([ gp.astype(np.int64) * n + terms, np.repeat(gp.astype(np.int64), counts) * n + anc ]))
+		gp = pairs // n
+		terms = (pairs % n).astype(np.int32)
+	ptr = np.zeros(annot['nb_gp'] + 1, dtype=np.int64)
+	np.cumsum(np.bincount(gp, minlength=annot['nb_gp']), out=ptr[1:])
+	return ptr, terms
+
+def gene_product_index(onto, annot, include=None, exclude=None):
+	"""
+	builds once the inverted index of annot: gene products annotated by each term, as sorted CSR arrays
+	directly:  index['direct_gp'][index['direct_ptr'][i]:index['direct_ptr'][i+1]]
+	implicitly (term i or one of its descendants): index['implicit_gp'][index['implicit_ptr'][i]:index['implicit_ptr'][i+1]]
+	without evidence filter the index is annot itself, otherwise it is built for the filter and kept in annot['_filters']
+	"""
+	mask = evidence_mask(annot, include, exclude)
+	if mask == evidence_mask(annot):
+		index = annot
+	else:
+		filters = annot.setdefault('_filters', {}) # runtime cache, not saved in snapshots
+		if mask not in filters: filters[mask] = {}
+		index = filters[mask]
+	if 'implicit_gp' in index: return index
+	n = onto['nb_terms']
+	for key, all in (('direct', False), ('implicit', True)):
+		ptr, terms = gene_product_terms(onto, annot, all, include, exclude)
+		gp = np.repeat(np.arange(annot['nb_gp'], dtype=np.int32), np.diff(ptr))
+		order = np.argsort(terms, kind='stable') # gene products stay sorted within each term
+		index[key + '_ptr'] = np.zeros(n + 1, dtype=np.int64)
+		np.cumsum(np.bincount(terms, minlength=n), out=index[key + '_ptr'][1:])
+		index[key + '_gp'] = gp[order]
+	return index
+
+def term_gene_products(onto, annot, term, all=True, include=None, exclude=None):
+	"""
+	returns the sorted indices (in annot['gp_ids']) of the gene products annotated by term (GO id or index)
+	all: if True, gene products annotated by a descendant of term are included
+	include, exclude: evidence filter (see evidence_mask)
+	"""
+	index = gene_product_index(onto, annot, include, exclude)
+	key = 'implicit' if all else 'direct'
+	i = _term_index(onto, term)
+	return index[key + '_gp'][index[key + '_ptr'][i]:index[key + '_ptr'][i+1]]
+
+def terms_gene_products(onto, annot, terms, all=True, include=None, exclude=None):
+	"""
+	batch version of term_gene_products for a list of terms (GO ids or indices)
+	returns CSR arrays (ptr, gene products): gene products of terms[k] are in gene_products[ptr[k]:ptr[k+1]]
+	"""
+	index = gene_product_index(onto, annot, include, exclude)
+	key = 'implicit' if all else 'direct'
+	rows = [ _term_index(onto, t) for t in terms ]
+	counts, gps = _gather(index[key + '_ptr'], index[key + '_gp'], rows)
+	ptr = np.zeros(len(rows) + 1, dtype=np.int64)
+	np.cumsum(counts, out=ptr[1:])
+	return ptr, gps
+
+def ordered_direct_gene_products(onto, annot):
+	"""
+	gene products directly annotated by each term, as CSR arrays (ptr, gps) in row order, each gene product kept at its
+	first row: the order of the direct .sets files written by annotation.py
+	"""
+	n = onto['nb_terms']
+	terms = np.repeat(np.arange(n, dtype=np.int64), np.diff(annot['term_rows_ptr']))
+	gps = annot['gp'][annot['term_rows']].astype(np.int32)
+	keep = np.sort(np.unique(terms * annot['nb_gp'] + gps, return_index=True)[1]) # rows are grouped by term
+	ptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(terms[keep], minlength=n), out=ptr[1:])
+	return ptr, gps[keep]
+
+def ordered_implicit_gene_products(onto, annot):
+	"""
+	gene products annotated by each term or one of its descendants, as CSR arrays (ptr, gps) like the implicit index of
+	gene_product_index, but in the order of a depth-first walk of the reversed graph (the children of a term in children
+	order, then its own gene products in row order, each gene product kept at its first occurrence): the order of the
+	implicit .sets files written by annotation.py
+	the lists are built in a single pass in reverse topological order, the list of a term from the lists of its children;
+	a term with a single non empty contribution shares its array
+	"""
+	n = onto['nb_terms']
+	cptr = onto['children_ptr'].tolist()
+	children = onto['children'].tolist()
+	dptr, direct = ordered_direct_gene_products(onto, annot)
+	dptr = dptr.tolist()
+	lists = [ None ] * n
+	for i in topological_order(onto)[::-1].tolist():
+		parts = [ lists[j] for j in children[cptr[i]:cptr[i+1]] if len(lists[j]) ]
+		own = direct[dptr[i]:dptr[i+1]]
+		if len(own): parts.append(own)
+		if len(parts) <= 1:
+			lists[i] = parts[0] if parts else own
+			continue
+		seq = np.concatenate(parts)
+		lists[i] = seq[np.sort(np.unique(seq, return_index=True)[1])]
+	ptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum([ len(l) for l in lists ], out=ptr[1:])
+	return ptr, np.concatenate(lists) if n else np.zeros(0, dtype=np.int32)
+
+def _direct_terms(go, gp, include=None, exclude=None):
+	"""
+	set of the indices of the terms gp (gene product or GO term) is directly linked to in a graph built by ontology_graph,
+	None when the edges of gp are not read from the compact arrays (other graphs or nodes added afterwards)
+	include, exclude: evidence filter applied to the annotations of a gene product
+	"""
+	if go.get('reverse', True) or (not gr.is_compact(go) and gp in go['edges'].extra): return None
+	onto = go['ontology']
+	if gp in onto['index']:
+		i = onto['index'][gp]
+		return set(onto['parents'][onto['parents_ptr'][i]:onto['parents_ptr'][i+1]].tolist())
+	annot = go.get('annotations')
+	if annot is not None and gp in annot['gp_index']:
+		k = annot['gp_index'][gp]
+		rows = annot['gp_rows'][annot['gp_rows_ptr'][k]:annot['gp_rows_ptr'][k+1]]
+		if include is not None or exclude is not None:
+			mask = evidence_mask(annot, include, exclude)
+			rows = rows[ (np.right_shift(mask, annot['evidence'][rows].astype(np.uint64)) & 1) == 1 ] if mask else rows[:0]
+		return set(annot['term'][rows].tolist())
+	return None
 
 def allgp(go):
 
+	if gr.is_compact(go): return _nodes_of_type(go, 'GeneProduct')
 	lst = []
 	for u in go['nodes']:
 		if go['nodes'][u]['type']=='GeneProduct':
@@ -276,13 +1101,28 @@ def allgp(go):
 
 def allgo(go):
 
+	if gr.is_compact(go): return _nodes_of_type(go, 'GOTerm')
 	lst = []
 	for u in go['nodes']:
 		if go['nodes'][u]['type']=='GOTerm':
 			lst.append(go['nodes'][u]['id'])
 	return lst
 
-def GOTerms(go, gp, goterm, all=True, evidence_code=None):
+def _type_code(go, type):
+	"""
+	code of the node type in go['node_types'] (compact graph), None when no node has this type
+	the codes depend on the graph: compact_ontology_graph puts GOTerm first, gr.compact_graph numbers the types as they come
+	"""
+	if go['node_types'] is None or type not in go['node_type_names']: return None
+	return go['node_type_names'].index(type)
+
+def _nodes_of_type(go, type):
+	code = _type_code(go, type)
+	if code is None: return []
+	names = go['names']
+	return [ names[i] for i in np.flatnonzero(go['node_types'] == code).tolist() ]
+
+def GOTerms(go, gp, goterm, all=True, evidence_code=None, exclude_code=None):
 	"""
 	return the GOTerms associated to the provided gene product (gp)
 
@@ -290,14 +1130,41 @@ def GOTerms(go, gp, goterm, all=True, evidence_code=None):
 	gp: gene product
 	goterm: dictionnaire des résultats
 	all: if True, all the GOTerms and their ancestors will be return, otherwise only the GOTerms directly associated to the gene product will be returned.
-	evidence_code: ignored for the moment
+	evidence_code: only the annotations with one of these evidence codes (code, group of EVIDENCE_GROUPS or list of them) are used, all of them if None
+	exclude_code: evidence codes of the annotations to ignore, e.g. 'IEA'
 
 	Returns a list of GOTerms identifiers, e.g. ['GO:0005215','GO:0005515','GO:0006810','GO:0006974','GO:0008643']
+	On a graph built by load_OBO, the ancestors are read from the closure index (ancestor_closure) instead of walking the graph.
 	"""
 	#goterm = { 'nodes' : {} }
 
-	if gp in go['nodes']:
+	if _has_node(go, gp):
+		terms = _direct_terms(go, gp, evidence_code, exclude_code)
+		if terms is not None: # compact ontology: direct terms plus their precomputed ancestors
+			onto = go['ontology']
+			if all:
+				ancestor_closure(onto)
+				ptr = onto['ancestors_ptr']
+				for i in list(terms):
+					terms.update(onto['ancestors'][ptr[i]:ptr[i+1]].tolist())
+			for i in sorted(terms):
+				u = onto['ids'][i]
+				if u not in goterm:
+					goterm[u] = node_attributes(go, u)
+			return (goterm)
+		if gr.is_compact(go): # other compact graphs: terms reachable from gp (its neighbours if not all)
+			code = _type_code(go, 'GOTerm')
+			if code is None: return (goterm)
+			d = gr.bfs(go, gp)['d']
+			reached = (d == 1) if not all else (d > 0)
+			for i in np.flatnonzero(reached & (go['node_types'] == code)).tolist():
+				u = go['names'][i]
+				if u not in goterm: goterm[u] = node_attributes(go, u)
+			return (goterm)
 		for u in go['edges'][gp]:#Pour tous les voisins du vertex choisi
+			e = go['edges'][gp][u]
+			if 'evidence-codes' in e and (evidence_code is not None or exclude_code is not None) and not _selected(e['evidence-codes'], evidence_code, exclude_code):
+				continue
 			if go['nodes'][u]['type'] == 'GOTerm':
 				if u not in goterm:#Evsite les doublons
 					goterm[u]=go['nodes'][u]
@@ -312,29 +1179,112 @@ def GOTerms(go, gp, goterm, all=True, evidence_code=None):
 
 def recherche_max(g, gp):
 	"""
-	Recherche du chemin le plus mong d'un poin à tous les autres points du graphe, la fonction s'inspire du BFS mais choisira le chemin le plus long de tous les chemins accessibles via le sommet entré en argument. Explications supplémentaires sur le compte rendu.
-	"""
-
-	g['max'] = {'d':{},'Q':[], 'lst' : [] }
-	for u in sorted(g['nodes_index']):
-		g['max']['d'][u]= 0
-	g['max']['d'][gp] = 0
-	g['max']['Q'].append(gp)
-	while g['max']['Q'] != []:
-		i = g['max']['Q'].pop(0)#Mise en place d'une file.
-		for v in sorted(g['edges'][i]):
-			g['max']['d'][v] = max((g['max']['d'][i] + 1), g['max']['d'][v])#choix du max entre la valeur du sommet et celle atteignable en ajoutant 1 au sommet parent
-			g['max']['Q'].append(v)#Engendre une récursivité jusqu'a épuisement des noeuds atteignable
-			g['max']['lst'].append(g['max']['d'][v])
-	maxd= max(g['max']['lst'])#Retour de la distance du chemin maximal
+	Recherche du chemin le plus long partant de gp vers tous les points accessibles du graphe (g doit être acyclique, e.g. le graphe inversé de load_OBOMD).
+	Les sommets accessibles sont ordonnés une seule fois (parcours en profondeur itératif, ordre suffixe inversé), puis la distance maximale est propagée dans cet ordre : chaque arc n'est traité qu'une fois.
+	"""
+
+	if gr.is_compact(g): # tableaux CSR : parcours en profondeur de gr.dfs_csr limité aux sommets accessibles
+		names = g['names']
+		res = gr.dfs_csr(g['ptr'], g['targets'], [ g['index'][gp] ], complete=False)
+		order = res['postorder'][::-1].tolist()
+		ptr = g['ptr'].tolist()
+		targets = g['targets'].tolist()
+		d = [ 0 ] * len(names)
+		for u in order:
+			for v in targets[ptr[u]:ptr[u+1]]:
+				if d[u] + 1 > d[v]: d[v] = d[u] + 1
+		g['max'] = {'d': { names[u]: d[u] for u in order }, 'order': [ names[u] for u in order ] }
+		return max(d[u] for u in order)
+	g['max'] = {'d':{}, 'order' : [] }
+	order = g['max']['order'] # ordre suffixe du parcours en profondeur
+	seen = {gp}
+	stack = [(gp, iter(g['edges'][gp]))]
+	while stack:
+		u, neighbours = stack[-1]
+		for v in neighbours:
+			if v not in seen:
+				seen.add(v)
+				stack.append((v, iter(g['edges'][v])))
+				break
+		else: # tous les voisins de u sont traités
+			stack.pop()
+			order.append(u)
+	order.reverse() # ordre topologique des sommets accessibles depuis gp
+	d = g['max']['d']
+	for u in order:
+		d[u] = 0
+	for u in order:
+		for v in g['edges'][u]:
+			d[v] = max(d[u] + 1, d[v])#choix du max entre la valeur du sommet et celle atteignable en ajoutant 1 au sommet parent
+	maxd = max(d.values())#Retour de la distance du chemin maximal
 	return(maxd)
 
+def namespace_parents(onto):
+	"""
+	(ptr, parents) CSR of the parents of each term within its own namespace (part_of edges towards another namespace are left out)
+	"""
+	n = onto['nb_terms']
+	ns = onto['namespace']
+	ptr = onto['parents_ptr']
+	child = np.repeat(np.arange(n, dtype=np.int32), np.diff(ptr))
+	keep = ns[onto['parents']] == ns[child]
+	same_ptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(child[keep], minlength=n), out=same_ptr[1:])
+	return same_ptr, onto['parents'][keep]
+
+def namespace_ancestors(onto):
+	"""
+	(ptr, ancestors) CSR of the ancestors of each term within its own namespace (transitively, along namespace_parents, the
+	term itself excluded), computed once and kept in onto['_namespace_ancestors']
+	"""
+	if '_namespace_ancestors' not in onto: # runtime cache, not saved in snapshots
+		onto['_namespace_ancestors'] = _closure(onto, *namespace_parents(onto))
+	return onto['_namespace_ancestors']
+
+def term_depths(onto):
+	"""
+	shortest and longest distance (number of is_a/part_of edges) from every term to the root of its namespace, for the three
+	namespaces at once, following only the parents in the same namespace (see namespace_parents), as Max_Depth does from the roots
+	a single pass in topological order: the depths of a term follow from those of its parents
+	stored in onto['min_depth'] and onto['max_depth'] (0 for the roots)
+	"""
+	if 'max_depth' in onto: return onto
+	n = onto['nb_terms']
+	ptr, parents = namespace_parents(onto)
+	ptr = ptr.tolist()
+	parents = parents.tolist()
+	mind = [ 0 ] * n
+	maxd = [ 0 ] * n
+	for i in topological_order(onto).tolist():
+		p = parents[ptr[i]:ptr[i+1]]
+		if p:
+			mind[i] = 1 + min([ mind[j] for j in p ])
+			maxd[i] = 1 + max([ maxd[j] for j in p ])
+	onto['min_depth'] = np.array(mind, dtype=np.int32)
+	onto['max_depth'] = np.array(maxd, dtype=np.int32)
+	return onto
+
+def namespace_depths(onto):
+	"""
+	returns { namespace: maximum depth of its terms }
+	"""
+	term_depths(onto)
+	depths = {}
+	for ns, d in zip(onto['namespaces'], onto['max_depth'].tolist()):
+		if d > depths.get(ns, -1): depths[ns] = d
+	return depths
+
 def puits(go):
 	"""
 	Détermination des puits du graphe, à savoir les racines des trois GeneOntology : Biological Precess, Molecular Fuction, Cellullar Component.
 	"""
 
 	go['MaxDepth'] = { 'lst' : {}}
+	if gr.is_compact(go):
+		for i in np.flatnonzero(np.diff(go['ptr']) == 0).tolist():
+			u = go['names'][i]
+			go['MaxDepth']['lst'][u] = node_attributes(go, u)
+		return go
 	for u in go['nodes']:
 		if not(go['edges'][u]):# Le condition pour être un pit est de ne pas avoir d'arc sortant (pour le graph chargé normalement)
 			go['MaxDepth']['lst'][u] = go['nodes'][u]
@@ -345,57 +1295,212 @@ def Max_Depth(go, goinv):
 	Détermine les profondeurs des trois GeneOntology. Part des puits puis pour le graphe inversé, applique la recherche de la distance maximale.
 	"""
 
-	for u in go['MaxDepth']['lst']:
-		if go['nodes'][u]['namespace']=='biological_process':
+	for u, attributes in go['MaxDepth']['lst'].items():
+		if attributes['namespace']=='biological_process':
 			print('Profondeur max biological process')
 			print(recherche_max(goinv, u))
-		if go['nodes'][u]['namespace']=='cellular_component':
+		if attributes['namespace']=='cellular_component':
 			print('Profondeur max cellular component')
 			print(recherche_max(goinv, u))
-		if go['nodes'][u]['namespace']=='molecular_function':
+		if attributes['namespace']=='molecular_function':
 			print('Profondeur max molecular function')
 			print(recherche_max(goinv, u))
 	return(go)
 
-def GeneProducts(go, term, geneproduct, all=True, evidence_code=None):
+def GeneProducts(go, term, geneproduct, all=True, evidence_code=None, exclude_code=None):
 	"""
 	return the gene products anotated by the provided GOTerm
 
 	go: Gene Ontology graph
 	term: GOTerm id
 	all: if True, all the gene products directly and undirectly annotated (linked to a descendant of GOTerm) will be return, otherwise only the gene products directly associated to the GOTerm will be returned.
-	evidence_code: ignored for the moment
+	evidence_code: only the annotations with one of these evidence codes (code, group of EVIDENCE_GROUPS or list of them) are used, all of them if None
+	exclude_code: evidence codes of the annotations to ignore, e.g. 'IEA'
 
 	Returns a list of gene products identifiers, e.g. ['P0AAG5', 'P0AFY6', 'P10907', 'P16676', 'P23886']
+	On a graph annotated by load_GOA, the gene products are read from the inverted index (gene_product_index, one per evidence filter).
 	"""
 
+	annot = go.get('annotations')
+	if annot is not None and (gr.is_compact(go) or not go['edges'].extra) and term in go['ontology']['index']:
+		ids = annot['gp_ids']
+		for k in term_gene_products(go['ontology'], annot, term, all, evidence_code, exclude_code).tolist():
+			geneproduct[ids[k]] = node_attributes(go, ids[k])
+		return (geneproduct)
+	if gr.is_compact(go): # no annotation table: gene products from which term is reachable (its predecessors if not all)
+		code = _type_code(go, 'GeneProduct')
+		if code is None or term not in go['index'] or go['node_types'][go['index'][term]] != _type_code(go, 'GOTerm'): return (geneproduct)
+		n = go['nb_nodes']
+		sources = np.repeat(np.arange(n, dtype=np.int32), np.diff(go['ptr']))
+		rptr = np.zeros(n + 1, dtype=np.int64)
+		np.cumsum(np.bincount(go['targets'], minlength=n), out=rptr[1:])
+		d = gr.bfs(go, term, csr=(go['names'], rptr, sources[np.argsort(go['targets'], kind='stable')], None))['d'] # reversed arcs
+		reached = (d == 1) if not all else (d > 0)
+		for i in np.flatnonzero(reached & (go['node_types'] == code)).tolist():
+			u = go['names'][i]
+			geneproduct[u] = node_attributes(go, u)
+		return (geneproduct)
 	if all:
 		for u in go['edges']:
 			if go['nodes'][u]['type'] == 'GeneProduct':
 				goterm = {}
-				got = GOTerms(go , u, goterm, all = True)#Recherche dans tous les arc reliant un GeneProduct à des GOTerm, si le GOTerm choisi est présent. Recherche exhaustive pour les descendants
+				got = GOTerms(go , u, goterm, all = True, evidence_code = evidence_code, exclude_code = exclude_code)#Recherche dans tous les arc reliant un GeneProduct à des GOTerm, si le GOTerm choisi est présent. Recherche exhaustive pour les descendants
 				if term in got:
 					geneproduct[u] = go['nodes'][u]#Renvoi le GeneProduct qui est lié au GOTerm
 	else:
 		for u in go['edges']:
 			if go['nodes'][u]['type'] == 'GeneProduct':
 				goterm = {}
-				got = GOTerms(go , u, goterm, all = False)#Recherche dans tous les arc reliant un GeneProduct à des GOTerm, si le GOTerm choisi est présent. Recherche restreint aux descendants directs
+				got = GOTerms(go , u, goterm, all = False, evidence_code = evidence_code, exclude_code = exclude_code)#Recherche dans tous les arc reliant un GeneProduct à des GOTerm, si le GOTerm choisi est présent. Recherche restreint aux descendants directs
 				if term in got:
 					geneproduct[u] = go['nodes'][u]
 	return (geneproduct)
 
 
 ##### lib tests #####
+TEST_OBO = """format-version: 1.2
+
+[Term]
+id: GO:0000001
+name: root bp
+namespace: biological_process
+
+[Term]
+id: GO:0000002
+name: child bp
+namespace: biological_process
+is_a: GO:0000001 ! root bp
+
+[Term]
+id: GO:0000003
+name: grandchild bp
+namespace: biological_process
+is_a: GO:0000002 ! child bp
+relationship: part_of GO:0000001 ! root bp
+
+[Term]
+id: GO:0000004
+name: obsolete bp
+namespace: biological_process
+is_obsolete: true
+
+[Term]
+id: GO:0000005
+name: root cc
+namespace: cellular_component
+
+[Term]
+id: GO:0000006
+name: child cc
+namespace: cellular_component
+is_a: GO:0000005 ! root cc
+
+[Term]
+id: GO:0000007
+name: grandchild cc
+namespace: cellular_component
+is_a: GO:0000006 ! child cc
+
+[Term]
+id: GO:0000008
+name: great-grandchild cc
+namespace: cellular_component
+is_a: GO:0000007 ! grandchild cc
+
+[Term]
+id: GO:0000009
+name: child bp part of a cc
+namespace: biological_process
+is_a: GO:0000001 ! root bp
+relationship: part_of GO:0000007 ! grandchild cc
+
+[Typedef]
+id: part_of
+name: part of
+"""
+
+TEST_GOA = """!gaf-version: 2.1
+DB\tP1\tgene1\t\tGO:0000003\tPMID:1\tIDA\t\tP\tprotein 1\tg1\tprotein\ttaxon:1\t20200101\tDB
+DB\tP2\tgene2\t\tGO:0000002\tPMID:1\tIEA\t\tP\tprotein 2\tg2\tprotein\ttaxon:1\t20200101\tDB
+DB\tP2\tgene2\t\tGO:0000006\tPMID:1\tIDA\t\tC\tprotein 2\tg2\tprotein\ttaxon:1\t20200101\tDB
+DB\tP3\tgene3\t\tGO:0000005\tPMID:1\tIDA\t\tC\tprotein 3\tg3\tprotein\ttaxon:1\t20200101\tDB
+"""
+
+def _test_files(d):
+	"""
+	write TEST_OBO and TEST_GOA in the directory d, returns their names
+	"""
+	obo, goa = os.path.join(d, 'test.obo'), os.path.join(d, 'test.goa')
+	with open(obo, 'w') as f: f.write(TEST_OBO)
+	with open(goa, 'w') as f: f.write(TEST_GOA)
+	return obo, goa
+
+def check_namespace_depths(onto=None, goinv=None):
+	"""
+	namespace_depths(onto) gives the depth Max_Depth finds from the root of each namespace (recherche_max on goinv, the graph of
+	load_OBOMD); onto is parsed from TEST_OBO by default, where a biological_process term is part of a deeper cellular_component
+	"""
+	if onto is None:
+		with tempfile.TemporaryDirectory() as d:
+			onto = load_ontology(_test_files(d)[0])
+		assert namespace_depths(onto) == { 'biological_process': 2, 'cellular_component': 3 }
+	if goinv is None: goinv = ontology_graph(onto, reverse=True)
+	depths = namespace_depths(onto)
+	for i in np.flatnonzero(np.diff(onto['parents_ptr']) == 0).tolist():
+		assert recherche_max(goinv, onto['ids'][i]) == depths[onto['namespaces'][i]], onto['ids'][i]
+	return True
+
+def check_compact_graph():
+	"""
+	GOTerms, GeneProducts and puits give the same results on gr.compact_graph(go) as on go, annotated graph of TEST_OBO and TEST_GOA
+	"""
+	with tempfile.TemporaryDirectory() as d:
+		obo, goa = _test_files(d)
+		go = load_OBO(obo)
+		load_GOA(go, goa)
+	cgo = gr.compact_graph(go)
+	for all in (False, True):
+		for gp in allgp(go):
+			assert set(GOTerms(cgo, gp, {}, all = all)) == set(GOTerms(go, gp, {}, all = all)), (gp, all)
+		for term in allgo(go):
+			assert set(GeneProducts(cgo, term, {}, all = all)) == set(GeneProducts(go, term, {}, all = all)), (term, all)
+	assert set(GOTerms(cgo, 'P1', {})) == { 'GO:0000001', 'GO:0000002', 'GO:0000003' }
+	assert set(GeneProducts(cgo, 'GO:0000001', {})) == { 'P1', 'P2' }
+	assert set(GeneProducts(cgo, 'GO:0000002', {}, all = False)) == { 'P2' }
+	assert set(puits(cgo)['MaxDepth']['lst']) == set(puits(go)['MaxDepth']['lst']) == { 'GO:0000001', 'GO:0000005' }
+	return True
+
+def check_definitions():
+	"""
+	onto['defs'] still gives the definitions of the terms once lines are added before them in the OBO file (TEST_OBO with a
+	definition for GO:0000002)
+	"""
+	text = TEST_OBO.replace('name: child bp\n', 'name: child bp\ndef: "a child" [GOC:test]\n')
+	with tempfile.TemporaryDirectory() as d:
+		obo = os.path.join(d, 'test.obo')
+		with open(obo, 'w') as f: f.write(text)
+		onto = load_ontology(obo)
+		i = onto['index']['GO:0000002']
+		assert onto['defs'][i] == '"a child" [GOC:test]' and list(onto['defs']).count('') == onto['nb_terms'] - 1
+		with open(obo, 'w') as f: f.write(text.replace('format-version: 1.2\n', 'format-version: 1.2\ndata-version: 2\n'))
+		assert onto['defs'][i] == '"a child" [GOC:test]' and list(onto['defs']).count('') == onto['nb_terms'] - 1
+		assert onto['defs'][i:i+1] == onto['defs'].take([ i ]) == [ '"a child" [GOC:test]' ]
+		onto['defs'].close()
+	return True
+
 if __name__ == "__main__":
 
 	print('GeneOntology lib tests')
+	print('Forme compacte (gr.compact_graph) : GOTerms, GeneProducts et puits identiques au graphe dictionnaire :', check_compact_graph())
+	print('namespace_depths identique à Max_Depth :', check_namespace_depths())
+	print('Définitions relues après modification du fichier OBO :', check_definitions())
 	print('________________________________\n	Chargement des graphes pour les tests : ')
 	print('________________________________\n')
-	go = load_OBO('go-basic.obo')
+	onto = load_ontology('go-basic.obo')
+	go = load_OBO('go-basic.obo', onto)
 	load_GOA(go , 'H_influenzae_ATCC_51907.goa')
 	go=gr.trigraphe(go)
-	goinv=load_OBOMD('go-basic.obo')
+	goinv=load_OBOMD('go-basic.obo', onto)
 	goinv = gr.trigraphe(goinv)
 	print()
 	choix=str(input('Voulez vous visualiser le graphe ? O/N'))
@@ -417,12 +1522,11 @@ if __name__ == "__main__":
 	pprint(GeneProducts(go , 'GO:0003333' , geneproduct, all = True))
 	print('________________________________\n	Test de la fonction Max_Depth : ')
 	print('________________________________\n')
-	goinv=load_OBOMD('go-basic.obo')
-	goinv = gr.trigraphe(goinv)
 	go=puits(go)
 	print('Sources de la Gene Ontology')
 	pprint(go['MaxDepth'])
 	Max_Depth(go, goinv)
+	print('namespace_depths identique à Max_Depth :', check_namespace_depths(onto, goinv))
 
 
 
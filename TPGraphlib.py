@@ -1,23 +1,28 @@
 # -*- coding: utf-8 -*-
+import gzip
+import heapq
+import itertools
 import math 
 import operator
+from collections import deque
 from pprint import pprint
 import numpy as np # for Floyd-Warshall matrices
  
 
 def create_graph(directed = True, weighted = False): # TP1
-	g = { 'directed': directed, 'weighted': weighted, 'nb_nodes': 0, 'nb_edges': 0, 'weight_attribute': None , 'nodes': {}, 'nodes_index' : {}, 'edges': {}  } # le sous dictionnaire 'nodes_index' a été ajouté et est un duplicata du dictionnaire 'nodes' et ayant comme attribut l'index du sommet. Ceci afin de trier le dictionnaire.
+	g = { 'directed': directed, 'weighted': weighted, 'nb_nodes': 0, 'nb_edges': 0, 'weight_attribute': None , 'nodes': {}, 'nodes_index' : {}, 'edges': {}, '_node_order': None, '_csr': None  } # le sous dictionnaire 'nodes_index' a été ajouté et est un duplicata du dictionnaire 'nodes' et ayant comme attribut l'index du sommet. Ceci afin de trier le dictionnaire.
+	# '_node_order' : vue triée des sommets (voir node_order), recalculée seulement après un ajout de sommet
+	# '_csr' : adjacence CSR (voir adjacency_csr), recalculée seulement après un ajout de sommet ou d'arc
 	return g
 
 
 #Cette fonction attribut un index à chaques sommet, elle permetra a posteriori de trier le dictionnaire de manière répétitive.
 def trigraphe(g):
-	i = 0
-	for u in sorted(g['nodes']):
-		g['nodes_index'][u] = g['nodes'][u]
-	for u in sorted(g['nodes_index']):
+	names = sorted(g['nodes'])
+	for i, u in enumerate(names):
 		g['nodes_index'][u] = i
-		i = i+1
+	g['_node_order'] = (names, dict(g['nodes_index'])) # la vue triée est celle qui vient d'être calculée
+	g['_csr'] = None # les index ont pu changer
 	return g
 
 
@@ -28,6 +33,8 @@ def add_node(g, n, attributes = None): # TP1
 		g['nodes'][n] = attributes
 		g['edges'][n] = {} # init outgoing edges
 		g['nb_nodes'] += 1
+		g['_node_order'] = None # sorted view is now stale
+		g['_csr'] = None # so is the adjacency
 	return g['nodes'][n] # return node attributes
 
 
@@ -43,102 +50,508 @@ def add_edge(g, n1, n2, attributes = None): # TP1
 		if not g['directed']:
 			g['edges'][n2][n1] = g['edges'][n1][n2] # share the same attributes as n1->n2
 		g['nb_edges'] += 1
+		g['_csr'] = None # adjacency is now stale
 	return g['edges'][n1][n2] # return edge atributes
 
-def load_SIF(filename, directed=True): # TP1
-	# line syntax: nodeD <relationship type> nodeE nodeF nodeB
-	g = create_graph(directed) # new empty graph
-	with open(filename) as f: # OPEN FILE
-		# PROCESS THE REMAINING LINES
-		row = f.readline().rstrip() # read next line and remove ending whitespaces
-		while row:
-			vals = row.split('\t') # split line on tab
+def is_compact(g):
+	return g.get('compact', False)
+
+def compact_graph(g, edge_attribute = 'type', node_attribute = 'type'):
+	"""
+	Forme compacte et figée du graphe g : sommets numérotés 0..n-1 (names, index : nom <-> numéro, dans l'ordre de node_names),
+	arcs en CSR (les arcs de i vont vers targets[ptr[i]:ptr[i+1]]), poids dans weights (None si le graphe n'a pas de poids),
+	valeur de l'attribut edge_attribute des arcs (resp. node_attribute des sommets) codée dans edge_types (node_types),
+	index dans edge_type_names (node_type_names), -1 si absente ; None si aucun arc (sommet) ne l'a.
+	Les tableaux sont en lecture seule. BFS, DFS, bellman_ford, floyd_warshall... acceptent les deux formes ; dict_graph fait l'inverse.
+	"""
+	if is_compact(g): return g
+	names, ptr, targets, weights = adjacency_csr(g)
+	def codes(values):
+		table = {}
+		c = np.array([ -1 if v is None else table.setdefault(v, len(table)) for v in values ], dtype=np.int16)
+		return (c, list(table)) if table else (None, None)
+	targets_list = targets.tolist()
+	attributes = [ g['edges'][u][names[v]] for i, u in enumerate(names) for v in targets_list[ptr[i]:ptr[i+1]] ]
+	edge_types, edge_type_names = codes( a.get(edge_attribute) for a in attributes )
+	node_types, node_type_names = codes( g['nodes'][u].get(node_attribute) for u in names )
+	weight = g['weight_attribute'] or 'weight'
+	weighted = g['weighted'] or any( weight in a for a in attributes )
+	cg = { 'compact': True, 'directed': g['directed'], 'weighted': weighted, 'weight_attribute': g['weight_attribute'],
+		'nb_nodes': len(names), 'nb_edges': g['nb_edges'], 'names': names, 'index': { u: i for i, u in enumerate(names) },
+		'ptr': ptr, 'targets': targets, 'weights': weights if weighted else None,
+		'edge_attribute': edge_attribute, 'edge_types': edge_types, 'edge_type_names': edge_type_names,
+		'node_attribute': node_attribute, 'node_types': node_types, 'node_type_names': node_type_names }
+	for v in cg.values():
+		if isinstance(v, np.ndarray): v.flags.writeable = False
+	return cg
+
+def dict_graph(cg):
+	"""
+	Forme dictionnaire (create_graph) d'un graphe compact ; les sommets gardent leur numéro dans g['nodes_index'].
+	"""
+	if not is_compact(cg): return cg
+	g = create_graph(cg['directed'], cg['weighted'])
+	g['weight_attribute'] = cg['weight_attribute']
+	names = cg['names']
+	for i, u in enumerate(names):
+		attributes = {}
+		if cg['node_types'] is not None and cg['node_types'][i] >= 0:
+			attributes[cg['node_attribute']] = cg['node_type_names'][cg['node_types'][i]]
+		add_node(g, u, attributes)
+		g['nodes_index'][u] = i
+	ptr = cg['ptr'].tolist()
+	targets = cg['targets'].tolist()
+	for i, u in enumerate(names):
+		for e in range(ptr[i], ptr[i+1]):
+			attributes = {}
+			if cg['edge_types'] is not None and cg['edge_types'][e] >= 0:
+				attributes[cg['edge_attribute']] = cg['edge_type_names'][cg['edge_types'][e]]
+			if cg['weights'] is not None:
+				w = float(cg['weights'][e])
+				attributes[cg['weight_attribute'] or 'weight'] = int(w) if w.is_integer() else w
+			add_edge(g, u, names[targets[e]], attributes)
+	return g
+
+LOAD_CHUNK = 16 << 20 # taille (en caractères) des blocs lus par les chargeurs
+TAB_SCHEMA = { 'weight': 'number' } # types des colonnes de load_TAB par défaut
+
+def open_text(filename):
+	"""
+	Ouvre un fichier texte en lecture, compressé par gzip ou non (reconnu à ses premiers octets).
+	"""
+	with open(filename, 'rb') as f:
+		gz = f.read(2) == b'\x1f\x8b'
+	return gzip.open(filename, 'rt') if gz else open(filename)
+
+def _chunks(filename, chunk_size = None):
+	"""
+	Génère les lignes non vides du fichier (sans les blancs de fin de ligne), par blocs lus chunk_size caractères à la fois.
+	"""
+	if chunk_size is None: chunk_size = LOAD_CHUNK
+	with open_text(filename) as f:
+		rest = ''
+		for block in iter(lambda: f.read(chunk_size), ''):
+			lines = (rest + block).split('\n')
+			rest = lines.pop() # ligne incomplète, complétée par le bloc suivant
+			lines = [ l.rstrip() for l in lines ]
+			yield [ l for l in lines if l ]
+		if rest.strip(): yield [ rest.rstrip() ]
+
+def _columns(lines, width):
+	"""
+	Colonnes des lignes découpées selon les tabulations, complétées par des chaînes vides jusqu'à width colonnes.
+	"""
+	if not lines: return [ [] for k in range(width) ]
+	if all( l.count('\t') == width - 1 for l in lines ): # cas courant : un seul découpage pour tout le bloc
+		fields = '\t'.join(lines).split('\t')
+		return [ fields[k::width] for k in range(width) ]
+	rows = [ l.split('\t') for l in lines ]
+	rows = [ r if len(r) >= width else r + [ '' ] * (width - len(r)) for r in rows ]
+	return [ list(c) for c in zip(*rows) ][:width]
+
+def _typed(values, kind):
+	"""
+	Valeurs d'une colonne converties selon kind : int, float, 'number' (int si possible, float sinon), str ou None (inchangées),
+	ou toute fonction de conversion.
+	"""
+	if kind is None or kind is str: return values
+	if kind is int or kind is float: return np.array(values).astype(kind).tolist()
+	if kind == 'number':
+		try:
+			return np.array(values).astype(np.int64).tolist()
+		except (ValueError, OverflowError):
+			return [ _number(v) for v in values ]
+	return [ kind(v) for v in values ]
+
+def iter_SIF_columns(filename, chunk_size = None):
+	"""
+	Lit un fichier SIF (éventuellement compressé par gzip) par blocs et génère pour chacun les listes (sommets1, types, sommets2)
+	de ses arcs : la ligne nodeD <type> nodeE nodeF donne les arcs nodeD -> nodeE et nodeD -> nodeF.
+	"""
+	for lines in _chunks(filename, chunk_size):
+		v1, types, v2 = [], [], []
+		for l in lines:
+			vals = l.split('\t')
 			for i in range(2, len(vals)):
-				att = { 'type': vals[1] } # set edge type
-				add_edge(g, vals[0], vals[i], att)
-			row = f.readline().rstrip() # read next line
+				v1.append(vals[0])
+				types.append(vals[1])
+				v2.append(vals[i])
+		yield v1, types, v2
+
+def iter_SIF(filename, chunk_size = None):
+	"""
+	Générateur des arcs (sommet1, type, sommet2) d'un fichier SIF, sans construire de graphe (voir iter_SIF_columns).
+	"""
+	for v1, types, v2 in iter_SIF_columns(filename, chunk_size):
+		yield from zip(v1, types, v2)
+
+def iter_TAB_columns(filename, schema = None, chunk_size = None):
+	"""
+	Lit un fichier tabulé (éventuellement compressé par gzip) par blocs et génère pour chacun
+	(noms des colonnes d'attributs, sommets1, sommets2, { colonne: valeurs }), les valeurs étant typées selon schema
+	({ colonne: type }, voir _typed ; TAB_SCHEMA par défaut).
+	"""
+	if schema is None: schema = TAB_SCHEMA
+	header = None
+	for lines in _chunks(filename, chunk_size):
+		if header is None:
+			if not lines: continue
+			header = lines[0].split('\t')[2:] # les deux premières colonnes sont les sommets
+			lines = lines[1:]
+		cols = _columns(lines, len(header) + 2)
+		yield header, cols[0], cols[1], { name: _typed(cols[k+2], schema.get(name)) for k, name in enumerate(header) }
+
+def iter_TAB(filename, schema = None, chunk_size = None):
+	"""
+	Générateur des arcs (sommet1, sommet2, attributs) d'un fichier tabulé, sans construire de graphe (voir iter_TAB_columns).
+	"""
+	for header, v1, v2, cols in iter_TAB_columns(filename, schema, chunk_size):
+		values = [ cols[name] for name in header ]
+		for a, b, row in zip(v1, v2, zip(*values) if values else itertools.repeat(())):
+			yield a, b, dict(zip(header, row))
+
+def _add_edges(g, v1, v2, attributes):
+	"""
+	Ajoute en bloc les arcs v1[k] -> v2[k] d'attributs attributes[k] à g, comme add_edge (le premier arc entre deux sommets
+	est gardé, les sommets sont créés dans l'ordre où ils apparaissent).
+	"""
+	for u in dict.fromkeys(itertools.chain.from_iterable(zip(v1, v2))):
+		if u not in g['nodes']: add_node(g, u)
+	out = g['edges']
+	nb = 0
+	if g['directed']:
+		for a, b, att in zip(v1, v2, attributes):
+			succ = out[a]
+			if b not in succ:
+				succ[b] = att
+				nb += 1
+	else:
+		for a, b, att in zip(v1, v2, attributes):
+			succ = out[a]
+			if b not in succ:
+				succ[b] = out[b][a] = att
+				nb += 1
+	g['nb_edges'] += nb
+	g['_csr'] = None
+	return g
+
+def _bulk_compact(directed, v1, v2, weights = None, types = None, edge_attribute = 'type', weight_attribute = None):
+	"""
+	Graphe compact (voir compact_graph) construit directement à partir des listes d'arcs, sans passer par les dictionnaires :
+	même numérotation des sommets (ordre trié) et même arc gardé entre deux sommets que compact_graph(load_...).
+	"""
+	names = sorted(set(v1) | set(v2))
+	index = { u: i for i, u in enumerate(names) }
+	n = len(names)
+	u = np.array([ index[x] for x in v1 ], dtype=np.int64)
+	v = np.array([ index[x] for x in v2 ], dtype=np.int64)
+	if directed:
+		keys, first = np.unique(u * n + v, return_index=True)
+		nb_edges = len(keys)
+	else: # un arc par paire de sommets, dans les deux sens
+		keys, first = np.unique(np.minimum(u, v) * n + np.maximum(u, v), return_index=True)
+		nb_edges = len(keys)
+		a, b = keys // n, keys % n
+		loop = a == b
+		keys = np.concatenate([ keys, b[~loop] * n + a[~loop] ])
+		first = np.concatenate([ first, first[~loop] ])
+		order = np.argsort(keys, kind='stable')
+		keys, first = keys[order], first[order]
+	ptr = np.zeros(n + 1, dtype=np.int64)
+	np.cumsum(np.bincount(keys // n, minlength=n), out=ptr[1:])
+	edge_types = edge_type_names = None
+	if types is not None:
+		table = {}
+		edge_types = np.array([ table.setdefault(types[e], len(table)) for e in first.tolist() ], dtype=np.int16)
+		edge_type_names = list(table)
+	cg = { 'compact': True, 'directed': directed, 'weighted': weights is not None, 'weight_attribute': weight_attribute,
+		'nb_nodes': n, 'nb_edges': nb_edges, 'names': names, 'index': index, 'ptr': ptr, 'targets': (keys % n).astype(np.int32),
+		'weights': np.asarray(weights, dtype=np.float64)[first] if weights is not None else None,
+		'edge_attribute': edge_attribute, 'edge_types': edge_types, 'edge_type_names': edge_type_names,
+		'node_attribute': 'type', 'node_types': None, 'node_type_names': None }
+	for x in cg.values():
+		if isinstance(x, np.ndarray): x.flags.writeable = False
+	return cg
+
+def load_SIF(filename, directed=True, compact = False, chunk_size = None): # TP1
+	"""
+	Charge un graphe depuis un fichier SIF (éventuellement compressé par gzip), lu par blocs : chaque ligne
+	nodeD <relationship type> nodeE nodeF nodeB donne les arcs nodeD -> nodeE, nodeF, nodeB avec l'attribut type.
+	compact : construit directement la forme compacte (compact_graph) au lieu des dictionnaires.
+	"""
+	if compact:
+		v1, types, v2 = [], [], []
+		for a, t, b in iter_SIF_columns(filename, chunk_size):
+			v1.extend(a)
+			types.extend(t)
+			v2.extend(b)
+		return _bulk_compact(directed, v1, v2, types=types)
+	g = create_graph(directed) # new empty graph
+	for v1, types, v2 in iter_SIF_columns(filename, chunk_size):
+		_add_edges(g, v1, v2, [ { 'type': t } for t in types ])
 	return g # return graph
 
-def load_TAB(filename, directed=True): 
+def _number(x):
+	"""
+	Valeur numérique d'un champ (int si possible, float sinon).
+	"""
+	try:
+		return int(x)
+	except ValueError:
+		return float(x)
+
+def load_TAB(filename, directed=True, schema = None, compact = False, chunk_size = None): 
+	"""
+	Charge un graphe depuis un fichier tabulé (éventuellement compressé par gzip) : sommet1, sommet2, puis les attributs des
+	arcs (nommés par l'en-tête), lu par blocs. Les colonnes sont typées selon schema ({ colonne: type }, voir _typed) :
+	par défaut (TAB_SCHEMA) la colonne 'weight' est convertie en nombres une fois pour toutes (le graphe est alors pondéré),
+	les autres restent des chaînes. Les lignes vides sont ignorées.
+	compact : construit directement la forme compacte (compact_graph), qui ne garde que les colonnes 'weight' et 'type'.
+	"""
+	header = []
+	if compact:
+		v1, v2, weights, types = [], [], [], []
+		for header, a, b, cols in iter_TAB_columns(filename, schema, chunk_size):
+			v1.extend(a)
+			v2.extend(b)
+			if 'weight' in cols: weights.extend(cols['weight'])
+			if 'type' in cols: types.extend(cols['type'])
+		return _bulk_compact(directed, v1, v2, weights if 'weight' in header else None, types if 'type' in header else None,
+			weight_attribute = 'weight' if 'weight' in header else None)
 	g = create_graph(directed)
-	with open(filename) as f: 
-		# GET COLUMNS NAMES
-		tmp = f.readline().rstrip()
-		attNames= tmp.split('\t')
-		# REMOVES FIRST TWO COLUMNS WHICH CORRESPONDS TO THE LABELS OF THE CONNECTED VERTICES
-		attNames.pop(0)
-		attNames.pop(0)
-		# PROCESS THE REMAINING LINES
-		row = f.readline().rstrip()
-		while row:
-			vals = row.split('\t')
-			v1 = vals.pop(0)
-			v2 = vals.pop(0)
-			att = {}
-			for i in range(len(attNames)):
-				att[ attNames[i] ] = vals[i]
-			add_edge(g, v1, v2, att)
-			row = f.readline().rstrip() # NEXT LINE
+	for header, a, b, cols in iter_TAB_columns(filename, schema, chunk_size):
+		values = [ cols[name] for name in header ]
+		_add_edges(g, a, b, [ dict(zip(header, row)) for row in zip(*values) ] if values else [ {} for x in a ])
+	if 'weight' in header:
+		g['weighted'] = True
+		g['weight_attribute'] = 'weight'
 	return g
 
+def _node_index(g, u):
+	"""
+	Index de u (nom de sommet ou index) dans l'ordre de node_order (voir adjacency_csr).
+	"""
+	if is_compact(g): return int(u) if isinstance(u, (int, np.integer)) and u not in g['index'] else g['index'][u]
+	if isinstance(u, (int, np.integer)) and u not in g['nodes']: return int(u)
+	return node_order(g)[1][u]
+
+def bfs(g, s, csr = None):
+	"""
+	Parcours en largeur depuis s (nom ou index), sans modifier g : les arcs de chaque sommet sont pris dans l'ordre de leurs
+	index (celui de adjacency_csr, calculée une seule fois), la file est une deque.
+	Retourne { 'names', 'source', 'order' (index dans l'ordre de visite), 'd' (distance, -1 si non atteint),
+	'pi' (prédécesseur, -1 si aucun) } ; csr : résultat de adjacency_csr(g) pour ne pas le recalculer à chaque parcours.
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	ptr = ptr.tolist()
+	targets = targets.tolist()
+	s = _node_index(g, s)
+	d = [ -1 ] * len(names)
+	pi = [ -1 ] * len(names)
+	d[s] = 0
+	order = [ s ]
+	Q = deque(order)
+	while Q:
+		u = Q.popleft()
+		du = d[u] + 1
+		for v in targets[ptr[u]:ptr[u+1]]:
+			if d[v] < 0: # sommet non traité
+				d[v] = du
+				pi[v] = u
+				order.append(v)
+				Q.append(v)
+	return { 'names': names, 'source': s, 'order': np.array(order, dtype=np.int32), 'd': np.array(d, dtype=np.int32), 'pi': np.array(pi, dtype=np.int32) }
+
 #Plus court chemin d'un sommet à tous les sommets.
 def BFS(g, s): 
-	g['BFS'] = {'color':{},'d':{},'pi': {},'Q':[]}#Cree un sous dictionnaire 'BFS' attaché au dictionnaire g
-	for u in sorted(g['nodes_index']):#Initialisation des sommets
-		g['BFS']['color'][u]= 'WHITE' 
-		g['BFS']['d'][u]= float('inf')
-		g['BFS']['pi'][u] = None
-	g['BFS']['color'][s] = 'GRAY' #Le sommet dont on commence le traitement est grisé
-	g['BFS']['d'][s] = 0 #On inititalise la distance parcourue
-	g['BFS']['Q'].append(s) #On enfile le noeud dans le Q
-	while g['BFS']['Q'] != []:
-		u = g['BFS']['Q'].pop(0)# On défile la liste en FIFO ce qui en fait une file
-		for v in sorted(g['edges'][u]):#Parcours du graphe de manière ordonnée 
-			if g['BFS']['color'][v]=='WHITE':#si un sommet est non traité
-				g['BFS']['color'][v]='GRAY'#On le traite
-				g['BFS']['d'][v] = g['BFS']['d'][u] + 1#On incrémente la distance
-				g['BFS']['pi'][v] = u#Le sommet d'ou l'on viens est ajouté à la liste des prédécesseurs
-				g['BFS']['Q'].append(v)# on enfile le sommet v dans la file
-		g['BFS']['color'][u] = 'BLACK'# On colore en noir le sommet dont le traitement est terminé
+	"""
+	Version historique de bfs : le résultat est rangé dans g['BFS'] (couleurs, distances et prédécesseurs par nom de sommet).
+	"""
+	res = bfs(g, s)
+	names = res['names']
+	d = res['d'].tolist()
+	pi = res['pi'].tolist()
+	g['BFS'] = {'color':{},'d':{},'pi': {},'Q':[]}
+	for i, u in enumerate(names):
+		g['BFS']['color'][u] = 'BLACK' if d[i] >= 0 else 'WHITE'
+		g['BFS']['d'][u] = d[i] if d[i] >= 0 else float('inf')
+		g['BFS']['pi'][u] = names[pi[i]] if pi[i] >= 0 else None
 	return(g)
 
+BFS_BATCH = 64 # nombre de sources traitées ensemble par bfs_distances (un mot de 64 bits par sommet)
+
+def bfs_distances(g, sources = None, block = None, csr = None):
+	"""
+	Parcours en largeur simultanés depuis les sommets sources (noms ou index, tous par défaut), par blocs de BFS_BATCH sources :
+	chaque sommet porte un ensemble de bits (un par source du bloc) et chaque niveau propage par des OU les bits des sommets
+	de la frontière le long de leurs arcs, pour toutes les sources du bloc en une fois.
+	Génère (index des sources du bloc, distances int32 len(bloc) x n, -1 si le sommet n'est pas atteint).
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	n = len(names)
+	if sources is None: sources = np.arange(n, dtype=np.int32)
+	else: sources = np.array([ _node_index(g, u) for u in sources ], dtype=np.int32)
+	if block is None: block = BFS_BATCH
+	counts = np.diff(ptr)
+	for start in range(0, len(sources), block):
+		rows = sources[start:start+block]
+		k = len(rows)
+		col = np.arange(k)
+		frontier = np.zeros((n, -(-k // 64)), dtype='<u8')
+		np.bitwise_or.at(frontier, (rows, col // 64), np.left_shift(np.uint64(1), (col % 64).astype(np.uint64)))
+		visited = frontier.copy()
+		active = np.unique(rows)
+		d = np.full((k, n), -1, dtype=np.int32)
+		d[col, rows] = 0
+		level = 0
+		while len(active):
+			level += 1
+			# arcs partant de la frontière, regroupés par extrémité : les bits reçus par v sont le OU de ceux de ses prédécesseurs
+			c = counts[active]
+			ends = np.cumsum(c)
+			edges = np.arange(ends[-1] if len(ends) else 0) + np.repeat(ptr[active] - ends + c, c)
+			v = targets[edges]
+			order = np.argsort(v, kind='stable')
+			v = v[order]
+			bits = frontier[np.repeat(active, c)[order]]
+			first = np.flatnonzero(np.concatenate([ [ True ], v[1:] != v[:-1] ])) if len(v) else np.zeros(0, dtype=np.int64)
+			nxt = np.bitwise_or.reduceat(bits, first, axis=0) if len(v) else bits
+			v = v[first]
+			nxt &= ~visited[v]
+			keep = nxt.any(axis=1)
+			active = v[keep]
+			nxt = nxt[keep]
+			visited[active] |= nxt
+			frontier[:] = 0
+			frontier[active] = nxt
+			j, i = np.nonzero(np.unpackbits(nxt.view(np.uint8), axis=1, bitorder='little')[:, :k].T)
+			d[j, active[i]] = level
+		yield rows, d
+
+EDGE_CLASSES = ('TREE EDGE', 'BACK EDGE', 'FORWARD EDGE', 'CROSS EDGE') # classes des arcs dans dfs_csr['class']
+
+def dfs_csr(ptr, targets, roots = None, complete = True):
+	"""
+	Parcours en profondeur itératif (pile explicite, pas de limite de récursion) d'un graphe donné par sa liste d'adjacence CSR :
+	les arcs de i vont vers targets[ptr[i]:ptr[i+1]]. Les sommets non atteints depuis roots (tous par défaut, dans l'ordre)
+	sont ensuite pris dans l'ordre des index, sauf si complete est False (seuls les sommets accessibles depuis roots sont parcourus,
+	les autres gardent d = f = 0).
+	Retourne un dictionnaire d'arrays :
+		'd', 'f' : temps de découverte et de fin (1 à 2n), 'pi' : prédécesseur (-1 pour les racines)
+		'class' : classe de chaque arc (index dans EDGE_CLASSES), dans l'ordre de targets
+		'postorder' : sommets dans l'ordre de fin de traitement, 'acyclic' : True s'il n'y a aucun arc retour
+		'topo' : tri topologique (postordre inversé) si le graphe est acyclique, None sinon
+		'scc' : numéro de la composante fortement connexe de chaque sommet (Tarjan, dans le même parcours), 'nb_scc'
+	"""
+	n = len(ptr) - 1
+	ptr = ptr.tolist() if isinstance(ptr, np.ndarray) else list(ptr)
+	targets = targets.tolist() if isinstance(targets, np.ndarray) else list(targets)
+	d = [ 0 ] * n
+	f = [ 0 ] * n
+	pi = [ -1 ] * n
+	low = [ 0 ] * n # plus petit temps de découverte atteignable (Tarjan)
+	scc = [ -1 ] * n
+	cls = [ 0 ] * len(targets)
+	post = []
+	open_scc = [] # sommets dont la composante n'est pas encore fermée
+	nb_scc = 0
+	acyclic = True
+	time = 0
+	if roots is None: order = range(n)
+	elif complete: order = itertools.chain(roots, range(n))
+	else: order = roots
+	for r in order:
+		if d[r]: continue
+		time += 1
+		d[r] = low[r] = time
+		open_scc.append(r)
+		nodes = [ r ] # pile du parcours : sommet et prochain arc à examiner
+		edges = [ ptr[r] ]
+		while nodes:
+			u = nodes[-1]
+			e = edges[-1]
+			if e < ptr[u+1]:
+				edges[-1] = e + 1
+				v = targets[e]
+				if not d[v]:
+					cls[e] = 0 # TREE EDGE
+					pi[v] = u
+					time += 1
+					d[v] = low[v] = time
+					open_scc.append(v)
+					nodes.append(v)
+					edges.append(ptr[v])
+				elif not f[v]:
+					cls[e] = 1 # BACK EDGE
+					acyclic = False
+					if d[v] < low[u]: low[u] = d[v]
+				elif d[u] < d[v]:
+					cls[e] = 2 # FORWARD EDGE
+				else:
+					cls[e] = 3 # CROSS EDGE
+					if scc[v] < 0 and d[v] < low[u]: low[u] = d[v]
+			else:
+				nodes.pop()
+				edges.pop()
+				time += 1
+				f[u] = time
+				post.append(u)
+				if nodes and low[u] < low[nodes[-1]]: low[nodes[-1]] = low[u]
+				if low[u] == d[u]: # u est la racine d'une composante fortement connexe
+					while True:
+						v = open_scc.pop()
+						scc[v] = nb_scc
+						if v == u: break
+					nb_scc += 1
+	post = np.array(post, dtype=np.int32)
+	return { 'd': np.array(d, dtype=np.int32), 'f': np.array(f, dtype=np.int32), 'pi': np.array(pi, dtype=np.int32),
+		'class': np.array(cls, dtype=np.int8), 'postorder': post, 'acyclic': acyclic, 'topo': post[::-1].copy() if acyclic else None,
+		'scc': np.array(scc, dtype=np.int32), 'nb_scc': nb_scc }
+
+def dfs(g, csr = None):
+	"""
+	Parcours en profondeur de g (voir dfs_csr) sur l'adjacence de adjacency_csr, sommets et voisins dans l'ordre de leurs index ;
+	le résultat contient aussi 'names', le sommet de chaque index. csr : résultat de adjacency_csr(g) s'il est déjà calculé.
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	res = dfs_csr(ptr, targets)
+	res['names'] = names
+	return res
+
+def strongly_connected_components(g, csr = None):
+	"""
+	Composantes fortement connexes de g (Tarjan) : liste de listes de sommets, dans l'ordre topologique inverse du graphe des composantes.
+	"""
+	res = dfs(g, csr)
+	names = res['names']
+	comps = [ [] for i in range(res['nb_scc']) ]
+	for i, c in enumerate(res['scc'].tolist()):
+		comps[c].append(names[i])
+	return comps
 
 def DFS(g):
-	g['DFS']={'color':{},'pred':{},'time': 0,'class':{},'d':{},'f':{}, 'Cyclique' : False, 'tritopo' : [] }
-	for u in sorted(g['nodes_index']):#initialisation des sommets
-		g['DFS']['color'][u]='WHITE'
-		g['DFS']['pred'][u]= None
-	g['DFS']['time']= 0
-	for u in sorted(g['nodes_index'].keys(), reverse = False, key=lambda t: t[0]):#Tri du dictionnaire selon les vertex
-		if g['DFS']['color'][u]=='WHITE':#Si le vertex n'est pas traité,
-			DFS_VISIT(g,u)#On le visite
-	if g['DFS']['Cyclique']==False: #Si le graphe est acyclique
-		for u in sorted(g['DFS']['f'].items(), reverse = True, key=lambda t: t[1]):#On tri selon les valeurs de temps de fin de traitement de manière décroissante
-			g['DFS']['tritopo'].append(u)#on ajoute au sous dictionnaire 'tritopo' qui s'avère etre une liste qui sera ordonnée sous la forme du tri topologique de notre graphe apres DFS	
+	"""
+	Version historique de dfs : le résultat est rangé dans g['DFS'] par nom de sommet (couleurs, prédécesseurs, temps,
+	classes des arcs, caractère cyclique et tri topologique sous forme de couples (sommet, temps de fin)).
+	"""
+	names, ptr, targets, weights = csr = adjacency_csr(g)
+	res = dfs(g, csr)
+	g['DFS']={'color':{},'pred':{},'time': 2 * len(names),'class':{},'d':{},'f':{}, 'Cyclique' : not res['acyclic'], 'tritopo' : [] }
+	d, f, pi = res['d'].tolist(), res['f'].tolist(), res['pi'].tolist()
+	for i, u in enumerate(names):
+		g['DFS']['color'][u] = 'BLACK'
+		g['DFS']['pred'][u] = names[pi[i]] if pi[i] >= 0 else None
+		g['DFS']['d'][u] = d[i]
+		g['DFS']['f'][u] = f[i]
+	cls = res['class'].tolist()
+	targets = targets.tolist()
+	for i, u in enumerate(names):
+		for e in range(ptr[i], ptr[i+1]):
+			g['DFS']['class'][(u, names[targets[e]])] = EDGE_CLASSES[cls[e]]
+	if res['acyclic']:
+		g['DFS']['tritopo'] = [ (names[i], f[i]) for i in res['topo'].tolist() ]
 	return(g)
 	
-def DFS_VISIT(g,u):
-	g['DFS']['color'][u] = 'GRAY'
-	g['DFS']['time'] = g['DFS']['time'] + 1
-	g['DFS']['d'][u] = g['DFS']['time']
-	for v in sorted(g['edges'][u].keys(), key=lambda t: t[0]):#Tri des voisins de u selon leur ordre d'indexation
-		if g['DFS']['color'][v]=='WHITE':
-			g['DFS']['pred'][v]= u#si on est arrivé au sommet v en passant par u,
-			DFS_VISIT(g,v)#récursion afin de visiter l'ensemble du graphe
-			g['DFS']['class'][(u,v)] = 'TREE EDGE'#Voir compte rendu
-		elif g['DFS']['color'][v]=='GRAY':
-			g['DFS']['class'][(u,v)] = 'BACK EDGE'#Voir compte rendu
-			g['DFS']['Cyclique']=True#Ajout de l'information sur le caractère cyclique du graphe
-		elif g['DFS']['d'][u] > g['DFS']['d'][v]:
-			g['DFS']['class'][(u,v)] = 'CROSS EDGE'#Voir compte rendu
-		elif g['DFS']['d'][v] > g['DFS']['d'][u]:
-			g['DFS']['class'][(u,v)] = 'FORWARD EDGE'#Voir compte rendu
-	g['DFS']['color'][u]='BLACK'
-	g['DFS']['time'] = g['DFS']['time'] + 1
-	g['DFS']['f'][u]=g['DFS']['time']
-	return(g)
-
-
 #g = load_TAB('testDFS.tab')
 #g = DFS(g)
 #pprint(g)	
@@ -146,97 +559,320 @@ def DFS_VISIT(g,u):
 
 def initialize_single_source(g, s):
 	g['BellFord'] = {'d' : {} , 'pi' : {}}
-	for v in g['nodes_index']:
+	for v in node_names(g):
 		g['BellFord']['d'][v]= float('inf')
 		g['BellFord']['pi'][v] = None
 	g['BellFord']['d'][s]=0
 	return(g)
 
 def relax(g , u, v):
-	if g['BellFord']['d'][v] > g['BellFord']['d'][u] + int(g['edges'][u][v]['weight']):
-		g['BellFord']['d'][v] = g['BellFord']['d'][u] + int(g['edges'][u][v]['weight'])
+	w = edge_weight(g, g['edges'][u][v])
+	if g['BellFord']['d'][v] > g['BellFord']['d'][u] + w:
+		g['BellFord']['d'][v] = g['BellFord']['d'][u] + w
 		g['BellFord']['pi'][v] = u 
 
-def bellman_ford(g , s):
-	initialize_single_source(g,s)
-	for i in range(len(g['nodes']) - 1):
-		for u  in g['edges']:
-			for v in g['edges'][u]:			
-				relax(g,u , v)
+def _shortest_result(names, s, d, pi, weights):
+	# distances entières quand tous les poids le sont, comme avant la conversion des poids en float par adjacency_csr
+	if np.all(weights == np.round(weights)):
+		d = [ x if x == math.inf else int(x) for x in d ]
+	return { 'names': names, 'source': s, 'd': d, 'pi': np.array(pi, dtype=np.int32) }
+
+def dijkstra(g, s, csr = None):
+	"""
+	Plus courts chemins depuis s (nom ou index) pour des poids positifs ou nuls, avec un tas binaire (heapq) :
+	O((n + m) log n). Retourne { 'names', 'source', 'd' (liste des distances, inf si non atteint), 'pi' (prédécesseurs, -1 si aucun) }.
+	csr : résultat de adjacency_csr(g) s'il est déjà calculé.
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	if (weights < 0).any(): raise ValueError('dijkstra: poids négatifs, utiliser bellman_ford')
+	n = len(names)
+	ptr = ptr.tolist()
+	tg = targets.tolist()
+	w = weights.tolist()
+	s = _node_index(g, s)
+	d = [ math.inf ] * n
+	pi = [ -1 ] * n
+	done = [ False ] * n
+	d[s] = 0
+	heap = [ (0, s) ]
+	while heap:
+		du, u = heapq.heappop(heap)
+		if done[u]: continue # entrée périmée du tas
+		done[u] = True
+		for e in range(ptr[u], ptr[u+1]):
+			v = tg[e]
+			dv = du + w[e]
+			if dv < d[v]:
+				d[v] = dv
+				pi[v] = u
+				heapq.heappush(heap, (dv, v))
+	return _shortest_result(names, s, d, pi, weights)
+
+def bellman_ford_csr(g, s, spfa = False, csr = None):
+	"""
+	Bellman-Ford depuis s (nom ou index), poids quelconques.
+	Par passes sur tous les arcs, arrêtées dès qu'une passe ne change plus rien ; spfa : seuls les arcs des sommets dont la
+	distance vient de changer sont relâchés (file de travail).
+	Retourne { 'names', 'source', 'd', 'pi', 'negative_cycle' } : negative_cycle est True si un circuit de poids négatif est
+	atteignable depuis s (les distances ne sont alors pas définies).
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	n = len(names)
+	ptr = ptr.tolist()
+	tg = targets.tolist()
+	w = weights.tolist()
+	s = _node_index(g, s)
+	d = [ math.inf ] * n
+	pi = [ -1 ] * n
+	d[s] = 0
+	negative = False
+	if spfa:
+		queued = [ False ] * n
+		count = [ 0 ] * n # nombre de fois qu'un sommet est mis dans la file, n fois signale un circuit négatif
+		Q = deque([ s ])
+		queued[s] = True
+		while Q and not negative:
+			u = Q.popleft()
+			queued[u] = False
+			du = d[u]
+			for e in range(ptr[u], ptr[u+1]):
+				v = tg[e]
+				if du + w[e] < d[v]:
+					d[v] = du + w[e]
+					pi[v] = u
+					if not queued[v]:
+						count[v] += 1
+						if count[v] >= n:
+							negative = True
+							break
+						queued[v] = True
+						Q.append(v)
+	else:
+		src = np.repeat(np.arange(n), np.diff(ptr)).tolist()
+		for i in range(n):
+			changed = False
+			for u, v, wuv in zip(src, tg, w):
+				if d[u] + wuv < d[v]:
+					d[v] = d[u] + wuv
+					pi[v] = u
+					changed = True
+			if not changed: break
+		else: # une n-ième passe a encore changé une distance
+			negative = n > 0
+	res = _shortest_result(names, s, d, pi, weights)
+	res['negative_cycle'] = negative
+	return res
+
+def bellman_ford(g , s, spfa = False):
+	"""
+	Version historique : le résultat de bellman_ford_csr est rangé dans g['BellFord'] par nom de sommet
+	(d, pi et negative_cycle).
+	"""
+	res = bellman_ford_csr(g, s, spfa)
+	names = res['names']
+	pi = res['pi'].tolist()
+	g['BellFord'] = {'d' : dict(zip(names, res['d'])), 'pi' : { u: names[pi[i]] if pi[i] >= 0 else None for i, u in enumerate(names) },
+		'negative_cycle': res['negative_cycle'] }
 	return(g)
 	
+def edge_weight(g, attributes):
+	"""
+	Poids d'un arc : son attribut g['weight_attribute'] (ou 'weight'), 1 s'il n'en a pas (arcs non pondérés, graphes de la GO).
+	"""
+	w = attributes.get(g['weight_attribute'] or 'weight')
+	if w is None: return 1
+	return w if isinstance(w, (int, float)) else _number(w)
+
 def adjacency_matrix(g):
 	"""
 	Retourne la matrice d'adjacence associée au graphe avec 1 si aucune valeur de poids d'arc n'est définis
 	
 	"""
-	matrix_size = int(g['nb_nodes'])
+	names, ptr, targets, weights = adjacency_csr(g)
+	matrix_size = len(names)
 	mat = np.full( (matrix_size, matrix_size), np.inf)#Création d'une matrice carrée rempli d'infini
-	for u in sorted(g['nodes_index']):
-		for v in sorted(g['edges'][u]):#pour tous les voisins de u.
-			if g['edges'][u][v]['weight'] == None:
-				mat[g['nodes_index'][u],g['nodes_index'][v]]=1#le point correspondant aux coordonnées des vertex prend la valeur 1 
-			else:
-				mat[g['nodes_index'][u],g['nodes_index'][v]]=g['edges'][u][v]['weight']#ou il prend la valeur du poids de l'arc
+	mat[np.repeat(np.arange(matrix_size), np.diff(ptr)), targets] = weights#le point correspondant aux coordonnées des vertex prend la valeur du poids de l'arc (1 sans poids)
 	return(mat)
 
-	
-def successeur_matrix(g):
-	"""
-	Retourne la matrice de successeur de chaques sommets.
-	"""
-	matrix_size = g['nb_nodes']
-	N = np.full( (matrix_size, matrix_size), None)
-	adj = adjacency_matrix(g)
-	for i in range(g['nb_nodes']):
-		for j in range(g['nb_nodes']):
-			if adj[i,j]!=np.inf:
-				N[i,j]=int(i)
-			if i == j:
-				N[i,j]= None
+def node_order(g):
+	"""
+	Vue triée des sommets (names, index : nom <-> index) : ordre de g['nodes_index'] s'il couvre tous les sommets (trigraphe),
+	ordre trié des noms sinon. Elle est calculée une seule fois puis gardée dans g['_node_order'] jusqu'au prochain ajout de
+	sommet, au lieu de trier les sommets à chaque algorithme.
+	"""
+	if is_compact(g): return g['names'], g['index']
+	view = g.get('_node_order')
+	if view is None or len(view[0]) != len(g['nodes']):
+		if len(g['nodes_index']) == len(g['nodes']):
+			names = sorted(g['nodes_index'], key=g['nodes_index'].get)
+		else:
+			names = sorted(g['nodes'])
+		view = g['_node_order'] = (names, { u: i for i, u in enumerate(names) })
+	return view
+
+def node_names(g):
+	"""
+	Sommets dans l'ordre de leur index (voir node_order).
+	"""
+	return node_order(g)[0]
+
+def adjacency_csr(g):
+	"""
+	Matrice d'adjacence creuse (CSR), sans matrice n x n : les arcs du sommet d'index i vont vers targets[ptr[i]:ptr[i+1]]
+	(index triés) avec les poids weights[ptr[i]:ptr[i+1]] (1 pour les arcs sans poids).
+	Retourne (names, ptr, targets, weights), names donnant le sommet de chaque index (voir node_names).
+	Pour un graphe compact (compact_graph), ce sont ses propres tableaux.
+	Elle est gardée dans g['_csr'] jusqu'au prochain add_node ou add_edge (ou changement de node_order, du nombre d'arcs ou de
+	g['weight_attribute']) : bfs, BFS, dfs, dijkstra... ne la recalculent pas à chaque parcours. Les attributs d'un arc
+	modifiés directement dans g['edges'] ne sont donc vus qu'après g['_csr'] = None.
+	"""
+	if is_compact(g):
+		weights = g['weights'] if g['weights'] is not None else np.ones(len(g['targets']))
+		return g['names'], g['ptr'], g['targets'], weights
+	view = node_order(g)
+	key = (g['nb_edges'], g['weight_attribute'])
+	cached = g.get('_csr')
+	if cached is not None and cached[0] is view and cached[1] == key:
+		return cached[2]
+	names, index = view
+	ptr = np.zeros(len(names) + 1, dtype=np.int64)
+	targets = []
+	weights = []
+	for i, u in enumerate(names):
+		edges = g['edges'][u]
+		out = sorted( (index[v], edge_weight(g, edges[v])) for v in edges )
+		targets.extend( v for v, w in out )
+		weights.extend( w for v, w in out )
+		ptr[i+1] = len(targets)
+	csr = names, ptr, np.array(targets, dtype=np.int32), np.array(weights, dtype=np.float64)
+	for a in csr[1:]: a.flags.writeable = False # partagés par tous les parcours
+	g['_csr'] = (view, key, csr)
+	return csr
+
+DIST_BLOCK_BYTES = 64 << 20 # mémoire d'un bloc de lignes de distance_blocks
+
+def distance_blocks(g, sources = None, block = None, csr = None):
+	"""
+	Distances des plus courts chemins depuis les sommets sources (index, voir adjacency_csr ; tous par défaut), par blocs de
+	lignes : génère (index des sources du bloc, matrice des distances len(bloc) x n, inf quand il n'y a pas de chemin).
+	Parcours en largeur simultanés (bfs_distances) si les arcs n'ont pas de poids, Dijkstra sinon (Johnson s'il y a des poids
+	négatifs), sur la matrice creuse : la mémoire ne dépend que de la taille des blocs (DIST_BLOCK_BYTES par défaut).
+	csr : résultat de adjacency_csr(g) s'il est déjà calculé.
+	"""
+	names, ptr, targets, weights = adjacency_csr(g) if csr is None else csr
+	n = len(names)
+	if sources is None: sources = np.arange(n)
+	sources = np.asarray(sources, dtype=np.int32)
+	if (weights == 1).all(): # parcours en largeur simultanés
+		for rows, d in bfs_distances(g, sources, block, (names, ptr, targets, weights)):
+			yield rows, np.where(d < 0, np.inf, d)
+		return
+	from scipy.sparse import csgraph, csr_matrix # Dijkstra compilé, seulement nécessaire pour les graphes pondérés
+	A = csr_matrix((weights, targets, ptr), shape=(n, n)) # les poids nuls restent des arcs
+	if block is None: block = max(1, DIST_BLOCK_BYTES // (8 * max(1, n)))
+	for start in range(0, len(sources), block):
+		rows = sources[start:start+block]
+		yield rows, csgraph.shortest_path(A, directed=True, indices=rows)
+
+def all_pairs_distances(g, out = None, block = None):
+	"""
+	Matrice n x n des distances entre tous les sommets (index de adjacency_csr), calculée par blocs de lignes avec distance_blocks.
+	out : nom d'un fichier .npy, la matrice (float32) y est alors écrite bloc par bloc et retournée en memory-map.
+	"""
+	csr = adjacency_csr(g)
+	n = len(csr[0])
+	if out is None: D = np.empty((n, n))
+	else: D = np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=(n, n))
+	for rows, d in distance_blocks(g, block=block, csr=csr):
+		D[rows[0]:rows[-1]+1] = d
+	if out is not None: D.flush()
+	return D
+
+NO_PRED = -1 # sentinelle des matrices de prédécesseurs : pas de prédécesseur (i == j ou pas de chemin)
+FW_BLOCK = 256 # taille des blocs de floyd_warshall, pour que les blocs manipulés tiennent en cache
+
+def successeur_matrix(g, adj = None):
+	"""
+	Retourne la matrice des prédécesseurs initiale (int32) : N[i,j] = i s'il existe un arc i -> j, NO_PRED sinon et sur la diagonale.
+	"""
+	if adj is None: adj = adjacency_matrix(g)
+	n = len(adj)
+	N = np.where(adj != np.inf, np.arange(n, dtype=np.int32)[:, None], np.int32(NO_PRED)).astype(np.int32)
+	np.fill_diagonal(N, NO_PRED)
 	return(N)
 
-#pour lindex des sommets :
-#print('index des sommets')
-#	for u in g['nodes']:
-#		print(u, g['nodes'][u])
-def floyd_warshall(g):
-	g['Floyd'] = {'D' : adjacency_matrix(g), 'N' : successeur_matrix(g), 'path' : [], 'diameter' : 0 }
-	for i in range(len(g['Floyd']['D'])):
-		for j in range(len(g['Floyd']['D'])):
-			g['Floyd']['D'][i,i]=int(0)
-	for k in range(len(g['nodes'])):
-		for i in range(len(g['nodes'])):
-			for j in range(len(g['nodes'])):
-				if g['Floyd']['D'][i,k] + g['Floyd']['D'][k,j] < g['Floyd']['D'][i,j]:
-					g['Floyd']['D'][i,j] = g['Floyd']['D'][i,k]+g['Floyd']['D'][k,j]
-					g['Floyd']['N'][i,j] = g['Floyd']['N'][k,j]
-	lst = []
-	for i in range(len(g['Floyd']['D'])):
-		lst.append(max(g['Floyd']['D'][i]))
-	g['Floyd']['diameter'] = int((max(lst)))
+def _fw_update(D, N, I, J, K):
+	"""
+	Etapes k de K (tranche d'indices) de Floyd-Warshall restreintes au bloc D[I,J] : une mise à jour min-plus vectorisée par k.
+	"""
+	d = D[I, J]
+	n = N[I, J]
+	for k in range(K.start, K.stop):
+		cand = D[I, k][:, None] + D[k, J][None, :]
+		better = cand < d
+		np.copyto(d, cand, where=better)
+		np.copyto(n, np.broadcast_to(N[k, J], n.shape), where=better)
+
+def floyd_warshall(g, block = None):
+	"""
+	Plus courts chemins entre tous les couples de sommets (indexés par g['nodes_index'], voir trigraphe).
+	g['Floyd']['D'] : matrice des distances, g['Floyd']['N'] : matrice des prédécesseurs (int32, NO_PRED si aucun),
+	g['Floyd']['diameter'] : plus grande distance finie.
+	Chaque étape k est une mise à jour min-plus de toute la matrice ; au-delà de block sommets (FW_BLOCK par défaut),
+	la matrice est traitée par blocs (version par blocs de Floyd-Warshall) pour rester en cache.
+	Les distances sont les mêmes dans les deux cas, seul le choix entre plusieurs plus courts chemins de même longueur peut changer.
+	"""
+	D = adjacency_matrix(g)
+	N = successeur_matrix(g, D)
+	np.fill_diagonal(D, 0)
+	n = len(D)
+	if block is None: block = FW_BLOCK
+	if n <= block:
+		_fw_update(D, N, slice(0, n), slice(0, n), slice(0, n))
+	else:
+		blocks = [ slice(b, min(n, b + block)) for b in range(0, n, block) ]
+		for K in blocks:
+			_fw_update(D, N, K, K, K) # bloc diagonal
+			for B in blocks: # ligne et colonne du bloc diagonal
+				if B != K:
+					_fw_update(D, N, K, B, K)
+					_fw_update(D, N, B, K, K)
+			for I in blocks: # autres blocs
+				if I == K: continue
+				for J in blocks:
+					if J != K: _fw_update(D, N, I, J, K)
+	g['Floyd'] = {'D' : D, 'N' : N, 'path' : [], 'diameter' : diameter(D) }
 	return(g)
 
+def diameter(D):
+	"""
+	Plus grande distance finie de la matrice des distances D (entier si les poids le sont).
+	"""
+	finite = D[np.isfinite(D)]
+	d = finite.max() if len(finite) else 0
+	return int(d) if d == int(d) else float(d)
 
-#a modifier
-def shortest_path(g,i,j):
-	if i != j:
-		if g['Floyd']['D'][i,j] == np.inf:
-			print("il n'y a pas de chemins")
-		else : 
-			g['Floyd']['path'].append(i)
-			k = int(g['Floyd']['N'][i,j])
-			km= -1
-			print(k)
-			g['Floyd']['path'].append(k)
-			while math.isnan(g['Floyd']['N'][k,i])==False and k != km and k != j:			
-				k = int(g['Floyd']['N'][k,i])
-				g['Floyd']['path'].append(k)
-				km = k 
-			g['Floyd']['path'].append(j)
-		return(g)
-	else : 
-		return(g)
+def shortest_path(g, i, j):
+	"""
+	Plus court chemin de i à j (index ou nom de sommet) reconstruit à partir de la matrice des prédécesseurs de floyd_warshall.
+	Le chemin (liste d'index) est placé dans g['Floyd']['path'], vide s'il n'y a pas de chemin.
+	"""
+	names = node_names(g)
+	i = _node_index(g, i)
+	j = _node_index(g, j)
+	N = g['Floyd']['N']
+	path = []
+	if g['Floyd']['D'][i,j] == np.inf:
+		print("il n'y a pas de chemins")
+	else:
+		k = j
+		while k != i:
+			path.append(int(k))
+			k = N[i,k]
+		path.append(int(i))
+		path.reverse()
+	g['Floyd']['path'] = path
+	return(g)
 	
 if __name__ == "__main__":	
 	
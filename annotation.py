@@ -4,74 +4,102 @@
 ###Berlin Tristan
 ###Programme permettant d'obtenir les fichier sets à partir de la
 ###Gene Ontology et d'un fichier GOA lié
+###
+###Mode batch (plusieurs espèces, la Gene Ontology n'est chargée qu'une fois) :
+###    python3 annotation.py -k both -j 4 --overwrite 17.D_melanogaster.goa 493.P_falciparum.goa
+###Sans fichier GOA en argument, le nom du fichier et le type d'annotation sont demandés comme avant.
 
 import GeneOntology as gr
+import GOSets
+import GOSnapshot as snap
+import argparse
 import datetime
+import multiprocessing
+import os
+import sys
 
-spc = input("Veuillez entrer le nom du fichier :")
-num = input ("Quelle annotation? Direct[1] ou Implicit[2] :")
+KINDS = { 'direct': gr.ordered_direct_gene_products, 'implicit': gr.ordered_implicit_gene_products }
 
-###Récupérer la liste des gènes à la manière de la fonction GeneProducts de l'année dernière
-def recupGene(Got, GP, all = True):
-    if all:
-        for t in OBO["edges"][Got]:
-            if OBO["nodes"][t]["type"] == "GeneProduct" and (OBO["nodes"][t]["id"]) not in GP:
-                GP.append((OBO["nodes"][t]["id"]))
-            elif OBO["nodes"][t]["type"] == "GOTerm":
-                recupGene(OBO["nodes"][t]["id"], GP)
-    else:
-        for t in OBO["edges"][Got]:
-            if OBO["nodes"][t]["type"] == "GeneProduct" and (OBO["nodes"][t]["id"]) not in GP:
-                GP.append((OBO["nodes"][t]["id"]))
-    return(GP)
+###Ontologie chargée une seule fois par le processus principal, partagée par les processus fils (fork)
+ONTO = None
 
-if int(num) == 1 or str(num) == "Direct":
-    ##Création du fichier sets
-    nomFichier = str(spc) + "_direct.sets"
-    fichier = open(nomFichier, "x")
-    ##Chargement de la Gene Ontology et du fichier GOA
-    OBO = gr.load_OBOMD("go.obo")
-    gr.load_GOAMD(OBO,spc)
-    exit
-    fichier.write("# format: sets")
-    fichier.write("\n# version: 1.0")
-    fichier.write("\n# strain: "+ str(spc))
-    fichier.write("\n# date: "+ str(datetime.datetime.now()))
-    fichier.write("\n# comment: Gene Ontology terms direct")
-    ###Pour les directs
-    for i in OBO["nodes"]:
-        if OBO["nodes"][i]["type"] == "GOTerm":
-            listeGP = []
-            Got = OBO["nodes"][i]["id"]
-            Desc = OBO["nodes"][i]["name"]
-            recupGene(Got, listeGP, all = False)
-            if len(listeGP) != 0:
-                listeGP = "\t".join(listeGP)
-                fichier.write("\n" +str(Got) + "\t" +  str(Desc) + "\t" + str(listeGP))
-    fichier.close()
+###Nom du fichier sets d'un fichier GOA : à côté du GOA, ou dans outdir ; compress : extension de compression (gz ou xz)
+def sets_filename(spc, kind, outdir = None, compress = None):
+    nomFichier = str(spc) + "_" + kind + ".sets"
+    if compress is not None:
+        nomFichier += "." + compress
+    if outdir is not None:
+        nomFichier = os.path.join(outdir, os.path.basename(nomFichier))
+    return nomFichier
 
+###Écrit le fichier sets de type kind (direct ou implicit) : chaque terme GO (dans l'ordre des noeuds du graphe) suivi de ses produits de gènes
+###GOSets.SetsWriter écrit par gros blocs (compressé si le nom finit par .gz ou .xz), sous un nom temporaire renommé à la fin
+###sidecar : écrit aussi le fichier binaire <nomFichier>.snap, relu par GOSets.read_sets à la place du texte
+###Sans overwrite, un fichier existant n'est pas remplacé (FileExistsError)
+def write_sets(nomFichier, spc, onto, annot, kind, overwrite = False, sidecar = False):
+    if not overwrite and os.path.exists(nomFichier):
+        raise FileExistsError("%s existe déjà (utiliser --overwrite)" % nomFichier)
+    ptr, gps = KINDS[kind](onto, annot)
+    ptr = ptr.tolist()
+    ids = onto["ids"]
+    names = onto["names"]
+    header = [ ("strain", str(spc)), ("date", str(datetime.datetime.now())), ("comment", "Gene Ontology terms direct") ]
+    with GOSets.SetsWriter(nomFichier, header, elements=annot["gp_ids"], overwrite=overwrite, sidecar=sidecar) as fichier:
+        for i in onto["order"].tolist():
+            fichier.write(ids[i], names[i], gps[ptr[i]:ptr[i+1]])
+    return nomFichier
 
-###Pour les indirects
-elif int(num) == 2 or str(num) == "Implicit":
-    ##Création du fichier
-    nomFichier = str(spc) + "_implicit.sets"
-    fichier = open(nomFichier, "x")
-    #Chargement de la Gene Ontology et du fichier GOA
-    OBO = gr.load_OBOMD("go.obo")
-    gr.load_GOAMD(OBO, spc)
-    fichier.write("# format: sets")
-    fichier.write("\n# version: 1.0")
-    fichier.write("\n# strain: "+ str(spc))
-    fichier.write("\n# date: "+ str(datetime.datetime.now()))
-    fichier.write("\n# comment: Gene Ontology terms direct")
-    for i in OBO["nodes"]:
-        if OBO["nodes"][i]["type"] == "GOTerm":
-           # GP = gr.GeneProducts(OBO, OBO["nodes"][i]["id"])
-           Got = OBO["nodes"][i]["id"]
-           Desc = OBO["nodes"][i]["name"]
-           GP = []
-           recupGene(Got, GP)
-           if len(GP) != 0:
-               GP = "\t".join(GP)
-               fichier.write("\n" +str(Got) + "\t" +  str(Desc) + "\t" + str(GP))
-    fichier.close()
+###Tous les fichiers sets demandés pour un fichier GOA ; renvoie (GOA, fichiers écrits, erreur ou None)
+def species_sets(spc, kinds, overwrite = False, outdir = None, compress = None, sidecar = False):
+    try:
+        annot = snap.load_cached_annotations(ONTO, spc) # re-parsed only when go.obo or the GOA file changed
+        written = [ write_sets(sets_filename(spc, kind, outdir, compress), spc, ONTO, annot, kind, overwrite, sidecar) for kind in kinds ]
+        return spc, written, None
+    except Exception as e:
+        return spc, [], "%s: %s" % (type(e).__name__, e)
+
+###Traite les fichiers GOA, répartis sur jobs processus fils qui partagent l'ontologie déjà chargée
+def batch(obo, goas, kinds, jobs = 1, overwrite = False, outdir = None, compress = None, sidecar = False):
+    global ONTO
+    ONTO = snap.load_cached(obo)[0]
+    args = [ (spc, kinds, overwrite, outdir, compress, sidecar) for spc in goas ]
+    if jobs > 1 and len(goas) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context("fork").Pool(min(jobs, len(goas))) as pool:
+            return pool.starmap(species_sets, args, chunksize=1)
+    return [ species_sets(*a) for a in args ]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='Write the direct and/or implicit .sets files of GOA files')
+    parser.add_argument('goa', nargs='*', help='GOA files (asked interactively when none is given).')
+    parser.add_argument('-k', '--kind', choices=['direct', 'implicit', 'both'], default='both', help='Sets to write (both by default).')
+    parser.add_argument('-o', '--obo', default='go.obo', help='Gene Ontology file (go.obo by default).')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes.')
+    parser.add_argument('-f', '--overwrite', action='store_true', help='Replace the existing .sets files.')
+    parser.add_argument('-d', '--outdir', default=None, help='Directory of the .sets files (next to the GOA files by default).')
+    parser.add_argument('-z', '--compress', choices=['gz', 'xz'], default=None, help='Compress the .sets files with gzip or lzma.')
+    parser.add_argument('-s', '--sidecar', action='store_true', help='Also write the binary <file>.snap next to each .sets file, read instead of the text by blastsetmodifie.py.')
+    args = parser.parse_args(argv)
+
+    goas = args.goa
+    kinds = [ 'direct', 'implicit' ] if args.kind == 'both' else [ args.kind ]
+    if not goas: # mode interactif
+        spc = input("Veuillez entrer le nom du fichier :")
+        num = input ("Quelle annotation? Direct[1] ou Implicit[2] :")
+        goas = [ spc ]
+        if num in ("1", "Direct"):
+            kinds = [ 'direct' ]
+        elif num in ("2", "Implicit"):
+            kinds = [ 'implicit' ]
+        else:
+            parser.error("annotation inconnue : %s" % num)
+    erreurs = 0
+    for spc, written, erreur in batch(args.obo, goas, kinds, args.jobs, args.overwrite, args.outdir, args.compress, args.sidecar):
+        if erreur is not None:
+            erreurs += 1
+            print("%s : %s" % (spc, erreur), file=sys.stderr)
+        for nomFichier in written:
+            print(nomFichier)
+    return 1 if erreurs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,10 +14,12 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import GOSets
 import numpy as np
 import random as rd
 from os.path import isfile
-from scipy.stats import binom, hypergeom, chi2_contingency
+from scipy.sparse import csc_matrix, csr_matrix
+from scipy.stats import binom, hypergeom, chi2
 
 # SCRIPT PARAMETERS
 # e.g. ./blastset.py --sets EcolA.biocyc.sets --query 'ALAS ARGS ASNS ASPS CYSS GLTX GLYQ GLYS HISS ILES'
@@ -30,42 +32,67 @@ parser.add_argument('-m', '--measure', required=False, default='binomial', help=
 parser.add_argument('-l', '--limit', required=False, type=int, default=0, help='Maximum number of results to report.')
 parser.add_argument('-r', '--random', required=False, type=int, default=10, help='Number of randomized genes. Doesn''t work if there is already a query. 10 by default' )
 parser.add_argument('-R', '--round', required=False, type=int, default=1, help='How much do you want to run the program. Not necessary with a query')
+parser.add_argument('-s', '--sidecar', required=False, action="store_true", help='Save the parsed sets to <sets>.snap, read instead of the text by the next runs.')
 param = parser.parse_args()
 
-class ComparedSet(object):
-    def __init__(self, id, name = '', common = 0, size = 0, pvalue = 1, elements = [], c = []):
-        self.id = id
-        self.name = name
-        self.common = common
-        self.size = size
-        self.pvalue = pvalue
-        self.elements = elements
-        self.c = c
+BATCH = 256 # queries evaluated together (one sparse product)
+
+# P-VALUES OF ALL THE SETS AT ONCE
+# c: number of query elements in each set, t: size of each set, q: query size (arrays), g: population size
+def pvalues(measure, c, t, q, g):
+    if measure=='binomial': # binom.cdf(>=success, attempts, proba)
+        # p_success = 384/2064, 152 attempts, 61 success
+        #~ pval = binom.pmf(61, 152, 384.0/2064)
+        return binom.cdf( q - c, q, 1 - t/g)
+    elif measure=='hypergeometric': # hypergeom.sf(common-1, population, target, query) = 1-p( X <= x-1 ) = p( X >= x )
+        return hypergeom.sf(c-1, g, t, q)
+    elif measure=='chi2': # chi2_contingency of the table [[c,q-c,q],[t-c,g-q-t+c,g-q],[t,g-t,g]] of each set, computed as scipy does
+        observed = np.stack([c, q-c, q, t-c, g-q-t+c, g-q, t, g-t, np.full_like(c, g)], axis=1).astype(np.float64).reshape(-1, 3, 3)
+        expected = observed.sum(axis=2)[:, :, None] * observed.sum(axis=1)[:, None, :] / observed.reshape(-1, 9).sum(axis=1)[:, None, None]
+        if np.any(expected == 0):
+            raise ValueError("The internally computed table of expected frequencies has a zero element.")
+        stat = ((observed - expected)**2 / expected).reshape(-1, 9).sum(axis=1)
+        return chi2.sf(stat, 4) # (3-1)*(3-1) degrees of freedom, no continuity correction
+    elif measure=='coverage': #Coverage
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pval = 1 - ((c / q) * (c / t))
+        return np.where(c == 0, 1.0, np.where((c == q) & (c == t), 0.0, pval))
+    print('sorry,-m  %s not (yet) implemented' % ( measure ))
+    exit(1)
+
+# P-VALUES OF THE DISTINCT (c, t, q) TRIPLES ONLY
+# c, t and q are broadcast together (e.g. sets x queries): most sets share their triple with others (e.g. no common
+# element), the p-values are computed once per triple
+def enrichment(measure, c, t, q, g):
+    c, t, q = np.broadcast_arrays(c, t, q)
+    shape = c.shape
+    c, t, q = c.ravel(), t.ravel(), q.ravel()
+    if c.size == 0: return np.zeros(shape)
+    key = np.ravel_multi_index((q, t, c), (q.max() + 1, t.max() + 1, c.max() + 1))
+    key, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return pvalues(measure, c[first], t[first], q[first], g)[inverse.reshape(-1)].reshape(shape)
 
 # LOAD REFERENCE SETS
-def load_sets(filename):
-    sets = {}
-    ids = set()
-    listgene = []
-    with open( filename ) as f:
-        content = f.read()
-        lines = content.split('\n')
-        for l in lines:
-            words = l.split('\t')
-            if len(words) > 2 and not words[0].startswith('#'):
-                id = words.pop(0)
-                name = words.pop(0)
-                words = set(words)
-                sets[ id ] = { 'name': name, 'elements': words}
-                for i in words:
-                    listgene.append(i)
-                ids |= words
-    return [ sets, len( ids ), listgene ]
-(sets, population_size, listgene) = load_sets(param.sets)
-j = 0
-while j < param.round:
-    # LOAD QUERY
-    text = param.query
+# read with GOSets: the .sets file may be compressed, and its binary sidecar (<file>.snap) is used when it is up to date
+# the sidecar is only written when save is True (--sidecar)
+# the sets are compiled into a sparse incidence matrix (sets x elements, 1 when the element belongs to the set)
+def load_sets(filename, save=False):
+    data = GOSets.read_sets(filename, save=save)
+    ptr = data['ptr']
+    members = data['members']
+    elements = list(data['elements'])
+    rows = np.repeat(np.arange(data['nb_sets']), np.diff(ptr))
+    incidence = csr_matrix((np.ones(len(members), dtype=np.int32), (rows, members)), shape=(data['nb_sets'], len(elements)))
+    incidence.sum_duplicates()
+    incidence.data[:] = 1 # an element listed twice in a set counts once
+    sets = { 'ids': data['ids'], 'names': data['names'], 'elements': elements, 'index': { e: i for i, e in enumerate(elements) },
+        'incidence': incidence, 'sizes': np.diff(incidence.indptr).astype(np.int64) }
+    listgene = [ elements[i] for i in incidence.indices.tolist() ] # each element once per set it belongs to
+    population = len(np.unique(incidence.indices))
+    return [ sets, population, listgene ]
+
+# LOAD QUERY
+def load_query(text, listgene):
     query = set()
     if isfile(text):
         with open(text) as f:
@@ -85,48 +112,45 @@ while j < param.round:
         query |= set(hasard.split())
     else: # parse string
         query |= set(text.split())
+    return query
+
+# OVERLAPS OF A BATCH OF QUERIES WITH ALL THE SETS
+# the queries are stacked as a sparse matrix (elements x queries), a single product gives the common elements counts (sets x queries)
+def overlaps(sets, queries):
+    index = sets['index']
+    cols = [ sorted(index[e] for e in query if e in index) for query in queries ]
+    ptr = np.zeros(len(queries) + 1, dtype=np.int64)
+    np.cumsum([ len(col) for col in cols ], out=ptr[1:])
+    indices = np.fromiter(( i for col in cols for i in col ), dtype=np.int64, count=ptr[-1])
+    batch = csc_matrix((np.ones(len(indices), dtype=np.int32), indices, ptr), shape=(len(sets['elements']), len(queries)))
+    return (sets['incidence'] @ batch).toarray()
 
-    # EVALUATE SETS
-    results = []
-    q = len(query)
-    g = population_size
-    for id in sets:
-        elements = sets[ id ][ 'elements' ]
-        t = len(elements)
-        common_elements = elements.intersection( query )
-        c = len(common_elements)
-        if param.measure=='binomial': # binom.cdf(>=success, attempts, proba)
-            # p_success = 384/2064, 152 attempts, 61 success
-            #~ pval = binom.pmf(61, 152, 384.0/2064)
-            pval = binom.cdf( q - c, q, 1 - float(t)/g)
-        elif param.measure=='hypergeometric': # hypergeom.sf(common-1, population, target, query) = 1-p( X <= x-1 ) = p( X >= x )
-            pval = hypergeom.sf(c-1, g, t, q)
-        elif param.measure=='chi2': #chi2_contingency
-            chi2, pval, a, e = chi2_contingency(np.array([[c,q-c,q],[t-c,g-q-t+c,g-q],[t,g-t,g]]))
-        elif param.measure=='coverage': #Coverage
-            if c == 0:
-                pval = 1
-            elif c==q and c==t:
-                pval = 0
-            else:
-                pval = 1 - ((c / q) * (c / t))
-        else:
-            print('sorry,-m  %s not (yet) implemented' % ( param.measure ))
-            exit(1)
-        r = ComparedSet( id, sets[id]['name'], c, t, pval, elements, common_elements)
-        results.append( r )
+(sets, population_size, listgene) = load_sets(param.sets, param.sidecar)
+ids = sets['ids']
+t = sets['sizes']
+g = population_size
+indptr = sets['incidence'].indptr
+queries = [ load_query(param.query, listgene) for j in range(param.round) ]
+for b in range(0, len(queries), BATCH):
+    batch = queries[b:b+BATCH]
+    # EVALUATE SETS (sets x queries)
+    common = overlaps(sets, batch)
+    pvals = enrichment(param.measure, common.astype(np.int64), t[:, None], np.array([ len(query) for query in batch ], dtype=np.int64), g)
+    for j, query in enumerate(batch):
+        c = common[:, j]
+        pval = pvals[:, j]
 
-    # PRINT SIGNIFICANT RESULTS
-    results.sort(key=lambda an_item: an_item.pvalue)
-    i=1
-    for r in results:
-        # FDR
-        if param.adjust and r.pvalue > param.alpha * i / len(results): break
-        # limited output
-        if param.limit > 0 and i>param.limit: break
-        # alpha threshold
-        elif r.pvalue > param.alpha : break
-        # OUTPUT
-        print("%s\t%s\t%s/%s\t%s\t%s" % ( r.id, r.pvalue, r.common, r.size, r.name, ', '.join(r.c)))
-        i+=1
-    j += 1
+        # PRINT SIGNIFICANT RESULTS
+        order = np.argsort(pval, kind='stable')
+        p = pval[order]
+        rank = np.arange(1, len(p) + 1)
+        stop = p > param.alpha # alpha threshold
+        if param.adjust: stop |= p > param.alpha * rank / len(p) # FDR
+        if param.limit > 0: stop |= rank > param.limit # limited output
+        n = int(np.argmax(stop)) if stop.any() else len(p)
+        for k in order[:n].tolist():
+            pvalue = pval[k]
+            if param.measure == 'coverage' and pvalue in (0, 1): pvalue = int(pvalue) # exact cases
+            elements = [ sets['elements'][i] for i in sets['incidence'].indices[indptr[k]:indptr[k+1]].tolist() ]
+            # OUTPUT
+            print("%s\t%s\t%s/%s\t%s\t%s" % ( ids[k], pvalue, c[k], t[k], sets['names'][k], ', '.join([ e for e in elements if e in query ])))